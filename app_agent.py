@@ -1,13 +1,14 @@
-from typing import List, cast
+from typing import Any, List, Optional, cast
 
 import chainlit as cl
-import yaml
 from autogen_agentchat.agents import AssistantAgent
 from autogen_agentchat.base import Response
 from autogen_agentchat.messages import ModelClientStreamingChunkEvent, TextMessage
 from autogen_core import CancellationToken
 from autogen_core.models import ChatCompletionClient
 
+from model_clients import close_model_clients, get_model_client, read_model_config
+
 
 @cl.set_starters  # type: ignore
 async def set_starts() -> List[cl.Starter]:
@@ -28,23 +29,33 @@ async def get_weather(city: str) -> str:
     return f"The weather in {city} is 73 degrees and Sunny."
 
 
-@cl.on_chat_start  # type: ignore
-async def start_chat() -> None:
-    # Load model configuration and create the model client.
-    with open("model_config.yaml", "r") as f:
-        model_config = yaml.safe_load(f)
-    model_client = ChatCompletionClient.load_component(model_config)
-
-    # Create the assistant agent with the get_weather tool.
-    assistant = AssistantAgent(
+def create_assistant(model_client: ChatCompletionClient, tools: Optional[List[Any]] = None) -> AssistantAgent:
+    """Create the assistant agent, with the get_weather tool unless other tools are given."""
+    return AssistantAgent(
         name="assistant",
-        tools=[get_weather],
+        tools=tools if tools is not None else [get_weather],
         model_client=model_client,
         system_message="You are a helpful assistant",
         model_client_stream=True,  # Enable model client streaming.
         reflect_on_tool_use=True,  # Reflect on tool use.
     )
 
+
+@cl.on_app_shutdown  # type: ignore
+async def shutdown() -> None:
+    # Close the shared model clients and their connection pools.
+    await close_model_clients()
+
+
+@cl.on_chat_start  # type: ignore
+async def start_chat() -> None:
+    # Load model configuration and get the process-wide shared model client.
+    model_config = read_model_config("model_config.yaml")
+    model_client = get_model_client(model_config)
+
+    # Create the assistant agent with the get_weather tool.
+    assistant = create_assistant(model_client)
+
     # Set the assistant agent in the user session.
     cl.user_session.set("prompt_history", "")  # type: ignore
     cl.user_session.set("agent", assistant)  # type: ignore
@@ -3,404 +3,384 @@
 包含多个专业智能体，协作为企业提供全面的出海方案
 """
 
-from typing import List, cast, Dict, Any, Optional
+from dataclasses import dataclass
+from typing import List, cast, Dict, Any, Optional, Tuple
 import asyncio
-import json
 import os
+import uuid
 from datetime import datetime
 
 import chainlit as cl
-import yaml
+from chainlit.data import get_data_layer
 from autogen_agentchat.agents import AssistantAgent
 from autogen_agentchat.teams import SelectorGroupChat
-from autogen_agentchat.conditions import TextMentionTermination
-from autogen_agentchat.messages import TextMessage
+from autogen_agentchat.conditions import MaxMessageTermination, TextMentionTermination
+from autogen_agentchat.base import ChatAgent, Response
+from autogen_agentchat.messages import (
+    MessageFactory,
+    BaseChatMessage,
+    ModelClientStreamingChunkEvent,
+    SelectSpeakerEvent,
+    TextMessage,
+)
+from autogen_core import CancellationToken
+from autogen_core.model_context import BufferedChatCompletionContext
 from autogen_core.models import ChatCompletionClient
 
-# PDF生成相关导入
-try:
-    from reportlab.lib.pagesizes import letter, A4
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak, Table, TableStyle
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    from reportlab.lib import colors
-    from reportlab.pdfbase import pdfmetrics
-    PDF_AVAILABLE = True
-except ImportError:
-    PDF_AVAILABLE = False
-    print("警告：reportlab未安装，PDF生成功能将不可用。请运行：pip install reportlab")
+from book_retrieval import BookIndex, BookMemory, get_book_index, methodology_query
+from model_clients import close_model_clients, get_model_client, get_routed_model_client, named_model_config, read_model_config
+from prompt_registry import PROMPTS
+from swarm_context import create_expert_context, summarize_text
+from swarm_metrics import DEFAULT_MAX_TRACE_FILES, METRICS, ConsultationTracer, start_metrics_server
+from swarm_scheduler import EXPERT_DEPENDENCIES, run_dependency_graph
+from pdf_report import DOCUMENT_TEMPLATES
+from pdf_service import IncrementalReport, PdfJob, close_pdf_service, get_pdf_service
+from llm_cache import config_namespace
+from llm_rate_limit import is_rate_limit_error
+from swarm_admission import get_consultation_admission
+from swarm_analysis import ExpertAnalysis
+from swarm_budget import BUDGET_REASON_LABELS, BudgetTermination, ConsultationBudget
+from swarm_cache import (
+    DEFAULT_CONSULTATION_CACHE_PATH,
+    CachedConsultation,
+    ConsultationCache,
+    cache_namespace,
+    close_consultation_caches,
+    get_consultation_cache,
+)
+from swarm_checkpoint import DEFAULT_CHECKPOINT_DIR, DEFAULT_MAX_CHECKPOINT_FILES, CheckpointStore
+from swarm_evaluation import EVALUATION_FORMAT_INSTRUCTIONS, parse_evaluation, parse_overall_score
+from swarm_followup import FollowupPlan, extend_intent, plan_followup
+from swarm_intent import IntentDecision, classify_intent, classify_intent_with_model, restrict_dependencies
+from swarm_selector import EVALUATOR_NAME, EXPERT_ORDER, FINAL_SPEAKER_NAME, RuleBasedSelector
+from swarm_speculation import SpeculativeExpert, Speculator
+
+
+# 智能体名称到界面显示名称的映射
+AGENT_DISPLAY_NAMES = {
+    "enterprise_knowledge_expert": "🏢 企业知识专家",
+    "market_analysis_expert": "📈 市场分析专家",
+    "strategic_planning_expert": "🎯 战略规划专家",
+    "operations_planning_expert": "⚙️ 运营规划专家",
+    "marketing_promotion_expert": "📢 营销推广专家",
+    "legal_compliance_expert": "⚖️ 法律合规专家",
+    "financial_planning_expert": "💰 财务规划专家",
+    "implementation_planning_expert": "📋 实施计划专家",
+    "solution_expert": "🎯 方案专家",
+    "senior_advisory_expert": "🎓 资深顾问专家",
+}
+
+
+# 咨询任务工作流程中各领域专家的步骤（注册键 -> (专家名称, 职责)），按发言顺序排列
+WORKFLOW_STEPS = {
+    "enterprise_knowledge": ("企业知识专家", "了解企业基本情况和出海需求"),
+    "market_analysis": ("市场分析专家", "分析目标市场机会和风险"),
+    "strategic_planning": ("战略规划专家", "制定出海战略和进入策略"),
+    "operations_planning": ("运营规划专家", "设计运营体系和组织架构"),
+    "marketing_promotion": ("营销推广专家", "制定品牌推广和营销策略"),
+    "legal_compliance": ("法律合规专家", "提供法律合规保障方案"),
+    "financial_planning": ("财务规划专家", "制定财务规划和风险管控"),
+    "implementation_planning": ("实施计划专家", "整合为可执行的实施计划"),
+}
+
+
+@dataclass(frozen=True)
+class AgentInfo:
+    """智能体元数据：注册键、智能体名称（即消息来源）和界面显示名称"""
+
+    key: str
+    name: str
+    display_name: str
+
+
+# 顾问团队所需的提示词文件，导入时校验
+PROMPTS.require([
+    "enterprise_knowledge_expert.txt",
+    "market_analysis_expert.txt",
+    "strategic_planning_expert.txt",
+    "operations_planning_expert.txt",
+    "marketing_promotion_expert.txt",
+    "legal_compliance_expert.txt",
+    "financial_planning_expert.txt",
+    "implementation_planning_expert.txt",
+    "solution_expert.txt",
+    "senior_advisory_expert.txt",
+])
 
 
 def load_prompt_from_file(filename: str) -> str:
-    """从prompts目录加载prompt文件"""
-    prompt_path = os.path.join("prompts", filename)
-    try:
-        with open(prompt_path, "r", encoding="utf-8") as f:
-            return f.read().strip()
-    except FileNotFoundError:
-        print(f"警告：未找到prompt文件 {prompt_path}")
+    """从提示词注册表获取prompt（导入时已预加载，不在事件循环中读取文件）"""
+    prompt = PROMPTS.get(filename)
+    if prompt is None:
+        print(f"警告：未找到prompt文件 {filename}")
         return ""
+    return prompt
 
 
-def format_document_content(user_message: str, expert_analysis: Dict[str, str]) -> Dict[str, str]:
-    """
-    对专家分析内容进行格式规整，形成标准建议书格式
-    
-    Args:
-        user_message: 用户原始需求
-        expert_analysis: 各专家分析结果字典
-    
-    Returns:
-        Dict[str, str]: 格式化后的文档内容
-    """
-    formatted_content = {}
-    
-    # 文档结构定义
-    document_structure = {
-        "executive_summary": "执行摘要",
-        "enterprise_analysis": "企业现状分析",
-        "market_analysis": "目标市场分析", 
-        "strategic_planning": "出海战略规划",
-        "operations_planning": "运营实施方案",
-        "marketing_strategy": "营销推广策略",
-        "legal_compliance": "法律合规要求",
-        "financial_planning": "财务规划方案",
-        "implementation_timeline": "实施时间表",
-        "risk_assessment": "风险评估与应对",
-        "conclusion": "结论与建议"
-    }
-    
-    # 专家映射
-    expert_mapping = {
-        "enterprise_knowledge_expert": "enterprise_analysis",
-        "market_analysis_expert": "market_analysis",
-        "strategic_planning_expert": "strategic_planning",
-        "operations_planning_expert": "operations_planning",
-        "marketing_promotion_expert": "marketing_strategy",
-        "legal_compliance_expert": "legal_compliance",
-        "financial_planning_expert": "financial_planning",
-        "implementation_planning_expert": "implementation_timeline",
-        "solution_expert": "risk_assessment",
-        "senior_advisory_expert": "conclusion"
-    }
-    
-    # 处理各专家内容
-    for expert_key, content in expert_analysis.items():
-        if expert_key in expert_mapping:
-            section_key = expert_mapping[expert_key]
-            
-            # 清理内容，移除智能体标识
-            cleaned_content = content
-            for prefix in ["【企业知识专家】", "【市场分析专家】", "【战略规划专家】", 
-                          "【运营规划专家】", "【营销推广专家】", "【法律合规专家】", 
-                          "【财务规划专家】", "【实施计划专家】", "【方案专家】", "【资深顾问专家】"]:
-                cleaned_content = cleaned_content.replace(prefix, "").strip()
-            
-            # 格式化内容
-            formatted_content[section_key] = cleaned_content
-    
-    # 生成执行摘要
-    executive_summary = f"""
-# 企业出海方案执行摘要
-
-## 项目背景
-{user_message}
-
-## 方案概述
-本方案基于多领域专家的专业分析，为企业提供全面的海外市场拓展指导。方案涵盖了从市场分析到实施落地的各个环节，确保企业能够系统性地推进海外业务发展。
-
-## 核心建议
-- 市场进入策略：根据目标市场特点制定差异化进入策略
-- 运营体系设计：建立适合海外市场的运营模式和组织架构
-- 风险管控机制：建立完善的法律合规和财务风险管控体系
-- 实施路径规划：制定分阶段、可操作的实施计划
-
-## 预期成果
-通过本方案的实施，企业将获得：
-1. 清晰的市场定位和竞争优势
-2. 完善的海外运营体系
-3. 有效的风险管控机制
-4. 可执行的实施路径
-"""
-    
-    formatted_content["executive_summary"] = executive_summary
-    
-    # 添加风险评估与应对（如果方案专家没有提供）
-    if "risk_assessment" not in formatted_content:
-        formatted_content["risk_assessment"] = """
-# 风险评估与应对
-
-## 主要风险识别
-1. **市场风险**：目标市场环境变化、竞争加剧
-2. **运营风险**：海外运营成本超预期、人才短缺
-3. **法律风险**：合规要求变化、知识产权保护
-4. **财务风险**：汇率波动、资金流动性风险
-
-## 风险应对策略
-1. **建立风险监控机制**：定期评估市场环境和运营状况
-2. **制定应急预案**：针对各类风险制定详细的应对预案
-3. **加强合规管理**：建立专业的法律合规团队
-4. **优化财务结构**：采用多元化的融资和风险对冲策略
-"""
-    
-    # 添加结论与建议（如果资深顾问专家没有提供）
-    if "conclusion" not in formatted_content:
-        formatted_content["conclusion"] = """
-# 结论与建议
-
-## 方案总结
-本出海方案基于多领域专家的专业分析，为企业提供了全面的海外拓展指导。方案涵盖了从市场分析到实施落地的各个环节，确保企业能够系统性地推进海外业务发展。
-
-## 实施建议
-1. **分阶段实施**：按照方案中的时间表，分阶段推进各项措施
-2. **持续优化**：根据实施过程中的反馈，持续优化方案内容
-3. **资源保障**：确保人力、财力等资源的充分投入
-4. **风险管控**：建立完善的风险监控和应对机制
-
-## 后续支持
-建议企业建立专门的海外业务团队，负责方案的实施和后续优化工作。同时，可以考虑寻求专业咨询机构的持续支持。
-"""
-    
-    return formatted_content
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
-def generate_overseas_plan_pdf(user_message: str, expert_analysis: Dict[str, str]) -> str:
-    """
-    生成出海方案PDF文档
-    
-    Args:
-        user_message: 用户原始需求
-        expert_analysis: 各专家分析结果字典
-    
-    Returns:
-        str: PDF文件路径
-    """
-    if not PDF_AVAILABLE:
-        raise ImportError("reportlab未安装，无法生成PDF")
-    
-    # 首先进行文档格式规整
-    formatted_content = format_document_content(user_message, expert_analysis)
-    
-    # 创建输出目录
-    output_dir = "outputs"
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    
-    # 生成文件名
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"overseas_plan_{timestamp}.pdf"
-    filepath = os.path.join(output_dir, filename)
-    
-    # 创建PDF文档
-    doc = SimpleDocTemplate(filepath, pagesize=A4)
-    story = []
-    
-    # 注册中文字体
-    try:
-        from reportlab.pdfbase.ttfonts import TTFont
-        from reportlab.pdfbase.cidfonts import UnicodeCIDFont
-        
-        # 注册Unicode中文字体
-        pdfmetrics.registerFont(UnicodeCIDFont('STSong-Light'))
-        chinese_font = 'STSong-Light'
-    except:
-        try:
-            # 备用方案：使用系统字体
-            if os.path.exists('/System/Library/Fonts/PingFang.ttc'):  # macOS
-                pdfmetrics.registerFont(TTFont('PingFang', '/System/Library/Fonts/PingFang.ttc'))
-                chinese_font = 'PingFang'
-            elif os.path.exists('/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'):  # Linux
-                pdfmetrics.registerFont(TTFont('DejaVu', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'))
-                chinese_font = 'DejaVu'
-            elif os.path.exists('C:/Windows/Fonts/simsun.ttc'):  # Windows
-                pdfmetrics.registerFont(TTFont('SimSun', 'C:/Windows/Fonts/simsun.ttc'))
-                chinese_font = 'SimSun'
-            else:
-                chinese_font = 'Helvetica'  # 默认字体
-        except:
-            chinese_font = 'Helvetica'  # 默认字体
-    
-    # 获取样式
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        spaceAfter=30,
-        alignment=1,  # 居中
-        textColor=colors.darkblue,
-        fontName=chinese_font
-    )
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=14,
-        spaceAfter=12,
-        spaceBefore=20,
-        textColor=colors.darkblue,
-        fontName=chinese_font
-    )
-    normal_style = ParagraphStyle(
-        'CustomNormal',
-        parent=styles['Normal'],
-        fontName=chinese_font,
-        fontSize=10,
-        leading=14
+def create_checkpoint_store(swarm_config: Dict[str, Any]) -> Optional[CheckpointStore]:
+    """按 swarm.checkpoint 配置创建检查点存储，关闭检查点时返回 None"""
+    checkpoint_config = swarm_config.get("checkpoint") or {}
+    if not checkpoint_config.get("enabled", True):
+        return None
+    return CheckpointStore(
+        os.path.join(BASE_DIR, checkpoint_config.get("dir", DEFAULT_CHECKPOINT_DIR)),
+        max_age_hours=checkpoint_config.get("max_age_hours", 72),
+        max_files=checkpoint_config.get("max_files", DEFAULT_MAX_CHECKPOINT_FILES),
     )
-    
-    # 添加标题
-    story.append(Paragraph("企业出海方案建议书", title_style))
-    story.append(Spacer(1, 20))
-    
-    # 添加生成时间
-    story.append(Paragraph(f"生成时间：{datetime.now().strftime('%Y年%m月%d日 %H:%M:%S')}", normal_style))
-    story.append(Spacer(1, 20))
-    
-    # 按标准格式添加各章节内容
-    document_structure = [
-        ("executive_summary", "执行摘要"),
-        ("enterprise_analysis", "企业现状分析"),
-        ("market_analysis", "目标市场分析"),
-        ("strategic_planning", "出海战略规划"),
-        ("operations_planning", "运营实施方案"),
-        ("marketing_strategy", "营销推广策略"),
-        ("legal_compliance", "法律合规要求"),
-        ("financial_planning", "财务规划方案"),
-        ("implementation_timeline", "实施时间表"),
-        ("risk_assessment", "风险评估与应对"),
-        ("conclusion", "结论与建议")
-    ]
-    
-    for section_key, section_title in document_structure:
-        if section_key in formatted_content:
-            story.append(Paragraph(section_title, heading_style))
-            
-            content = formatted_content[section_key]
-            
-            # 处理长文本，避免PDF生成问题
-            if len(content) > 2000:
-                # 分段处理长文本
-                paragraphs = content.split('\n\n')
-                for para in paragraphs:
-                    if para.strip():
-                        story.append(Paragraph(para.strip(), normal_style))
-                        story.append(Spacer(1, 5))
-            else:
-                story.append(Paragraph(content, normal_style))
-            
-            story.append(Spacer(1, 15))
-    
-    # 生成PDF
-    doc.build(story)
-    
-    return filepath
 
 
 class OverseasAdvisorySwarm:
     """出海顾问团队智能体群组"""
     
-    def __init__(self, model_config: Dict[str, Any]):
-        """初始化顾问团队"""
+    def __init__(
+        self,
+        model_config: Dict[str, Any],
+        execution_mode: Optional[str] = None,
+        checkpoint_key: Optional[str] = None,
+    ):
+        """
+        初始化顾问团队
+
+        Args:
+            model_config: 模型配置，可包含可选的 swarm 配置段
+            execution_mode: 执行模式，"selector" 为选择器团队顺序协作，
+                "parallel" 为按依赖图并发执行各领域专家；默认读取 swarm.execution_mode
+            checkpoint_key: 检查点键（通常为会话的 thread id），提供时每轮发言后保存检查点
+        """
         self.model_config = model_config
+        swarm_config = model_config.get("swarm") or {}
+        self.execution_mode = execution_mode or swarm_config.get("execution_mode", "selector")
+        if self.execution_mode not in ("selector", "parallel"):
+            raise ValueError(f"不支持的执行模式：{self.execution_mode}")
+        self.max_parallel_experts: Optional[int] = swarm_config.get("max_parallel_experts")
+        # 发言者选择模式："rule" 使用规则选择器（无法判断时回退大模型），"llm" 每轮由大模型选择
+        self.selector_mode = swarm_config.get("selector_mode", "rule")
+        if self.selector_mode not in ("rule", "llm"):
+            raise ValueError(f"不支持的选择器模式：{self.selector_mode}")
+        # 推测执行：方案专家评估的同时提前运行下一位专家（需要规则选择器按固定顺序确定下一位专家）
+        speculation_config = swarm_config.get("speculation") or {}
+        self.speculation_enabled = (
+            speculation_config.get("enabled", False) and self.execution_mode == "selector" and self.selector_mode == "rule"
+        )
+        self.speculator: Optional[Speculator] = None
+        # 书籍检索：为每位专家注入最相关的 top-k 书籍片段
+        self.book_retrieval = swarm_config.get("book_retrieval", True)
+        self.book_top_k = swarm_config.get("book_top_k", 3)
+        self.book_index = self._load_book_index()
+        # 上下文管理：限制每位专家和选择器每轮看到的对话记录
+        self.context_config: Optional[Dict[str, Any]] = swarm_config.get("context")
+        # 性能埋点：每次咨询写出 JSONL 追踪文件，配置端口时提供 Prometheus /metrics 端点
+        metrics_config = swarm_config.get("metrics") or {}
+        # 追踪文件需显式配置 trace_dir 才写出，相对路径以项目目录为基准
+        trace_dir = metrics_config.get("trace_dir")
+        self.trace_dir: Optional[str] = os.path.join(BASE_DIR, trace_dir) if trace_dir else None
+        self.max_trace_files: Optional[int] = metrics_config.get("max_trace_files", DEFAULT_MAX_TRACE_FILES)
+        if metrics_config.get("port"):
+            start_metrics_server(metrics_config["port"], metrics_config.get("host", "127.0.0.1"))
+        # PDF渲染：在进程池中执行，不阻塞事件循环
+        self.pdf_service = get_pdf_service(swarm_config.get("pdf"))
+        self.rule_selector: Optional[RuleBasedSelector] = None
+        self.last_trace: Optional[ConsultationTracer] = None
+        self.last_pdf_job: Optional[PdfJob] = None
+        # 本次咨询的增量建议书（各章节在专家输出通过评估后预渲染）
+        self.report: Optional[IncrementalReport] = None
+        # 本次咨询各专家的输出和评估
+        self.analysis = ExpertAnalysis()
+        # 检查点：每轮发言后保存团队状态、分析结果和对话记录，断线或重启后可继续咨询
+        self.checkpoint_key = checkpoint_key
+        self.checkpoint_store = create_checkpoint_store(swarm_config)
+        self.consultation_message = ""
+        self.transcript: List[Dict[str, str]] = []
+        # 会话级取消：用户停止、发送新消息或离开会话时取消进行中的模型调用和PDF任务
+        self.cancel_reason: Optional[str] = None
+        self._cancellation_token: Optional[CancellationToken] = None
+        self._consultation_task: Optional[asyncio.Task] = None
+        # 准入控制：进程内所有会话共享的咨询队列
+        self.admission = get_consultation_admission(swarm_config.get("admission"))
+        # 多模型路由：发言者选择、评估、各专家和最终综合可使用 models 段中的不同客户端和调用参数
+        self.routing: Dict[str, Any] = swarm_config.get("routing") or {}
+        # 需求意图识别：单项咨询只运行相关专家子图并使用对应的建议书模板
+        self.intent_config: Dict[str, Any] = swarm_config.get("intent") or {}
+        self.intent = IntentDecision()
+        # 追问调整：咨询完成后的追问只重新运行受影响的专家及其下游专家，其余专家和已渲染的章节沿用上一次的结果
+        self.followup_enabled = (swarm_config.get("followup") or {}).get("enabled", True)
+        self.followup_ready = False  # 上一次咨询已完成，可在其结果上追问调整
+        self.followup: Optional[Dict[str, Any]] = None  # 进行中的追问：调整要求、需重新运行的专家和开始时的发言序号
+        # 咨询缓存：相同或相似需求直接回放已有的咨询结果（跨会话共享）
+        self.consultation_cache = self._create_consultation_cache(model_config, swarm_config.get("consultation_cache"))
         self.model_client = self._create_model_client(model_config)
         self.agents: Dict[str, AssistantAgent] = {}
+        self._expert_specs: Dict[str, Tuple[str, str]] = {}  # 智能体名称 -> (注册键, 提示词文件)，用于创建影子智能体
+        self.agent_index: Dict[str, AgentInfo] = {}  # 智能体名称（消息来源） -> 元数据
         self.team: Optional[SelectorGroupChat] = None
         self.agent_call_count: Dict[str, int] = {}  # 跟踪每个智能体的调用次数
-        self.max_calls_per_agent = 3  # 每个智能体最多调用3次
+        # 预算：每个智能体的调用次数、总 token 数和墙钟时间上限
+        self.budget_config: Dict[str, Any] = swarm_config.get("budget") or {}
+        self.max_calls_per_agent = self.budget_config.get("max_calls_per_agent", 3)  # 每个智能体默认最多调用3次
+        self.budget: Optional[ConsultationBudget] = None
         self._setup_agents()
         self._setup_team()
     
+    def _create_consultation_cache(
+        self, model_config: Dict[str, Any], cache_config: Optional[Dict[str, Any]]
+    ) -> Optional[ConsultationCache]:
+        """按 swarm.consultation_cache 配置获取进程内共享的咨询缓存，未配置或 enabled 为 false 时返回 None"""
+        if not cache_config or not cache_config.get("enabled", False):
+            return None
+        max_age_hours = cache_config.get("max_age_hours", 168)
+        return get_consultation_cache(
+            path=os.path.join(BASE_DIR, cache_config.get("path", DEFAULT_CONSULTATION_CACHE_PATH)),
+            # 模型、路由、意图识别、执行模式、发言者选择模式或提示词变化后旧的咨询结果不再命中
+            namespace=cache_namespace(
+                model_config,
+                self.execution_mode,
+                self.selector_mode,
+                dict(PROMPTS.snapshot()),
+                self.routing,
+                self.intent_config,
+                {
+                    name: config_namespace(named_model_config(model_config, name))
+                    for name in model_config.get("models") or {}
+                },
+            ),
+            threshold=cache_config.get("similarity_threshold", 1.0),
+            max_entries=cache_config.get("max_entries", 1000),
+            max_age_seconds=max_age_hours * 3600 if max_age_hours is not None else None,
+        )
+
     def _create_model_client(self, model_config: Dict[str, Any]) -> ChatCompletionClient:
-        """创建模型客户端"""
-        return ChatCompletionClient.load_component(model_config)
+        """获取进程内共享的模型客户端（所有会话和智能体复用同一连接池）"""
+        return get_model_client(model_config)
+
+    def _route(self, role: str, agent_key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        角色的路由项：selector、evaluator、final、router 直接读取对应配置；
+        其他专家先读取 experts 的公共配置，再用以智能体键（如 market_analysis）配置的项覆盖
+        """
+        route = dict(self.routing.get(role) or {})
+        if agent_key is not None:
+            route.update(self.routing.get(agent_key) or {})
+        return route
+
+    def _role_client(self, role: str, agent_key: Optional[str] = None) -> ChatCompletionClient:
+        """按路由获取角色使用的模型客户端，未配置路由时使用默认客户端"""
+        route = self._route(role, agent_key)
+        if not route:
+            return self.model_client
+        return get_routed_model_client(self.model_config, route)
+
+    def _load_book_index(self) -> Optional[BookIndex]:
+        """加载书籍检索索引，书籍缺失或未启用时返回 None"""
+        if not self.book_retrieval:
+            return None
+        try:
+            return get_book_index()
+        except FileNotFoundError:
+            print("警告：未找到book.md，专家将不注入书籍原文摘录")
+            return None
+
+    def _create_expert(self, agent_key: str, name: str, prompt_file: str) -> AssistantAgent:
+        """创建专业智能体，启用流式输出，并按需挂载书籍检索记忆和有界上下文"""
+        self._expert_specs[name] = (agent_key, prompt_file)
+        system_message = load_prompt_from_file(prompt_file)
+        # 方案专家在评估末尾输出结构化评分，由编排逻辑决定是否重新输出
+        if name == EVALUATOR_NAME:
+            system_message += "\n" + EVALUATION_FORMAT_INSTRUCTIONS
+        # 依赖的上游专家总是先于本专家创建
+        dependencies = [self.agents[dep].name for dep in EXPERT_DEPENDENCIES.get(agent_key, [])]
+        model_context = create_expert_context(name, dependencies, self.context_config)
+        memory = None
+        # 方案专家只负责评估，不注入书籍原文
+        if self.book_index is not None and name != "solution_expert":
+            memory = [
+                BookMemory(self.book_index, focus=methodology_query(system_message), top_k=self.book_top_k)
+            ]
+        if name == EVALUATOR_NAME:
+            model_client = self._role_client("evaluator")
+        elif name == FINAL_SPEAKER_NAME:
+            model_client = self._role_client("final")
+        else:
+            model_client = self._role_client("experts", agent_key)
+        return AssistantAgent(
+            name=name,
+            model_client=model_client,
+            system_message=system_message,
+            model_client_stream=True,  # 启用模型流式输出
+            memory=memory,
+            model_context=model_context,
+        )
 
     def _setup_agents(self):
         """设置各个专业智能体"""
         
         # 企业知识智能体
-        self.agents['enterprise_knowledge'] = AssistantAgent(
-            name="enterprise_knowledge_expert",
-            model_client=self.model_client,
-            system_message=load_prompt_from_file("enterprise_knowledge_expert.txt"),
-        )
+        self.agents['enterprise_knowledge'] = self._create_expert('enterprise_knowledge', "enterprise_knowledge_expert", "enterprise_knowledge_expert.txt")
         
         # 市场分析智能体
-        self.agents['market_analysis'] = AssistantAgent(
-            name="market_analysis_expert",
-            model_client=self.model_client,
-            system_message=load_prompt_from_file("market_analysis_expert.txt"),
-        )
+        self.agents['market_analysis'] = self._create_expert('market_analysis', "market_analysis_expert", "market_analysis_expert.txt")
         
         # 战略规划智能体
-        self.agents['strategic_planning'] = AssistantAgent(
-            name="strategic_planning_expert",
-            model_client=self.model_client,
-            system_message=load_prompt_from_file("strategic_planning_expert.txt"),
-        )
+        self.agents['strategic_planning'] = self._create_expert('strategic_planning', "strategic_planning_expert", "strategic_planning_expert.txt")
         
         # 运营规划智能体
-        self.agents['operations_planning'] = AssistantAgent(
-            name="operations_planning_expert",
-            model_client=self.model_client,
-            system_message=load_prompt_from_file("operations_planning_expert.txt"),
-        )
+        self.agents['operations_planning'] = self._create_expert('operations_planning', "operations_planning_expert", "operations_planning_expert.txt")
         
         # 营销推广智能体
-        self.agents['marketing_promotion'] = AssistantAgent(
-            name="marketing_promotion_expert",
-            model_client=self.model_client,
-            system_message=load_prompt_from_file("marketing_promotion_expert.txt"),
-        )
+        self.agents['marketing_promotion'] = self._create_expert('marketing_promotion', "marketing_promotion_expert", "marketing_promotion_expert.txt")
         
         # 法律合规智能体
-        self.agents['legal_compliance'] = AssistantAgent(
-            name="legal_compliance_expert",
-            model_client=self.model_client,
-            system_message=load_prompt_from_file("legal_compliance_expert.txt"),
-        )
+        self.agents['legal_compliance'] = self._create_expert('legal_compliance', "legal_compliance_expert", "legal_compliance_expert.txt")
         
         # 财务规划智能体
-        self.agents['financial_planning'] = AssistantAgent(
-            name="financial_planning_expert",
-            model_client=self.model_client,
-            system_message=load_prompt_from_file("financial_planning_expert.txt"),
-        )
+        self.agents['financial_planning'] = self._create_expert('financial_planning', "financial_planning_expert", "financial_planning_expert.txt")
         
         # 实施计划智能体
-        self.agents['implementation_planning'] = AssistantAgent(
-            name="implementation_planning_expert",
-            model_client=self.model_client,
-            system_message=load_prompt_from_file("implementation_planning_expert.txt"),
-        )
+        self.agents['implementation_planning'] = self._create_expert('implementation_planning', "implementation_planning_expert", "implementation_planning_expert.txt")
         
         # 方案专家智能体（选择器和评估者）
-        self.agents['solution_expert'] = AssistantAgent(
-            name="solution_expert",
-            model_client=self.model_client,
-            system_message=load_prompt_from_file("solution_expert.txt"),
-        )
+        self.agents['solution_expert'] = self._create_expert('solution_expert', "solution_expert", "solution_expert.txt")
         
         # 资深顾问智能体（最终协调者）
-        self.agents['senior_advisor'] = AssistantAgent(
-            name="senior_advisory_expert",
-            model_client=self.model_client,
-            system_message=load_prompt_from_file("senior_advisory_expert.txt"),
-        )
+        self.agents['senior_advisor'] = self._create_expert('senior_advisor', "senior_advisory_expert", "senior_advisory_expert.txt")
         
         # 初始化调用次数计数器
         for agent_name in self.agents.keys():
             self.agent_call_count[agent_name] = 0
+        
+        # 按消息来源归属发言者，无需扫描消息内容中的身份标识
+        self.agent_index = {
+            agent.name: AgentInfo(key, agent.name, AGENT_DISPLAY_NAMES.get(agent.name, agent.name))
+            for key, agent in self.agents.items()
+        }
     
     def _setup_team(self):
         """设置团队协作"""
-        # 获取所有智能体
-        participants = list(self.agents.values())
+        # 获取所有智能体（开启推测执行时领域专家由包装器代为发言）
+        participants: List[ChatAgent] = list(self.agents.values())
+        if self.speculation_enabled:
+            experts = {agent.name: agent for agent in participants if agent.name in EXPERT_ORDER}
+            self.speculator = Speculator(experts, self._create_shadow, self._on_speculation)
+            participants = [
+                SpeculativeExpert(agent, self.speculator, [EVALUATOR_NAME]) if agent.name in experts else agent
+                for agent in participants
+            ]
         
-        # 设置终止条件 - 只有当资深顾问专家确认所有专家都达到满意水平时才结束
-        termination_condition = TextMentionTermination("出海方案完成")
+        # 设置终止条件 - 资深顾问专家确认所有专家都达到满意水平时结束；
+        # 预算耗尽、预算不足转入最终整合后资深顾问完成整合，或消息数达到各智能体调用上限之和时也结束
+        self.budget = ConsultationBudget.from_config([agent.name for agent in participants], self.budget_config)
+        termination_condition = (
+            TextMentionTermination("出海方案完成")
+            | BudgetTermination(self.budget)
+            | MaxMessageTermination(self.budget.max_messages)
+        )
         
         # 创建选择器团队 - 使用更详细的选择器提示词
-        selector_prompt = """
+        max_calls = self.max_calls_per_agent
+        max_evaluations = self.budget.max_evaluator_calls
+        selector_prompt = f"""
 你是方案专家，负责协调出海顾问团队的咨询流程。
 
 **你的核心职责：**
@@ -430,7 +410,8 @@ class OverseasAdvisorySwarm:
 - 评估要具体、客观、有建设性
 - 如果专家输出质量不高，不要急于选择下一个专家，而是要求重新输出
 - 确保最终方案的质量和完整性
-- **每个专家最多只能被调用3次，超过限制后请选择其他专家或进行最终整合**
+- **每个专家最多只能被调用{max_calls}次，超过限制后请选择其他专家或进行最终整合**
+- **你最多进行{max_evaluations}次评估，用完后请选择资深顾问专家进行最终整合**
 
 **评估格式示例：**
 【方案专家】
@@ -445,8 +426,8 @@ class OverseasAdvisorySwarm:
 优点：[具体优点]
 不足：[具体不足]
 
-[如果评分低于7分且该专家调用次数少于3次：请[专家名称]重新思考并补充完善，重点关注[具体不足点]]
-[如果评分低于7分且该专家调用次数已达3次：该专家已达到最大调用次数，请选择其他专家或进行最终整合]
+[如果评分低于7分且该专家调用次数少于{max_calls}次：请[专家名称]重新思考并补充完善，重点关注[具体不足点]]
+[如果评分低于7分且该专家调用次数已达{max_calls}次：该专家已达到最大调用次数，请选择其他专家或进行最终整合]
 
 可选的专家包括：
 - enterprise_knowledge_expert: 企业知识专家
@@ -459,63 +440,591 @@ class OverseasAdvisorySwarm:
 - implementation_planning_expert: 实施计划专家
 - senior_advisory_expert: 资深顾问专家
 
-请记住：每个专家发言后，你都必须进行评估！每个专家最多只能被调用3次！
+请记住：每个专家发言后，你都必须进行评估！每个专家最多只能被调用{max_calls}次！
 """
         
+        # 规则选择器按固定流程选择发言者，只有无法判断时才调用大模型；
+        # llm 模式下规则选择器只负责评估环节（专家发言后评估、按评分决定是否重新输出），下一位专家由大模型选择
+        self.rule_selector = RuleBasedSelector(
+            max_calls_per_agent=self.max_calls_per_agent,
+            fixed_order=self.selector_mode == "rule",
+        )
+        
+        # 大模型选择器只需要最近的对话即可判断下一位发言者
+        selector_context = None
+        if self.context_config and self.context_config.get("strategy", "full") != "full":
+            selector_context = BufferedChatCompletionContext(buffer_size=self.context_config.get("window_size", 6))
+        
         self.team = SelectorGroupChat(
             participants=participants,
-            model_client=self.model_client,
+            model_client=self._role_client("selector"),
             selector_prompt=selector_prompt,
+            # 预算不足时直接选择资深顾问专家；大模型选择时只在未达调用上限的智能体中选择
+            selector_func=self._speculative_selector(self.budget.selector(self.rule_selector)),
+            candidate_func=self._candidates,
             termination_condition=termination_condition,
+            model_context=selector_context,
+            emit_team_events=True,  # 输出发言者选择事件，用于性能埋点
         )
     
-    async def start_consultation(self, user_message: str, callback=None):
-        """开始咨询流程，支持流式输出回调和PDF生成"""
+    def _speculative_selector(self, inner):
+        """
+        包装发言者选择函数：选中方案专家评估时推测运行评估通过后的下一位专家，
+        之后选中的不是该专家（要求重新输出、预算转入最终整合等）时取消推测
+        """
+        if self.speculator is None:
+            return inner
+        speculator = self.speculator
+
+        def select(messages):
+            speaker = inner(messages)
+            speculator.select(speaker)
+            if speaker == EVALUATOR_NAME:
+                next_expert = self.rule_selector.predict_after_evaluation(messages)
+                if next_expert is not None:
+                    speculator.start(next_expert, messages)
+            return speaker
+
+        return select
+
+    def _candidates(self, messages) -> List[str]:
+        """大模型选择发言者时的候选：预算允许的智能体中参与本次咨询（意图识别出的专家子图）的智能体"""
+        candidates = [name for name in self.budget.candidates(messages) if name in self.active_agents]
+        return candidates or [FINAL_SPEAKER_NAME]
+
+    @property
+    def active_agents(self) -> List[str]:
+        """参与本次咨询的智能体名称"""
+        return [self.agents[key].name for key in self.intent.agent_keys()]
+
+    async def _classify_intent(self, user_message: str, cancellation_token: Optional[CancellationToken] = None) -> IntentDecision:
+        """
+        识别需求意图：先按关键词判断，无法判断且开启 model_fallback 时由 router 路由的模型分类，
+        仍无法判断、分类出错或未开启意图识别时按全面咨询处理
+        """
+        if not self.intent_config.get("enabled", True):
+            return IntentDecision()
+        decision = classify_intent(user_message)
+        if decision is None and self.intent_config.get("model_fallback", False):
+            try:
+                decision = await classify_intent_with_model(self._role_client("router"), user_message, cancellation_token)
+            except Exception as e:
+                print(f"警告：意图识别失败，按全面咨询处理：{e}")
+        return decision or IntentDecision()
+
+    def _apply_intent(self, intent: IntentDecision) -> None:
+        """按意图限定规则选择器的专家顺序（推测执行随之只预测子图中的专家）"""
+        self.intent = intent
+        active = set(self.active_agents)
+        self.rule_selector.expert_order = [name for name in EXPERT_ORDER if name in active]
+
+    def _plan_followup(self, user_message: str) -> Optional[Tuple[IntentDecision, FollowupPlan]]:
+        """
+        上一次咨询已完成时判断新消息是否为追问：返回追问后的意图（单项咨询提到其他专题时加入该专题）和重新运行计划，
+        不是追问或无法确定受影响的专家时返回 None
+        """
+        if not self.followup_enabled or not self.followup_ready:
+            return None
+        intent = extend_intent(self.intent, user_message)
+        plan = plan_followup(user_message, restrict_dependencies(EXPERT_DEPENDENCIES, intent.agent_keys()))
+        return (intent, plan) if plan is not None else None
+
+    def _workflow_steps(self) -> str:
+        """咨询任务中的工作流程：参与本次咨询的领域专家依次发言并由方案专家评估，最后由资深顾问专家整合"""
+        steps = ["**方案专家首先分析用户需求，确定需要哪些专家的参与**"]
+        for key in self.intent.agent_keys():
+            if key not in WORKFLOW_STEPS:
+                continue
+            name, duty = WORKFLOW_STEPS[key]
+            steps.append(f"{name}：{duty}")
+            steps.append(f"**方案专家评估{name}的输出，如果不满要求要求重新输出**")
+        steps.append("资深顾问专家：最终协调整合，形成完整方案并生成PDF")
+        return "\n".join(f"{i}. {step}" for i, step in enumerate(steps, 1))
+
+    def _create_shadow(self, name: str) -> AssistantAgent:
+        """创建推测执行使用的影子智能体，配置与团队中的同名专家相同"""
+        agent_key, prompt_file = self._expert_specs[name]
+        return self._create_expert(agent_key, name, prompt_file)
+
+    def _on_speculation(self, name: str, hit: bool, wasted_tokens: int) -> None:
+        """记录推测结果，丢弃的推测的用量计入本次咨询的预算"""
+        if self.last_trace is not None:
+            self.last_trace.speculation(name, hit, wasted_tokens)
+        if not hit:
+            self.budget.charge(wasted_tokens)
+
+    def _build_expert_task(self, user_message: str, agent_key: str, upstream: Dict[str, str]) -> str:
+        """为并发模式下的单个专家构建任务描述，只附带其依赖专家的分析结果；追问时附带该专家上一次的分析"""
+        parts = [f"客户需求：{user_message}"]
+        previous = self.analysis.latest().get(self.agents[agent_key].name) if self.followup is not None else None
+        if previous:
+            parts.append(f"客户在上一次方案的基础上提出了调整要求：{self.followup['message']}")
+            parts.append(f"以下是你上一次的分析，请根据调整要求更新，仍然适用的内容保持不变：\n\n{previous}")
+        if upstream:
+            parts.append("以下是相关专家已完成的分析，请在此基础上开展你的工作：")
+            summarize = bool(self.context_config) and self.context_config.get("strategy") == "summary"
+            for dep_key, dep_content in upstream.items():
+                dep_name = AGENT_DISPLAY_NAMES.get(self.agents[dep_key].name, dep_key)
+                if summarize:
+                    dep_content = summarize_text(dep_content, self.context_config.get("summary_chars", 800))
+                parts.append(f"### {dep_name}\n{dep_content}")
+        if agent_key == "senior_advisor":
+            parts.append("请整合以上各专家的分析，形成完整的出海方案，并在结尾回复“出海方案完成”。")
+        elif previous:
+            parts.append("请输出更新后的完整分析。")
+        else:
+            parts.append("请针对客户需求，从你的专业领域给出分析和建议。")
+        return "\n\n".join(parts)
+
+    async def _submit_pdf(self, user_message: str, expert_analysis: Dict[str, str], callback, pdf_callback=None) -> None:
+        """
+        提交PDF渲染任务：提供 pdf_callback 时把任务句柄交给调用方跟踪进度，
+        否则等待渲染完成（等待期间不阻塞事件循环）后通过 callback 通知
+        """
+        try:
+            job = self.pdf_service.submit(user_message, expert_analysis, report=self.report, template=self.intent.template)
+        except Exception as e:
+            await callback("❌ PDF生成失败", f"PDF生成过程中遇到错误：{str(e)}")
+            return
+        self.last_pdf_job = job
+        if pdf_callback:
+            await pdf_callback(job)
+            return
+        try:
+            pdf_path = await job
+            await callback("PDF生成", f"出海方案PDF已生成：{pdf_path}")
+        except Exception as e:
+            await callback("❌ PDF生成失败", f"PDF生成过程中遇到错误：{str(e)}")
+
+    def export_scores(self, directory: Optional[str] = None) -> Optional[str]:
+        """
+        导出本次咨询的评分表（CSV），没有评估记录时返回 None
+
+        Args:
+            directory: 导出目录，默认为PDF输出目录下的 scores 子目录
+        """
+        if not self.analysis.evaluations:
+            return None
+        directory = directory or os.path.join(self.pdf_service.output_dir, "scores")
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        return self.analysis.export_scores(os.path.join(directory, f"scores_{timestamp}_{uuid.uuid4().hex[:8]}.csv"))
+
+    async def _finish_over_budget(self, user_message: str, callback, pdf_callback=None, submit_pdf: bool = True) -> None:
+        """预算耗尽、咨询提前结束时通知用户，并基于已有的专家分析生成PDF"""
+        reason = BUDGET_REASON_LABELS.get(self.budget.stop_reason, self.budget.stop_reason)
+        if self.last_trace is not None:
+            self.last_trace.budget_stop(self.budget.stop_reason)
+        await callback("⏱️ 预算控制", f"本次咨询因{reason}提前结束，方案基于已完成的专家分析整理。")
+        if submit_pdf and self.analysis.revisions:
+            await self._submit_pdf(user_message, self.analysis.latest(), callback, pdf_callback)
+
+    async def _run_parallel_consultation(
+        self,
+        user_message: str,
+        callback,
+        stream_callback=None,
+        tracer: Optional[ConsultationTracer] = None,
+        pdf_callback=None,
+        completed: Optional[Dict[str, str]] = None,
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> Dict[str, str]:
+        """
+        按依赖图并发执行各专家：企业知识专家先行，各领域专家并发，实施计划与资深顾问随后；
+        单项咨询只执行意图识别出的专家子图
+
+        Args:
+            user_message: 用户原始需求
+            callback: 每个专家完成时调用的回调函数
+            stream_callback: 专家输出流式片段时调用的回调函数
+            tracer: 本次咨询的性能追踪器
+            pdf_callback: PDF渲染任务提交后调用的回调函数，参数为任务句柄
+            completed: 已完成专家的输出（注册键 -> 内容，从检查点恢复），这些专家不再执行
+            cancellation_token: 本次咨询的取消令牌，取消时中止进行中的模型调用
+
+        追问调整时 completed 为不受影响的专家（沿用上一次的分析），只执行需重新运行的专家
+
+        Returns:
+            Dict[str, str]: 各专家分析结果字典（键为智能体名称）
+        """
+        for agent in self.agents.values():
+            await agent.on_reset(CancellationToken())
+
+        async def run_expert(agent_key: str, upstream: Dict[str, str]) -> str:
+            agent = self.agents[agent_key]
+            task = self._build_expert_task(user_message, agent_key, upstream)
+            display_name = AGENT_DISPLAY_NAMES.get(agent.name, agent.name)
+            content = ""
+            if tracer:
+                tracer.turn_started(agent.name)
+            async for event in agent.on_messages_stream(
+                [TextMessage(content=task, source="user")], cancellation_token or CancellationToken()
+            ):
+                if isinstance(event, ModelClientStreamingChunkEvent):
+                    if tracer:
+                        tracer.token_received(agent.name)
+                    if stream_callback:
+                        await stream_callback(display_name, event.content)
+                elif isinstance(event, Response):
+                    content = str(event.chat_message.content)
+                    if tracer:
+                        tracer.turn_finished(agent.name, event.chat_message.models_usage)
+            return content
+
+        async def on_expert_done(agent_key: str, content: str) -> None:
+            agent_name = self.agents[agent_key].name
+            self.agent_call_count[agent_key] += 1
+            # 并发模式不经过评估，专家完成即采纳并预渲染对应章节
+            self.analysis.add_revision(agent_name, content, accepted=True)
+            if self.report is not None:
+                self.report.update(agent_name, content)
+            await callback(self.agent_index[agent_name].display_name, content)
+            self.transcript.append({"source": agent_name, "content": content})
+            await self._save_checkpoint("running")
+
+        await run_dependency_graph(
+            restrict_dependencies(EXPERT_DEPENDENCIES, self.intent.agent_keys()),
+            run_expert,
+            on_node_done=on_expert_done,
+            max_concurrency=self.max_parallel_experts,
+            completed=completed,
+        )
+
+        expert_analysis = self.analysis.latest()
+        await self._submit_pdf(user_message, expert_analysis, callback, pdf_callback)
+
+        return expert_analysis
+
+    @property
+    def running(self) -> bool:
+        """是否有进行中的咨询"""
+        return self._consultation_task is not None and not self._consultation_task.done()
+
+    async def cancel(self, reason: str = "stopped") -> None:
+        """
+        取消本会话进行中的咨询：中止进行中的模型调用和章节预渲染，取消尚未完成的PDF任务，并等待咨询结束；
+        已完成的专家分析随检查点保存
+
+        Args:
+            reason: stopped（用户停止）、superseded（用户发送了新消息）或 disconnected（用户离开会话）；
+                离开会话时检查点仍可续跑，恢复会话时从检查点继续
+        """
+        self.cancel_reason = reason
+        if self._cancellation_token is not None:
+            self._cancellation_token.cancel()
+        if self.speculator is not None:
+            self.speculator.cancel()
+        if self.report is not None:
+            self.report.cancel()
+        if self.last_pdf_job is not None:
+            self.last_pdf_job.cancel()
+        task = self._consultation_task
+        if task is not None and not task.done() and task is not asyncio.current_task():
+            task.cancel()
+            await asyncio.wait([task])
+
+    async def _record_cancelled(self) -> None:
+        """咨询被取消时停止仍在进行的调用，并把已完成的部分结果保存到检查点"""
+        reason = self.cancel_reason or "stopped"
+        if self.last_trace is not None:
+            self.last_trace.cancelled(reason)
+        if self._cancellation_token is not None:
+            self._cancellation_token.cancel()
+        if self.report is not None:
+            self.report.cancel()
+        # 用户离开会话时保持可续跑，主动停止或发送新消息时不再续跑（删除检查点）
+        await self._save_checkpoint("running" if reason == "disconnected" else "cancelled")
+
+    def load_checkpoint(self, status: str = "running") -> Optional[Dict[str, Any]]:
+        """加载本会话指定状态（默认为未完成）咨询的检查点，没有时返回 None"""
+        if self.checkpoint_store is None or not self.checkpoint_key:
+            return None
+        checkpoint = self.checkpoint_store.load(self.checkpoint_key)
+        if checkpoint is None or checkpoint.get("status") != status:
+            return None
+        if checkpoint.get("execution_mode") != self.execution_mode:
+            return None
+        return checkpoint
+
+    async def _save_checkpoint(self, status: str) -> None:
+        """
+        保存检查点：团队状态（选择器模式）、分析结果、调用次数、预算用量和对话记录；
+        被取消的咨询和关闭追问时已完成的咨询既不续跑也不会被追问，直接删除检查点
+        """
+        if self.checkpoint_store is None or not self.checkpoint_key:
+            return
+        if status == "cancelled" or (status == "completed" and not self.followup_enabled):
+            await self.discard_checkpoint()
+            return
+        try:
+            # 团队运行中保存的状态可能已包含尚未处理的下一条消息，恢复时由 _missed_messages 补回
+            team_state = await self.team.save_state() if self.execution_mode == "selector" and status == "running" else None
+            data: Dict[str, Any] = {
+                "status": status,
+                "execution_mode": self.execution_mode,
+                "user_message": self.consultation_message,
+                "intent": self.intent.to_dict(),
+                "followup": self.followup,
+                "analysis": self.analysis.to_dict(),
+                "agent_call_count": dict(self.agent_call_count),
+                "budget": self.budget.snapshot(),
+                "transcript": self.transcript,
+                "team_state": team_state,
+            }
+            await self.checkpoint_store.save(self.checkpoint_key, data)
+        except Exception as e:
+            print(f"警告：保存检查点失败：{e}")
+
+    async def discard_checkpoint(self) -> None:
+        """删除本会话的检查点（会话结束后无法恢复或不再需要续跑时调用）"""
+        if self.checkpoint_store is None or not self.checkpoint_key:
+            return
+        try:
+            await asyncio.to_thread(self.checkpoint_store.delete, self.checkpoint_key)
+        except OSError as e:
+            print(f"警告：删除检查点失败：{e}")
+
+    async def _restore_checkpoint(self, checkpoint: Dict[str, Any]) -> ExpertAnalysis:
+        """从检查点恢复意图、分析结果、调用次数、预算用量、对话记录和团队状态，并重新预渲染已通过评估的章节"""
+        self._apply_intent(IntentDecision.from_dict(checkpoint.get("intent")))
+        self.followup = checkpoint.get("followup")
+        analysis = self.analysis = ExpertAnalysis.from_dict(checkpoint["analysis"])
+        self.agent_call_count.update(checkpoint.get("agent_call_count", {}))
+        self.budget.restore(checkpoint.get("budget", {}))
+        self.transcript = list(checkpoint.get("transcript", []))
+        if checkpoint.get("team_state"):
+            await self.team.load_state(checkpoint["team_state"])
+        for expert_name in analysis.revisions:
+            accepted = analysis.accepted(expert_name)
+            if accepted:
+                self.report.update(expert_name, accepted[-1])
+        return analysis
+
+    async def restore_completed(self) -> bool:
+        """恢复会话时加载上一次已完成咨询的结果，之后的追问在其基础上调整；没有已完成的咨询时返回 False"""
+        checkpoint = self.load_checkpoint("completed")
+        if checkpoint is None or not self.followup_enabled:
+            return False
+        self.report = IncrementalReport(self.pdf_service)
+        await self._restore_checkpoint(checkpoint)
+        self.followup = None
+        self.consultation_message = checkpoint["user_message"]
+        self.followup_ready = bool(self.analysis.revisions)
+        return self.followup_ready
+
+    async def _replay_cached(self, cached: CachedConsultation, user_message: str, callback, pdf_callback=None) -> None:
+        """回放缓存的咨询：依次显示各专家的消息，已有PDF直接交付，PDF已被清理时按缓存的分析结果重新生成"""
+        self.analysis = ExpertAnalysis.from_dict(cached.analysis)
+        # 重新生成PDF时按关键词确定建议书模板（不调用模型）
+        if self.intent_config.get("enabled", True):
+            self._apply_intent(classify_intent(user_message) or IntentDecision())
+        self.transcript = list(cached.messages)
+        note = "检测到相同的咨询需求" if cached.similarity >= 1.0 else f"检测到相似的咨询需求（相似度 {cached.similarity:.0%}）"
+        await callback("⚡ 咨询缓存", f"{note}，直接返回已有的咨询结果。")
+        for message in cached.messages:
+            info = self.agent_index.get(message["source"])
+            if info is not None:
+                await callback(info.display_name, message["content"])
+        if cached.pdf_path and os.path.exists(cached.pdf_path):
+            job = self.last_pdf_job = PdfJob.completed(cached.pdf_path)
+            if pdf_callback:
+                await pdf_callback(job)
+            else:
+                await callback("PDF生成", f"出海方案PDF已生成：{cached.pdf_path}")
+        elif self.analysis.revisions:
+            await self._submit_pdf(user_message, self.analysis.latest(), callback, pdf_callback)
+
+    async def _store_cached(self, user_message: str) -> None:
+        """保存完成的咨询供相同或相似的需求回放"""
+        if self.consultation_cache is None or not self.analysis.revisions:
+            return
+        try:
+            await asyncio.to_thread(
+                self.consultation_cache.store,
+                user_message,
+                self.transcript,
+                self.analysis.to_dict(),
+                self.last_pdf_job.output_path if self.last_pdf_job is not None else None,
+            )
+        except Exception as e:
+            print(f"警告：保存咨询缓存失败：{e}")
+
+    def _missed_messages(self, checkpoint: Dict[str, Any]) -> List[BaseChatMessage]:
+        """团队状态中已有、但保存检查点时尚未处理（不在对话记录中）的消息，恢复后先按正常流程处理这些消息"""
+        team_state = checkpoint.get("team_state") or {}
+        manager_state = next(
+            (state for state in team_state.get("agent_states", {}).values() if "message_thread" in state), None
+        )
+        if manager_state is None:
+            return []
+        factory = MessageFactory()
+        messages = [factory.create(data) for data in manager_state["message_thread"]]
+        chat_messages = [message for message in messages if isinstance(message, BaseChatMessage) and message.content]
+        return chat_messages[len(checkpoint.get("transcript", [])):]
+
+    async def _resume_stream(self, missed: List[BaseChatMessage], task: Optional[str], cancellation_token: CancellationToken):
+        """先产出检查点遗漏的消息，再继续团队运行"""
+        for message in missed:
+            yield message
+        async for message in self.team.run_stream(task=task, cancellation_token=cancellation_token):
+            yield message
+
+    async def start_consultation(
+        self,
+        user_message: str,
+        callback=None,
+        stream_callback=None,
+        pdf_callback=None,
+        checkpoint: Optional[Dict[str, Any]] = None,
+        queue_callback=None,
+        allow_followup: bool = False,
+    ):
+        """
+        开始咨询流程，支持流式输出回调和PDF生成
+
+        Args:
+            user_message: 用户原始需求
+            callback: 专家完整回复的回调函数，参数为 (显示名称, 完整内容)
+            stream_callback: 专家流式片段的回调函数，参数为 (显示名称, 片段)；
+                同一显示名称的片段之后总会跟随一次 callback，用于结束该条流式消息
+            pdf_callback: PDF渲染任务提交后调用的回调函数，参数为可等待的任务句柄（PdfJob）；
+                未提供时等待渲染完成后通过 callback 通知PDF路径
+            checkpoint: load_checkpoint 返回的检查点，提供时从检查点继续未完成的咨询（使用检查点中的用户需求）
+            queue_callback: 进程内同时运行的咨询数达到上限、需要排队时调用，参数为前面等待的咨询数
+            allow_followup: 上一次咨询已完成时把调整类的消息作为追问处理，只重新运行受影响的专家及其下游专家
+                （界面中的连续对话使用；批量咨询等每条消息相互独立的场景不使用）
+        """
         if not self.team:
             return "团队未初始化"
         
+        tracer = ConsultationTracer(
+            self.execution_mode,
+            self.trace_dir,
+            evaluator=self.agents['solution_expert'].name,
+            max_trace_files=self.max_trace_files,
+        )
+        self.last_trace = tracer
+        status = "completed"
+        admitted = False
+        # 本次咨询的取消令牌：用户取消或到达墙钟时间上限时中止进行中的模型调用
+        self.cancel_reason = None
+        cancellation_token = self._cancellation_token = CancellationToken()
+        self._consultation_task = asyncio.current_task()
+        followup = self._plan_followup(user_message) if allow_followup and checkpoint is None and callback else None
         try:
             print(f"DEBUG: start_consultation 开始，用户消息: {user_message}")
             
-            # 重置团队状态和调用次数
+            # 重置团队状态和调用次数；追问沿用上一次咨询的分析结果和已渲染的章节
             await self.team.reset()
             for agent_name in self.agent_call_count.keys():
                 self.agent_call_count[agent_name] = 0
+            if followup is None:
+                self.followup_ready = False
+                if self.report is not None:
+                    self.report.cancel()
+                self.report = IncrementalReport(self.pdf_service)
+            self.last_pdf_job = None
+            
+            # 咨询缓存：相同或相似的需求直接回放已有结果
+            if checkpoint is None and followup is None and callback and self.consultation_cache is not None:
+                cached = await asyncio.to_thread(self.consultation_cache.lookup, user_message)
+                if cached is not None:
+                    tracer.cache_hit(cached.similarity)
+                    status = "cached"
+                    await self._replay_cached(cached, user_message, callback, pdf_callback)
+                    self.consultation_message = user_message
+                    self.followup_ready = True
+                    return
+            
+            # 准入控制：同时运行的咨询数达到上限时排队（排队时间不计入本次咨询的预算）
+            await self.admission.acquire(queue_callback)
+            admitted = True
+            
+            if checkpoint is not None:
+                user_message = checkpoint["user_message"]
+                analysis = await self._restore_checkpoint(checkpoint)
+                tracer.resumed(len(self.transcript))
+            elif followup is not None:
+                # 追问：在上一次的需求后附上调整要求，保留上一次的分析结果和对话记录
+                intent, plan = followup
+                self._apply_intent(intent)
+                self.followup = {"message": user_message, "rerun": list(plan.rerun), "start_turn": self.analysis.turn}
+                user_message = f"{self.consultation_message}\n调整要求：{user_message}"
+                analysis = self.analysis
+                self.budget.start()
+                tracer.followup(plan.changed, plan.rerun)
+                rerun_names = "、".join(self.agent_index[self.agents[key].name].display_name for key in plan.rerun)
+                await callback(
+                    "🔁 追问调整",
+                    f"本次调整涉及{'、'.join(plan.inputs)}，重新分析：{rerun_names}；其余专家沿用上一次的分析。",
+                )
+            else:
+                analysis = self.analysis = ExpertAnalysis()
+                self.budget.start()
+                self.transcript = []
+                self._apply_intent(await self._classify_intent(user_message, cancellation_token))
+                if callback and not self.intent.is_full:
+                    names = "、".join(AGENT_DISPLAY_NAMES[name] for name in self.active_agents)
+                    title = DOCUMENT_TEMPLATES[self.intent.template]["title"]
+                    await callback("🧭 需求识别", f"识别为{self.intent.label}专项咨询，由{names}参与，生成《{title}》。")
+            self.consultation_message = user_message
+            tracer.intent_decision(self.intent.name, self.intent.method, self.active_agents)
+
+            # 并发模式和追问：按依赖图调度，不经过选择器团队；到达墙钟时间上限时取消未完成的专家
+            if (self.execution_mode == "parallel" or self.followup is not None) and callback:
+                completed = {
+                    self.agent_index[name].key: content
+                    for name, content in analysis.latest().items()
+                    if name in self.agent_index
+                }
+                if self.followup is not None:
+                    # 需重新运行的专家在本次追问中已完成时（从检查点继续）不再执行
+                    rerun = set(self.followup["rerun"])
+                    completed = {
+                        key: content
+                        for key, content in completed.items()
+                        if key not in rerun
+                        or analysis.revisions[self.agents[key].name][-1].turn > self.followup["start_turn"]
+                    }
+                try:
+                    await asyncio.wait_for(
+                        self._run_parallel_consultation(
+                            user_message, callback, stream_callback, tracer, pdf_callback, completed, cancellation_token
+                        ),
+                        timeout=self.budget.remaining_seconds,
+                    )
+                except asyncio.TimeoutError:
+                    self.budget.stop_reason = "deadline"
+                    status = "budget_exhausted"
+                    await self._finish_over_budget(user_message, callback, pdf_callback, submit_pdf=True)
+                else:
+                    # 追问的结果依赖上一次咨询，不写入咨询缓存
+                    if self.followup is None:
+                        await self._store_cached(user_message)
+                    self.followup_ready = True
+                self.followup = None
+                await self._save_checkpoint("completed")
+                return
+            
+            pass_score = self.rule_selector.pass_score
             
-            # 存储各专家的分析结果
-            expert_analysis = {}
+            # 单项咨询只由意图识别出的专家参与
+            scope = "" if self.intent.is_full else f"\n本次为{self.intent.label}专项咨询，只需以下流程中的专家参与。\n"
             
             # 构建任务描述
             task = f"""
 客户需求：{user_message}
-
+{scope}
 请各位专家按照以下流程进行咨询分析：
 
 **工作流程：**
-1. **方案专家首先分析用户需求，确定需要哪些专家的参与**
-2. 企业知识专家：了解企业基本情况和出海需求
-3. **方案专家评估企业知识专家的输出，如果不满要求要求重新输出**
-4. 市场分析专家：分析目标市场机会和风险
-5. **方案专家评估市场分析专家的输出，如果不满要求要求重新输出**
-6. 战略规划专家：制定出海战略和进入策略
-7. **方案专家评估战略规划专家的输出，如果不满要求要求重新输出**
-8. 运营规划专家：设计运营体系和组织架构
-9. **方案专家评估运营规划专家的输出，如果不满要求要求重新输出**
-10. 营销推广专家：制定品牌推广和营销策略
-11. **方案专家评估营销推广专家的输出，如果不满要求要求重新输出**
-12. 法律合规专家：提供法律合规保障方案
-13. **方案专家评估法律合规专家的输出，如果不满要求要求重新输出**
-14. 财务规划专家：制定财务规划和风险管控
-15. **方案专家评估财务规划专家的输出，如果不满要求要求重新输出**
-16. 实施计划专家：整合为可执行的实施计划
-17. **方案专家评估实施计划专家的输出，如果不满要求要求重新输出**
-18. 资深顾问专家：最终协调整合，形成完整方案并生成PDF
+{self._workflow_steps()}
 
 **重要说明：**
 - **方案专家必须对每个专家的输出进行质量评估**
 - **评估标准：专业性、完整性、实用性、相关性、创新性（1-10分）**
 - **如果某个专家的输出评分低于7分，方案专家必须要求其重新输出**
-- **每个专家最多只能被调用3次，超过限制后请选择其他专家或进行最终整合**
+- **每个专家最多只能被调用{self.max_calls_per_agent}次，超过限制后请选择其他专家或进行最终整合**
+- **方案专家最多进行{self.budget.max_evaluator_calls}次评估，用完后选择资深顾问专家进行最终整合**
 - **只有当所有专家都达到满意水平后，才能选择资深顾问专家进行最终整合**
 - **方案专家要确保最终方案的质量和完整性**
 
@@ -533,119 +1042,221 @@ class OverseasAdvisorySwarm:
 优点：[具体优点]
 不足：[具体不足]
 
-[如果评分低于7分且该专家调用次数少于3次：请[专家名称]重新思考并补充完善，重点关注[具体不足点]]
-[如果评分低于7分且该专家调用次数已达3次：该专家已达到最大调用次数，请选择其他专家或进行最终整合]
+[如果评分低于7分且该专家调用次数少于{self.max_calls_per_agent}次：请[专家名称]重新思考并补充完善，重点关注[具体不足点]]
+[如果评分低于7分且该专家调用次数已达{self.max_calls_per_agent}次：该专家已达到最大调用次数，请选择其他专家或进行最终整合]
+
+评估的最后必须附上 JSON 格式的结构化评分（字段见方案专家的系统提示），系统按其中的总体评分决定专家是否重新输出。
 
-请方案专家开始分析用户需求并协调整个咨询过程。记住：每个专家发言后都要进行评估！每个专家最多只能被调用3次！
+请方案专家开始分析用户需求并协调整个咨询过程。记住：每个专家发言后都要进行评估！每个专家最多只能被调用{self.max_calls_per_agent}次！
 """
             
-            # 如果有回调函数，使用流式输出
-            if callback:
-                async for message in self.team.run_stream(task=task):
-                    # 解析消息内容
-                    if hasattr(message, 'content') and message.content:
-                        content = str(message.content)
-                        
-                        # 提取智能体名称和回复内容
-                        agent_name = "未知专家"
-                        agent_key = "unknown"
+            # 墙钟时间上限：到期时取消进行中的模型调用，保证咨询时长有确定的上限
+            deadline_token = cancellation_token
+            deadline_handle = None
+            if self.budget.remaining_seconds is not None:
+                deadline_handle = asyncio.get_running_loop().call_later(self.budget.remaining_seconds, deadline_token.cancel)
+            pdf_submitted = False
+            
+            try:
+                # 如果有回调函数，使用流式输出
+                if callback:
+                    # 从检查点继续时团队已加载保存的对话，不再发送任务
+                    if checkpoint is None:
+                        stream = self.team.run_stream(task=task, cancellation_token=deadline_token)
+                    else:
+                        stream = self._resume_stream(self._missed_messages(checkpoint), None, deadline_token)
+                    async for message in stream:
+                        # 记录发言者选择：预算不足转入最终整合时为 budget，规则选择器给出结果时为 rule，否则为大模型回退
+                        if isinstance(message, SelectSpeakerEvent):
+                            if self.budget.finalize_reason is not None:
+                                mode = "budget"
+                            elif self.rule_selector is not None and self.rule_selector.last_result is not None:
+                                mode = "rule"
+                            else:
+                                mode = "llm"
+                            for speaker in message.content:
+                                tracer.selector_decision(speaker, mode)
+                            continue
+                    
+                        # 转发模型流式片段
+                        if isinstance(message, ModelClientStreamingChunkEvent):
+                            tracer.token_received(message.source)
+                            if stream_callback:
+                                await stream_callback(AGENT_DISPLAY_NAMES.get(message.source, message.source), message.content)
+                            continue
+                    
+                        # 解析消息内容（记忆检索等事件不展示）
+                        if isinstance(message, BaseChatMessage) and message.content:
+                            content = str(message.content)
+                            if message.source != "user":
+                                tracer.turn_finished(message.source, message.models_usage)
                         
-                        if "【企业知识专家】" in content:
-                            agent_name = "🏢 企业知识专家"
-                            agent_key = "enterprise_knowledge_expert"
-                        elif "【市场分析专家】" in content:
-                            agent_name = "📈 市场分析专家"
-                            agent_key = "market_analysis_expert"
-                        elif "【战略规划专家】" in content:
-                            agent_name = "🎯 战略规划专家"
-                            agent_key = "strategic_planning_expert"
-                        elif "【运营规划专家】" in content:
-                            agent_name = "⚙️ 运营规划专家"
-                            agent_key = "operations_planning_expert"
-                        elif "【营销推广专家】" in content:
-                            agent_name = "📢 营销推广专家"
-                            agent_key = "marketing_promotion_expert"
-                        elif "【法律合规专家】" in content:
-                            agent_name = "⚖️ 法律合规专家"
-                            agent_key = "legal_compliance_expert"
-                        elif "【财务规划专家】" in content:
-                            agent_name = "💰 财务规划专家"
-                            agent_key = "financial_planning_expert"
-                        elif "【实施计划专家】" in content:
-                            agent_name = "📋 实施计划专家"
-                            agent_key = "implementation_planning_expert"
-                        elif "【方案专家】" in content:
-                            agent_name = "🎯 方案专家"
-                            agent_key = "solution_expert"
-                        elif "【资深顾问专家】" in content:
-                            agent_name = "🎓 资深顾问专家"
-                            agent_key = "senior_advisory_expert"
+                            # 按消息来源归属发言者（用户任务等非智能体消息不计入分析结果）
+                            info = self.agent_index.get(message.source)
+                            if info is not None:
+                                self.agent_call_count[info.key] += 1
+                                print(f"DEBUG: {info.name} 调用次数: {self.agent_call_count[info.key]}")
                             
-                            # 如果是资深顾问专家，生成PDF
-                            if "出海方案完成" in content:
-                                try:
-                                    pdf_path = generate_overseas_plan_pdf(user_message, expert_analysis)
-                                    # 在Chainlit中显示PDF下载链接
-                                    await callback("PDF生成", f"出海方案PDF已生成：{pdf_path}")
-                                except Exception as e:
-                                    await callback("❌ PDF生成失败", f"PDF生成过程中遇到错误：{str(e)}")
-                        
-                        # 更新调用次数
-                        if agent_key != "unknown":
-                            # 找到对应的智能体键名
-                            for key, agent in self.agents.items():
-                                if agent.name == agent_key:
-                                    self.agent_call_count[key] += 1
-                                    print(f"DEBUG: {agent_key} 调用次数: {self.agent_call_count[key]}")
-                                    break
-                        
-                        # 存储专家分析结果
-                        expert_analysis[agent_key] = content
-                        
-                        # 调用回调函数显示消息
-                        await callback(agent_name, content)
+                                if info.name == EVALUATOR_NAME:
+                                    # 方案专家的评估单独记录，不覆盖被评估专家的输出；
+                                    # 专家输出通过评估（及格或已达调用上限）后预渲染对应PDF章节，重新输出时只重新渲染该章节，
+                                    # 评分无法解析时也先行采纳，之后的新版本会取代它
+                                    pending = analysis.pending
+                                    scores = parse_evaluation(content)
+                                    score = scores.overall if scores is not None else parse_overall_score(content)
+                                    accepted = pending is not None and (
+                                        score is None
+                                        or score >= pass_score
+                                        or analysis.call_count(pending.expert_name) >= self.max_calls_per_agent
+                                    )
+                                    analysis.add_evaluation(content, score, accepted, scores)
+                                    if accepted:
+                                        self.report.update(pending.expert_name, pending.content)
+                                elif info.name == FINAL_SPEAKER_NAME:
+                                    analysis.add_revision(info.name, content, accepted=True)
+                                    # 资深顾问专家给出结束标记后提交PDF渲染任务（在进程池中执行，不阻塞事件循环），
+                                    # 结论章节使用本条整合内容
+                                    if "出海方案完成" in content:
+                                        await self._submit_pdf(user_message, analysis.latest(), callback, pdf_callback)
+                                        pdf_submitted = True
+                                else:
+                                    analysis.add_revision(info.name, content)
+                                    if self.agent_call_count[info.key] >= self.max_calls_per_agent:
+                                        print(f"DEBUG: {info.name} 已达到最大调用次数 {self.max_calls_per_agent}")
                         
-                        # 检查是否达到最大调用次数
-                        if agent_key != "unknown" and agent_key != "solution_expert" and agent_key != "senior_advisory_expert":
-                            for key, agent in self.agents.items():
-                                if agent.name == agent_key and self.agent_call_count[key] >= self.max_calls_per_agent:
-                                    print(f"DEBUG: {agent_key} 已达到最大调用次数 {self.max_calls_per_agent}")
-                                    break
+                            # 调用回调函数显示消息（按消息来源命名，以便与流式消息对应）
+                            await callback(info.display_name if info else "未知专家", content)
+                            
+                            # 每轮发言后保存检查点
+                            self.transcript.append({"source": message.source, "content": content})
+                            await self._save_checkpoint("running")
+                else:
+                    # 如果没有回调函数，使用普通输出
+                    result = await self.team.run(task=task, cancellation_token=deadline_token)
+                    return str(result)
+            except asyncio.CancelledError:
+                if self.cancel_reason is not None or not deadline_token.is_cancelled():
+                    raise
+                self.budget.stop_reason = "deadline"
+            finally:
+                if deadline_handle is not None:
+                    deadline_handle.cancel()
+            
+            # 预算导致提前结束：通知用户，尚未生成PDF时基于已有分析生成
+            if self.budget.stop_reason is not None:
+                status = "budget_exhausted"
+                await self._finish_over_budget(user_message, callback, pdf_callback, submit_pdf=not pdf_submitted)
             else:
-                # 如果没有回调函数，使用普通输出
-                result = await self.team.run(task=task)
-                return str(result)
+                # 预算耗尽时的方案不完整，只缓存正常完成的咨询
+                await self._store_cached(user_message)
+                self.followup_ready = True
             
+            # 咨询完成，检查点不再用于续跑，只供追问使用（出错时保留，下次可继续）
+            await self._save_checkpoint("completed")
+            
+        except asyncio.CancelledError:
+            # 用户停止、发送新消息或离开会话：保存已完成的部分结果后继续向上传递取消
+            status = "cancelled"
+            if admitted:
+                await self._record_cancelled()
+            raise
         except Exception as e:
+            status = "error"
             print(f"DEBUG: start_consultation 发生错误: {str(e)}")
+            if is_rate_limit_error(e):
+                return "模型服务当前请求过多，多次重试后仍被限流，请稍后再试。"
             return f"咨询过程中遇到错误：{str(e)}"
+        finally:
+            # 结束时仍在进行的推测不再需要
+            if self.speculator is not None:
+                await self.speculator.discard()
+            self._consultation_task = None
+            self._cancellation_token = None
+            self.followup = None
+            if admitted:
+                await self.admission.release()
+            tracer.finish(status)
+
+
+# 咨询被取消时界面显示的提示（按取消原因）
+CANCEL_NOTICES = {
+    "stopped": "⏹️ 咨询已停止，已完成的专家分析已保存。",
+    "superseded": "⏹️ 收到新的消息，上一次咨询已停止。",
+}
+
+
+# 启动选项（标签，消息），也是咨询缓存预热的需求
+STARTERS = [
+    ("🌍 企业出海全面咨询", "我需要为我的企业制定一个全面的出海方案，包括市场分析、战略规划、运营计划等。"),
+    ("📊 目标市场分析", "请帮我分析目标海外市场的机会和风险。"),
+    ("🎯 出海战略规划", "我需要制定企业出海的长期战略规划。"),
+    ("⚖️ 法律合规咨询", "请帮我了解目标市场的法律法规和合规要求。"),
+    ("💰 财务规划咨询", "我需要制定出海的投资预算和财务规划。"),
+]
 
 
 @cl.set_starters
 async def set_starters() -> List[cl.Starter]:
     """设置启动选项"""
-    return [
-        cl.Starter(
-            label="🌍 企业出海全面咨询",
-            message="我需要为我的企业制定一个全面的出海方案，包括市场分析、战略规划、运营计划等。",
-        ),
-        cl.Starter(
-            label="📊 目标市场分析",
-            message="请帮我分析目标海外市场的机会和风险。",
-        ),
-        cl.Starter(
-            label="🎯 出海战略规划",
-            message="我需要制定企业出海的长期战略规划。",
-        ),
-        cl.Starter(
-            label="⚖️ 法律合规咨询",
-            message="请帮我了解目标市场的法律法规和合规要求。",
-        ),
-        cl.Starter(
-            label="💰 财务规划咨询",
-            message="我需要制定出海的投资预算和财务规划。",
-        ),
-    ]
+    return [cl.Starter(label=label, message=message) for label, message in STARTERS]
+
+
+async def prewarm_consultation_cache(model_config: Dict[str, Any]) -> int:
+    """
+    为尚未缓存的启动选项依次执行咨询并写入咨询缓存
+
+    Returns:
+        int: 本次预热执行的咨询数
+    """
+    swarm = OverseasAdvisorySwarm(model_config)
+    cache = swarm.consultation_cache
+    if cache is None:
+        return 0
+
+    async def ignore(agent_name: str, content: str) -> None:
+        pass
+
+    warmed = 0
+    for label, message in STARTERS:
+        if await asyncio.to_thread(cache.lookup, message) is not None:
+            continue
+        error = await swarm.start_consultation(message, callback=ignore)
+        if error:
+            print(f"警告：预热咨询缓存失败（{label}）：{error}")
+            continue
+        METRICS.inc("swarm_consultation_cache_prewarmed_total", "Starter consultations run to prewarm the cache.")
+        warmed += 1
+    return warmed
+
+
+_prewarm_task: Optional[asyncio.Task] = None
+
+
+@cl.on_app_startup
+async def on_app_startup():
+    """应用启动时清理过期的检查点，并按 swarm.consultation_cache.prewarm 在后台预热启动选项的咨询缓存"""
+    global _prewarm_task
+    try:
+        model_config = read_model_config("model_config.yaml")
+    except FileNotFoundError:
+        return
+    checkpoint_store = create_checkpoint_store(model_config.get("swarm") or {})
+    if checkpoint_store is not None:
+        await asyncio.to_thread(checkpoint_store.prune)
+    cache_config = (model_config.get("swarm") or {}).get("consultation_cache") or {}
+    if cache_config.get("enabled", False) and cache_config.get("prewarm", False):
+        _prewarm_task = asyncio.create_task(prewarm_consultation_cache(model_config))
+
+
+@cl.on_app_shutdown
+async def on_app_shutdown():
+    """应用退出时停止缓存预热，关闭共享模型客户端及其连接池、共享的咨询缓存，以及PDF渲染进程池"""
+    if _prewarm_task is not None and not _prewarm_task.done():
+        _prewarm_task.cancel()
+        await asyncio.gather(_prewarm_task, return_exceptions=True)
+    await close_model_clients()
+    close_consultation_caches()
+    await close_pdf_service()
 
 
 @cl.on_chat_start
@@ -654,8 +1265,7 @@ async def on_chat_start():
     
     # 加载模型配置
     try:
-        with open("model_config.yaml", "r", encoding="utf-8") as f:
-            model_config = yaml.safe_load(f)
+        model_config = read_model_config("model_config.yaml")
     except FileNotFoundError:
         await cl.Message(
             content="❌ 未找到模型配置文件 model_config.yaml，请先配置模型参数。"
@@ -664,7 +1274,7 @@ async def on_chat_start():
     
     # 初始化出海顾问团队
     try:
-        swarm = OverseasAdvisorySwarm(model_config)
+        swarm = OverseasAdvisorySwarm(model_config, checkpoint_key=cl.context.session.thread_id)
         cl.user_session.set("swarm", swarm)
         
         # 发送欢迎消息
@@ -693,6 +1303,47 @@ async def on_chat_start():
         ).send()
 
 
+@cl.on_chat_resume
+async def on_chat_resume(thread) -> None:
+    """恢复历史会话：重新初始化顾问团队，存在未完成的咨询时从检查点继续"""
+    try:
+        model_config = read_model_config("model_config.yaml")
+        swarm = OverseasAdvisorySwarm(model_config, checkpoint_key=thread["id"])
+    except Exception as e:
+        await cl.Message(content=f"❌ 初始化出海顾问团队时遇到错误：{str(e)}").send()
+        return
+    cl.user_session.set("swarm", swarm)
+    
+    checkpoint = swarm.load_checkpoint()
+    if checkpoint is None:
+        # 没有未完成的咨询：加载上一次完成的咨询，之后的追问在其基础上调整
+        await swarm.restore_completed()
+        return
+    await cl.Message(
+        content=f"🔄 检测到未完成的咨询，正在从第 {len(checkpoint.get('transcript', [])) + 1} 轮发言继续……"
+    ).send()
+    await run_consultation(swarm, checkpoint["user_message"], checkpoint=checkpoint)
+
+
+@cl.on_stop
+async def on_stop() -> None:
+    """用户停止任务：取消进行中的咨询（模型调用和PDF任务），已完成的专家分析保存在检查点中"""
+    swarm = cast(Optional[OverseasAdvisorySwarm], cl.user_session.get("swarm"))
+    if swarm is not None:
+        await swarm.cancel("stopped")
+
+
+@cl.on_chat_end
+async def on_chat_end() -> None:
+    """用户关闭页面或断开连接：取消进行中的咨询，避免无人查看的咨询继续消耗模型调用；恢复会话时从检查点继续"""
+    swarm = cast(Optional[OverseasAdvisorySwarm], cl.user_session.get("swarm"))
+    if swarm is not None:
+        await swarm.cancel("disconnected")
+        # 未配置数据层时会话无法恢复，检查点既不能续跑也不能追问
+        if get_data_layer() is None:
+            await swarm.discard_checkpoint()
+
+
 @cl.on_message
 async def on_message(message: cl.Message) -> None:
     """处理用户消息"""
@@ -702,18 +1353,59 @@ async def on_message(message: cl.Message) -> None:
         await cl.Message(content="❌ 系统未初始化，请刷新页面重试。").send()
         return
     
+    # 上一次咨询仍在进行时用户发送了新消息：先取消上一次咨询，再开始新的咨询
+    if swarm.running:
+        await swarm.cancel("superseded")
+    
+    await run_consultation(swarm, message.content, allow_followup=True)
+
+
+async def run_consultation(
+    swarm: OverseasAdvisorySwarm,
+    user_message: str,
+    checkpoint: Optional[Dict[str, Any]] = None,
+    allow_followup: bool = False,
+) -> None:
+    """执行一次咨询并在界面中显示专家回复、PDF和评分表；提供检查点时从检查点继续，允许追问时调整类消息只重新运行受影响的专家"""
     # 显示处理状态
-    processing_msg = cl.Message(content="🤖 出海顾问团队正在为您分析需求，请稍候...")
+    processing_text = "🤖 出海顾问团队正在为您分析需求，请稍候..."
+    processing_msg = cl.Message(content=processing_text)
     await processing_msg.send()
     
     try:
         # 存储所有专家回复
         expert_responses = []
+        # 正在流式输出的消息（按专家显示名称区分，并发模式下可能同时存在多条）
+        streaming_messages: Dict[str, cl.Message] = {}
+        # 是否在排队（排队结束、专家开始输出时恢复处理状态）
+        queue_state = {"queued": False}
+        
+        async def show_queue_position(position: int):
+            """显示咨询排队位置的回调函数"""
+            queue_state["queued"] = True
+            processing_msg.content = f"⏳ 当前咨询较多，您前面还有 {position} 位用户在排队，轮到您时将自动开始分析……"
+            await processing_msg.update()
+        
+        async def leave_queue():
+            if queue_state["queued"]:
+                queue_state["queued"] = False
+                processing_msg.content = processing_text
+                await processing_msg.update()
+        
+        async def stream_agent_token(agent_name: str, token: str):
+            """流式显示智能体输出片段的回调函数"""
+            await leave_queue()
+            streaming_message = streaming_messages.get(agent_name)
+            if streaming_message is None:
+                streaming_message = cl.Message(content=f"## {agent_name}\n\n", author=agent_name)
+                streaming_messages[agent_name] = streaming_message
+            await streaming_message.stream_token(token)
         
         # 定义回调函数来显示每个智能体的回复
         async def display_agent_message(agent_name: str, content: str):
             """显示智能体消息的回调函数"""
             print(f"DEBUG: 收到专家回复 - {agent_name}")  # 调试信息
+            await leave_queue()
             
             # 存储回复
             expert_responses.append({
@@ -721,15 +1413,91 @@ async def on_message(message: cl.Message) -> None:
                 "content": content
             })
             
-            # 发送智能体回复
-            await cl.Message(
-                content=f"## {agent_name}\n\n{content}",
-                author=agent_name
-            ).send()
+            # 结束对应的流式消息，没有流式输出时直接发送智能体回复
+            streaming_message = streaming_messages.pop(agent_name, None)
+            if streaming_message is not None:
+                streaming_message.content = f"## {agent_name}\n\n{content}"
+                await streaming_message.send()
+            else:
+                await cl.Message(
+                    content=f"## {agent_name}\n\n{content}",
+                    author=agent_name
+                ).send()
+        
+        # PDF渲染任务的进度显示与文件发送
+        pdf_deliveries: List[asyncio.Task] = []
+        
+        async def track_pdf_job(job: PdfJob):
+            """显示PDF渲染进度，完成后以文件形式发送给用户"""
+            progress_msg = cl.Message(content="📄 出海方案PDF已提交生成……")
+            await progress_msg.send()
+            
+            async def show_progress(job: PdfJob):
+                if job.status == "queued":
+                    progress_msg.content = f"📄 PDF排队中，前面还有 {job.position} 个任务……"
+                elif job.status == "running":
+                    progress_msg.content = "📄 正在生成出海方案PDF……"
+                else:
+                    return
+                await progress_msg.update()
+            
+            job.add_listener(show_progress)
+            await show_progress(job)
+            
+            async def deliver():
+                try:
+                    pdf_path = await job
+                except asyncio.CancelledError:
+                    if job.status != "cancelled":
+                        raise
+                    progress_msg.content = "⏹️ PDF生成已取消"
+                    await progress_msg.update()
+                    return
+                except Exception as e:
+                    progress_msg.content = f"❌ PDF生成过程中遇到错误：{str(e)}"
+                    await progress_msg.update()
+                    return
+                await progress_msg.remove()
+                await cl.Message(
+                    content="📄 出海方案PDF已生成，点击下载：",
+                    elements=[cl.File(name=os.path.basename(pdf_path), path=pdf_path, display="inline")],
+                ).send()
+            
+            pdf_deliveries.append(asyncio.create_task(deliver()))
         
         # 开始咨询流程，使用流式输出
-        print(f"DEBUG: 开始咨询流程，用户消息: {message.content}")  # 调试信息
-        await swarm.start_consultation(message.content, callback=display_agent_message)
+        print(f"DEBUG: 开始咨询流程，用户消息: {user_message}")  # 调试信息
+        error = await swarm.start_consultation(
+            user_message,
+            callback=display_agent_message,
+            stream_callback=stream_agent_token,
+            pdf_callback=track_pdf_job,
+            checkpoint=checkpoint,
+            queue_callback=show_queue_position,
+            allow_followup=allow_followup,
+        )
+        
+        # 等待PDF渲染完成并发送文件（只等待本会话的任务，其他会话不受影响）
+        if pdf_deliveries:
+            await asyncio.gather(*pdf_deliveries)
+        
+        if error:
+            await processing_msg.remove()
+            await cl.Message(content=f"❌ {error}").send()
+            return
+        
+        # 发送本次咨询的评分表
+        scores_path = swarm.export_scores()
+        if scores_path:
+            lines = ["| 专家 | 第几次输出 | 总体评分 | 结论 |", "|---|---|---|---|"]
+            for row in swarm.analysis.score_table():
+                expert = AGENT_DISPLAY_NAMES.get(row["expert"], row["expert"] or "-")
+                overall = "-" if row["overall"] is None else f"{row['overall']:g}/10"
+                lines.append(f"| {expert} | {row['attempt']} | {overall} | {'通过' if row['accepted'] else '重新输出'} |")
+            await cl.Message(
+                content="📊 本次咨询评分表：\n\n" + "\n".join(lines),
+                elements=[cl.File(name=os.path.basename(scores_path), path=scores_path, display="inline")],
+            ).send()
         
         # 咨询完成后，移除处理状态消息
         await processing_msg.remove()
@@ -737,9 +1505,15 @@ async def on_message(message: cl.Message) -> None:
         # 发送完成消息
         print(f"DEBUG: 咨询完成，共收到 {len(expert_responses)} 个回复")  # 调试信息
         await cl.Message(
-            content=f"🎉 出海顾问团队分析完成！\n\n✅ 共完成 {len(expert_responses)} 位专家分析\n📄 PDF方案已生成，请查看上方链接。"
+            content=f"🎉 出海顾问团队分析完成！\n\n✅ 共完成 {len(expert_responses)} 位专家分析\n📄 PDF方案已生成，请查看上方文件。"
         ).send()
         
+    except asyncio.CancelledError:
+        # 咨询被取消：用户已离开会话时不再更新界面
+        if swarm.cancel_reason != "disconnected":
+            processing_msg.content = CANCEL_NOTICES.get(swarm.cancel_reason or "stopped", CANCEL_NOTICES["stopped"])
+            await processing_msg.update()
+        raise
     except Exception as e:
         await processing_msg.remove()
         print(f"DEBUG: 发生错误 - {str(e)}")  # 调试信息
@@ -1,7 +1,6 @@
 from typing import List, cast
 
 import chainlit as cl
-import yaml
 from autogen_agentchat.agents import AssistantAgent
 from autogen_agentchat.base import TaskResult
 from autogen_agentchat.conditions import TextMentionTermination
@@ -10,14 +9,11 @@ from autogen_agentchat.teams import RoundRobinGroupChat
 from autogen_core import CancellationToken
 from autogen_core.models import ChatCompletionClient
 
+from model_clients import close_model_clients, get_model_client, read_model_config
 
-@cl.on_chat_start  # type: ignore
-async def start_chat() -> None:
-    # Load model configuration and create the model client.
-    with open("model_config.yaml", "r") as f:
-        model_config = yaml.safe_load(f)
-    model_client = ChatCompletionClient.load_component(model_config)
 
+def create_team(model_client: ChatCompletionClient) -> RoundRobinGroupChat:
+    """Create the assistant and critic team, ending when the critic approves."""
     # Create the assistant agent.
     assistant = AssistantAgent(
         name="assistant",
@@ -39,7 +35,23 @@ async def start_chat() -> None:
     termination = TextMentionTermination("APPROVE", sources=["critic"])
 
     # Chain the assistant and critic agents using RoundRobinGroupChat.
-    group_chat = RoundRobinGroupChat([assistant, critic], termination_condition=termination)
+    return RoundRobinGroupChat([assistant, critic], termination_condition=termination)
+
+
+@cl.on_app_shutdown  # type: ignore
+async def shutdown() -> None:
+    # Close the shared model clients and their connection pools.
+    await close_model_clients()
+
+
+@cl.on_chat_start  # type: ignore
+async def start_chat() -> None:
+    # Load model configuration and get the process-wide shared model client.
+    model_config = read_model_config("model_config.yaml")
+    model_client = get_model_client(model_config)
+
+    # Create the team.
+    group_chat = create_team(model_client)
 
     # Set the assistant agent in the user session.
     cl.user_session.set("prompt_history", "")  # type: ignore
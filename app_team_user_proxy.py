@@ -1,7 +1,6 @@
-from typing import List, cast
+from typing import Awaitable, Callable, List, cast
 
 import chainlit as cl
-import yaml
 from autogen_agentchat.agents import AssistantAgent, UserProxyAgent
 from autogen_agentchat.base import TaskResult
 from autogen_agentchat.conditions import TextMentionTermination
@@ -10,6 +9,8 @@ from autogen_agentchat.teams import RoundRobinGroupChat
 from autogen_core import CancellationToken
 from autogen_core.models import ChatCompletionClient
 
+from model_clients import close_model_clients, get_model_client, read_model_config
+
 
 async def user_input_func(prompt: str, cancellation_token: CancellationToken | None = None) -> str:
     """Get user input from the UI for the user proxy agent."""
@@ -44,13 +45,14 @@ async def user_action_func(prompt: str, cancellation_token: CancellationToken |
         return "User did not provide any input."
 
 
-@cl.on_chat_start  # type: ignore
-async def start_chat() -> None:
-    # Load model configuration and create the model client.
-    with open("model_config.yaml", "r") as f:
-        model_config = yaml.safe_load(f)
-    model_client = ChatCompletionClient.load_component(model_config)
+def create_team(
+    model_client: ChatCompletionClient,
+    input_func: Callable[..., Awaitable[str]] = user_action_func,
+) -> RoundRobinGroupChat:
+    """Create the assistant, critic and user proxy team, ending when the user approves.
 
+    The user proxy takes input as actions by default; pass input_func=user_input_func to take text instead.
+    """
     # Create the assistant agent.
     assistant = AssistantAgent(
         name="assistant",
@@ -71,15 +73,30 @@ async def start_chat() -> None:
     # Create the user proxy agent.
     user = UserProxyAgent(
         name="user",
-        # input_func=user_input_func, # Uncomment this line to use user input as text.
-        input_func=user_action_func,  # Uncomment this line to use user input as action.
+        input_func=input_func,
     )
 
     # Termination condition.
     termination = TextMentionTermination("APPROVE", sources=["user"])
 
     # Chain the assistant, critic and user agents using RoundRobinGroupChat.
-    group_chat = RoundRobinGroupChat([assistant, critic, user], termination_condition=termination)
+    return RoundRobinGroupChat([assistant, critic, user], termination_condition=termination)
+
+
+@cl.on_app_shutdown  # type: ignore
+async def shutdown() -> None:
+    # Close the shared model clients and their connection pools.
+    await close_model_clients()
+
+
+@cl.on_chat_start  # type: ignore
+async def start_chat() -> None:
+    # Load model configuration and get the process-wide shared model client.
+    model_config = read_model_config("model_config.yaml")
+    model_client = get_model_client(model_config)
+
+    # Create the team.
+    group_chat = create_team(model_client)
 
     # Set the assistant agent in the user session.
     cl.user_session.set("prompt_history", "")  # type: ignore
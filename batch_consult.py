@@ -0,0 +1,275 @@
+"""
+批量咨询
+不经过 Chainlit 界面，从 JSONL 文件读取企业需求，以有限并发调用 OverseasAdvisorySwarm.start_consultation，
+为每条需求写出对话记录、评分表和出海方案PDF，最后输出吞吐汇总（每小时咨询数、token 数、失败数）。
+
+输入文件每行一个 JSON 对象：{"id": "prospect-001", "message": "我们是一家……"}，id 缺省时使用行号。
+每条需求的结果写入 <output>/<id>/：transcript.md、scores.csv、plan.pdf 和 result.json；
+重新运行时跳过已有 result.json 的需求（--retry-failed 时重新咨询失败的需求），中断的咨询从检查点继续。
+
+用法：
+    python batch_consult.py prospects.jsonl --output outputs/batch --concurrency 4
+    python batch_consult.py prospects.jsonl --mode parallel --retry-failed
+"""
+
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import re
+import shutil
+import sys
+import time
+
+from app_swarm import OverseasAdvisorySwarm
+from model_clients import close_model_clients, read_model_config
+from pdf_service import PdfJob, close_pdf_service
+from swarm_cache import close_consultation_caches
+
+
+_UNSAFE_ID_PATTERN = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+@dataclass
+class BatchRecord:
+    """一条待咨询的需求"""
+
+    record_id: str
+    message: str
+
+
+@dataclass
+class RecordResult:
+    """一条需求的咨询结果"""
+
+    record_id: str
+    status: str  # completed 或 failed
+    wall_seconds: float
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    pdf_path: Optional[str] = None
+    error: Optional[str] = None
+
+
+def load_records(path: str) -> List[BatchRecord]:
+    """读取 JSONL 需求文件，跳过空行；缺少 message（或 requirement）字段时报错"""
+    records: List[BatchRecord] = []
+    seen = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            message = data.get("message") or data.get("requirement")
+            if not message:
+                raise ValueError(f"{path} 第 {line_number} 行缺少 message 字段")
+            record_id = _UNSAFE_ID_PATTERN.sub("_", str(data.get("id", line_number)))
+            if record_id in seen:
+                raise ValueError(f"{path} 第 {line_number} 行的 id 重复：{record_id}")
+            seen.add(record_id)
+            records.append(BatchRecord(record_id, message))
+    return records
+
+
+def _write_json(path: str, data: Dict[str, Any]) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_result(record_dir: str) -> Optional[Dict[str, Any]]:
+    """读取已有的 result.json，不存在或损坏时返回 None"""
+    try:
+        with open(os.path.join(record_dir, "result.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+async def run_record(swarm: OverseasAdvisorySwarm, record: BatchRecord, record_dir: str) -> RecordResult:
+    """咨询一条需求并写出对话记录、评分表、PDF和结果"""
+    os.makedirs(record_dir, exist_ok=True)
+    messages: List[str] = []
+    pdf_jobs: List[PdfJob] = []
+
+    async def collect(agent_name: str, content: str) -> None:
+        messages.append(f"## {agent_name}\n\n{content}")
+
+    async def track_pdf(job: PdfJob) -> None:
+        pdf_jobs.append(job)
+
+    # 同一条需求使用固定的检查点键，上次中断的咨询从检查点继续
+    swarm.checkpoint_key = f"batch-{record.record_id}"
+    checkpoint = swarm.load_checkpoint()
+    if checkpoint is not None and checkpoint.get("user_message") != record.message:
+        checkpoint = None
+
+    started = time.perf_counter()
+    error = await swarm.start_consultation(
+        record.message, callback=collect, pdf_callback=track_pdf, checkpoint=checkpoint
+    )
+    # 批量咨询没有追问，完成后检查点不再需要（失败时保留，重新运行时继续）
+    if not error:
+        await swarm.discard_checkpoint()
+    pdf_path = None
+    if pdf_jobs:
+        try:
+            pdf_path = os.path.join(record_dir, "plan.pdf")
+            # 复制而不是移动：outputs 中的PDF可能被咨询缓存引用（缓存命中时即为共享的缓存PDF）
+            shutil.copyfile(await pdf_jobs[-1], pdf_path)
+        except Exception as e:
+            pdf_path = None
+            error = error or f"PDF生成失败：{e}"
+    wall_seconds = time.perf_counter() - started
+
+    with open(os.path.join(record_dir, "transcript.md"), "w", encoding="utf-8") as f:
+        f.write(f"# 客户需求\n\n{record.message}\n\n" + "\n\n".join(messages) + "\n")
+    if swarm.analysis.evaluations:
+        swarm.analysis.export_scores(os.path.join(record_dir, "scores.csv"))
+
+    trace = swarm.last_trace
+    result = RecordResult(
+        record_id=record.record_id,
+        status="failed" if error else "completed",
+        wall_seconds=round(wall_seconds, 3),
+        prompt_tokens=trace.prompt_tokens if trace else 0,
+        completion_tokens=trace.completion_tokens if trace else 0,
+        pdf_path=pdf_path,
+        error=error,
+    )
+    _write_json(os.path.join(record_dir, "result.json"), asdict(result))
+    return result
+
+
+async def run_batch(
+    records: List[BatchRecord],
+    model_config: Dict[str, Any],
+    output_dir: str,
+    concurrency: int = 4,
+    execution_mode: Optional[str] = None,
+    retry_failed: bool = False,
+) -> Dict[str, Any]:
+    """
+    以有限并发咨询全部需求，已完成的需求直接跳过
+
+    Args:
+        records: 待咨询的需求
+        model_config: 模型配置（与 model_config.yaml 结构相同）
+        output_dir: 输出目录
+        concurrency: 同时进行的咨询数
+        execution_mode: 执行模式，默认读取 swarm.execution_mode
+        retry_failed: 是否重新咨询上次失败的需求，默认跳过
+
+    Returns:
+        Dict[str, Any]: 吞吐汇总
+    """
+    # 准入队列与批量并发一致，避免按界面的默认上限再次排队
+    swarm_config = dict(model_config.get("swarm") or {})
+    swarm_config["admission"] = {**(swarm_config.get("admission") or {}), "max_concurrent_consultations": concurrency}
+    model_config = {**model_config, "swarm": swarm_config}
+
+    pending: asyncio.Queue = asyncio.Queue()
+    skipped = 0
+    for record in records:
+        previous = load_result(os.path.join(output_dir, record.record_id))
+        status = previous.get("status") if previous else None
+        if status == "completed" or (status == "failed" and not retry_failed):
+            skipped += 1
+            continue
+        pending.put_nowait(record)
+
+    total = pending.qsize()
+    results: List[RecordResult] = []
+    started = time.perf_counter()
+
+    async def worker() -> None:
+        # 每个工作协程复用一个顾问团队，start_consultation 每次都会重置团队状态
+        swarm = OverseasAdvisorySwarm(model_config, execution_mode)
+        while True:
+            try:
+                record = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                result = await run_record(swarm, record, os.path.join(output_dir, record.record_id))
+            except Exception as e:
+                result = RecordResult(record.record_id, "failed", 0.0, error=str(e))
+            results.append(result)
+            mark = "✅" if result.status == "completed" else "❌"
+            print(f"{mark} [{len(results)}/{total}] {record.record_id} {result.wall_seconds:.1f}s {result.error or ''}")
+
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, total))))
+
+    wall_seconds = time.perf_counter() - started
+    completed = [result for result in results if result.status == "completed"]
+    prompt_tokens = sum(result.prompt_tokens for result in results)
+    completion_tokens = sum(result.completion_tokens for result in results)
+    summary = {
+        "records": len(records),
+        "skipped": skipped,
+        "completed": len(completed),
+        "failed": len(results) - len(completed),
+        "wall_seconds": round(wall_seconds, 3),
+        "consultations_per_hour": round(len(completed) / wall_seconds * 3600, 1) if wall_seconds > 0 else 0.0,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "tokens_per_consultation": round((prompt_tokens + completion_tokens) / len(completed)) if completed else 0,
+        "failures": {result.record_id: result.error for result in results if result.status != "completed"},
+    }
+    os.makedirs(output_dir, exist_ok=True)
+    _write_json(os.path.join(output_dir, "summary.json"), summary)
+    return summary
+
+
+def print_summary(summary: Dict[str, Any]) -> None:
+    """输出吞吐汇总"""
+    print("-" * 60)
+    print(
+        f"需求 {summary['records']} 条：完成 {summary['completed']}，失败 {summary['failed']}，"
+        f"跳过（已有结果）{summary['skipped']}"
+    )
+    print(f"用时 {summary['wall_seconds']:.1f}s，吞吐 {summary['consultations_per_hour']:.1f} 次咨询/小时")
+    print(
+        f"token：提示词 {summary['prompt_tokens']}，补全 {summary['completion_tokens']}，"
+        f"平均每次咨询 {summary['tokens_per_consultation']}"
+    )
+    for record_id, error in summary["failures"].items():
+        print(f"失败：{record_id} {error}")
+
+
+async def main(args: argparse.Namespace) -> int:
+    model_config = read_model_config(args.config)
+    records = load_records(args.input)
+    try:
+        summary = await run_batch(
+            records,
+            model_config,
+            args.output,
+            concurrency=args.concurrency,
+            execution_mode=args.mode,
+            retry_failed=args.retry_failed,
+        )
+    finally:
+        await close_model_clients()
+        close_consultation_caches()
+        await close_pdf_service()
+    print_summary(summary)
+    return 1 if summary["failed"] else 0
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="从 JSONL 文件批量运行出海咨询")
+    parser.add_argument("input", help="需求文件（JSONL，每行包含 id 和 message）")
+    parser.add_argument("--output", default=os.path.join("outputs", "batch"), help="输出目录")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时进行的咨询数")
+    parser.add_argument("--mode", choices=("selector", "parallel"), help="执行模式，默认读取 swarm.execution_mode")
+    parser.add_argument("--config", default="model_config.yaml", help="模型配置文件")
+    parser.add_argument("--retry-failed", action="store_true", help="重新咨询上次失败的需求（默认跳过）")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -0,0 +1,407 @@
+"""
+端到端性能基准
+使用离线模型客户端（offline_client.py）在无网络环境中运行四个应用的编排流程，
+按场景报告轮次、模型调用次数、token 数、编排 CPU 时间和端到端延迟，并可与基线结果对比以发现性能回退。
+
+用法：
+    python benchmark.py                                  # 运行全部场景
+    python benchmark.py --scenarios swarm_selector --repeat 5 --latency 0.05
+    python benchmark.py --json outputs/bench.json        # 保存结果
+    python benchmark.py --baseline outputs/bench.json    # 与基线对比，编排 CPU 时间回退超出容差时返回非零退出码
+    python benchmark.py --scenarios --pdf --pdf-scale 40 # 只运行 PDF 渲染基准（页/秒）
+"""
+
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import re
+import statistics
+import tempfile
+import sys
+import time
+
+from autogen_agentchat.base import Response, TaskResult
+from autogen_agentchat.messages import BaseChatMessage, TextMessage
+from autogen_core import CancellationToken
+
+from model_clients import get_model_client
+from offline_client import OfflineChatCompletionClient
+
+
+SCENARIOS = ("agent", "team", "team_user_proxy", "swarm_selector", "swarm_parallel")
+
+# 离线回放规则：评审通过、方案专家给出及格评分、资深顾问给出结束标记，使各流程按正常路径结束
+BENCHMARK_RESPONSES = [
+    {"match": "You are a critic", "content": "The response addresses the request well. APPROVE"},
+    {
+        "match": '请以"【方案专家】"开头',
+        "content": "【方案专家】\n对专家的评估：\n- 专业性：8/10\n- 完整性：8/10\n- 实用性：8/10\n"
+        "- 相关性：8/10\n- 创新性：7/10\n总体评分：8/10\n\n优点：分析完整。\n不足：可补充更多案例。\n\n"
+        '```json\n{"professionalism": 8, "completeness": 8, "practicality": 8, "relevance": 8, '
+        '"innovation": 7, "overall": 8, "strengths": ["分析完整"], "weaknesses": ["可补充更多案例"]}\n```',
+    },
+    {
+        "match": '请以"【资深顾问专家】"开头',
+        "content": "【资深顾问专家】\n## 整合方案\n综合各位专家的分析，形成完整的出海方案。\n\n出海方案完成",
+    },
+]
+
+BENCHMARK_TASKS = {
+    "agent": "Find the weather in New York City.",
+    "team": "Write a poem about the ocean.",
+    "team_user_proxy": "Write a poem about the ocean.",
+    "swarm_selector": "我们是一家做智能家居的中小企业，计划进入东南亚市场，请给出出海方案。",
+    "swarm_parallel": "我们是一家做智能家居的中小企业，计划进入东南亚市场，请给出出海方案。",
+}
+
+
+# PDF 基准中每位专家的章节模板（Markdown 标题、列表、表格和长段落），按 --pdf-scale 重复
+PDF_SECTION_TEMPLATE = """## 第{index}部分 分析要点
+东南亚智能家居市场处于快速增长期，**印尼、越南和泰国**是优先进入的国家。本地消费者对价格敏感，同时重视售后服务和品牌口碑。
+渠道方面，电商平台占比持续提升，线下渠道仍是建立信任的关键。企业应结合自身供应链优势，分阶段推进本地化运营。
+
+### 重点举措
+1. 建立本地合作伙伴网络
+   - 筛选具备售后能力的经销商
+   - 签订分级授权协议
+2. 完成产品认证与合规备案
+3. 搭建电商旗舰店并开展联合营销
+
+| 国家 | 市场规模 | 年增速 | 优先级 |
+|---|---|---|---|
+| 印尼 | 12亿美元 | 18% | 高 |
+| 越南 | 6亿美元 | 21% | 高 |
+| 泰国 | 8亿美元 | 15% | 中 |
+
+> 注意：各国数据保护法规对智能设备采集的数据有不同要求。
+
+"""
+
+PDF_PAGE_PATTERN = re.compile(rb"/Type\s*/Page(?![s\w])")
+
+
+@dataclass
+class RunResult:
+    """单次运行的结果"""
+
+    turns: int
+    llm_calls: int
+    prompt_tokens: int
+    completion_tokens: int
+    cpu_seconds: float
+    wall_seconds: float
+
+
+@dataclass
+class ScenarioReport:
+    """单个场景的汇总结果"""
+
+    scenario: str
+    runs: int
+    setup_seconds: float
+    turns: float
+    llm_calls: float
+    prompt_tokens: float
+    completion_tokens: float
+    cpu_ms_mean: float
+    wall_ms_mean: float
+    wall_ms_p50: float
+    wall_ms_p95: float
+    raw: List[RunResult] = field(default_factory=list)
+
+
+@dataclass
+class PdfBenchmarkReport:
+    """PDF 渲染基准结果"""
+
+    scale: int
+    pages: int
+    bytes: int
+    cold_seconds: float
+    warm_seconds_mean: float
+    pages_per_second: float
+
+
+def offline_model_config(args: argparse.Namespace) -> Dict[str, Any]:
+    """构造离线模型配置（与 model_config.yaml 结构相同）"""
+    return {
+        "provider": "offline_client.OfflineChatCompletionClient",
+        "config": {
+            "responses": BENCHMARK_RESPONSES,
+            "recording_path": args.recording,
+            "synthetic_tokens": args.synthetic_tokens,
+            "tool_arguments": {"get_weather": {"city": "New York"}},
+            "latency": args.latency,
+            "token_latency": args.token_latency,
+            "chunk_size": args.chunk_size,
+        },
+        # 基准运行不写出追踪文件
+        "swarm": {"metrics": {"trace_dir": None}},
+    }
+
+
+async def _auto_approve(prompt: str, cancellation_token: Optional[CancellationToken] = None) -> str:
+    """代替界面操作的用户代理输入：直接批准"""
+    return "APPROVE."
+
+
+async def _noop_callback(*args: Any) -> None:
+    pass
+
+
+async def prepare_scenario(
+    scenario: str, model_config: Dict[str, Any]
+) -> Callable[[], Awaitable[int]]:
+    """
+    创建场景所需的智能体或团队，返回执行一次任务并返回轮次数的协程函数
+
+    应用模块在这里按需导入，避免只运行部分场景时加载无关依赖
+    """
+    model_client = get_model_client(model_config)
+    task = BENCHMARK_TASKS[scenario]
+
+    if scenario == "agent":
+        import app_agent
+
+        # 工具函数被 cl.step 包装，需要 Chainlit 上下文，基准中直接使用原始函数
+        assistant = app_agent.create_assistant(model_client, tools=[inspect.unwrap(app_agent.get_weather)])
+
+        async def run_agent() -> int:
+            await assistant.on_reset(CancellationToken())
+            response: Optional[Response] = None
+            async for event in assistant.on_messages_stream(
+                [TextMessage(content=task, source="user")], CancellationToken()
+            ):
+                if isinstance(event, Response):
+                    response = event
+            if response is None:
+                raise RuntimeError("智能体未返回响应")
+            return 1
+
+        return run_agent
+
+    if scenario in ("team", "team_user_proxy"):
+        if scenario == "team":
+            import app_team
+
+            team = app_team.create_team(model_client)
+        else:
+            import app_team_user_proxy
+
+            team = app_team_user_proxy.create_team(model_client, input_func=_auto_approve)
+
+        async def run_team() -> int:
+            await team.reset()
+            result: Optional[TaskResult] = None
+            # 消费完整个事件流，团队才会回到可重置的状态
+            async for event in team.run_stream(task=task):
+                if isinstance(event, TaskResult):
+                    result = event
+            if result is None:
+                raise RuntimeError("团队未返回结果")
+            return sum(1 for message in result.messages[1:] if isinstance(message, BaseChatMessage))
+
+        return run_team
+
+    from app_swarm import OverseasAdvisorySwarm
+
+    swarm = OverseasAdvisorySwarm(model_config, execution_mode=scenario.split("_", 1)[1])
+
+    async def run_swarm() -> int:
+        error = await swarm.start_consultation(task, callback=_noop_callback, stream_callback=_noop_callback)
+        if error:
+            raise RuntimeError(error)
+        return swarm.last_trace.turns if swarm.last_trace else 0
+
+    return run_swarm
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_scenario(scenario: str, model_config: Dict[str, Any], repeat: int, warmup: int) -> ScenarioReport:
+    """运行一个场景：先预热，再重复运行并汇总"""
+    setup_started = time.perf_counter()
+    run_once = await prepare_scenario(scenario, model_config)
+    setup_seconds = time.perf_counter() - setup_started
+    model_client = get_model_client(model_config)
+    if not isinstance(model_client, OfflineChatCompletionClient):
+        raise TypeError("基准测试需要使用离线模型客户端")
+
+    for _ in range(warmup):
+        await run_once()
+
+    results: List[RunResult] = []
+    for _ in range(repeat):
+        model_client.reset()
+        cpu_started = time.process_time()
+        wall_started = time.perf_counter()
+        turns = await run_once()
+        wall_seconds = time.perf_counter() - wall_started
+        cpu_seconds = time.process_time() - cpu_started
+        usage = model_client.total_usage()
+        results.append(
+            RunResult(
+                turns=turns,
+                llm_calls=model_client.call_count,
+                prompt_tokens=usage.prompt_tokens,
+                completion_tokens=usage.completion_tokens,
+                cpu_seconds=cpu_seconds,
+                wall_seconds=wall_seconds,
+            )
+        )
+
+    walls = [r.wall_seconds * 1000 for r in results]
+    return ScenarioReport(
+        scenario=scenario,
+        runs=len(results),
+        setup_seconds=setup_seconds,
+        turns=statistics.mean(r.turns for r in results),
+        llm_calls=statistics.mean(r.llm_calls for r in results),
+        prompt_tokens=statistics.mean(r.prompt_tokens for r in results),
+        completion_tokens=statistics.mean(r.completion_tokens for r in results),
+        cpu_ms_mean=statistics.mean(r.cpu_seconds * 1000 for r in results),
+        wall_ms_mean=statistics.mean(walls),
+        wall_ms_p50=_percentile(walls, 50),
+        wall_ms_p95=_percentile(walls, 95),
+        raw=results,
+    )
+
+
+def print_reports(reports: List[ScenarioReport]) -> None:
+    """以表格形式输出结果"""
+    header = (
+        f"{'scenario':<18}{'runs':>5}{'setup_s':>9}{'turns':>7}{'calls':>7}{'prompt_tok':>12}"
+        f"{'compl_tok':>11}{'cpu_ms':>10}{'wall_ms':>10}{'p50_ms':>10}{'p95_ms':>10}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in reports:
+        print(
+            f"{r.scenario:<18}{r.runs:>5}{r.setup_seconds:>9.2f}{r.turns:>7.1f}{r.llm_calls:>7.1f}"
+            f"{r.prompt_tokens:>12.0f}{r.completion_tokens:>11.0f}{r.cpu_ms_mean:>10.1f}"
+            f"{r.wall_ms_mean:>10.1f}{r.wall_ms_p50:>10.1f}{r.wall_ms_p95:>10.1f}"
+        )
+
+
+def compare_with_baseline(reports: List[ScenarioReport], baseline_path: str, tolerance: float) -> List[str]:
+    """与基线结果对比编排 CPU 时间，返回超出容差的场景说明"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {item["scenario"]: item for item in json.load(f)["scenarios"]}
+    regressions: List[str] = []
+    for report in reports:
+        base = baseline.get(report.scenario)
+        if base is None or base["cpu_ms_mean"] <= 0:
+            continue
+        ratio = report.cpu_ms_mean / base["cpu_ms_mean"]
+        if ratio > 1 + tolerance:
+            regressions.append(
+                f"{report.scenario}: cpu_ms {base['cpu_ms_mean']:.1f} -> {report.cpu_ms_mean:.1f} (x{ratio:.2f})"
+            )
+    return regressions
+
+
+def run_pdf_benchmark(scale: int, repeat: int) -> PdfBenchmarkReport:
+    """
+    渲染由 Markdown 章节组成的大型建议书，统计页数和渲染速度
+
+    首次渲染包含字体注册和样式创建（冷启动），之后的渲染复用进程级的字体和样式
+    """
+    from pdf_report import EXPERT_SECTIONS, generate_overseas_plan_pdf
+
+    expert_analysis = {
+        expert_name: "".join(PDF_SECTION_TEMPLATE.format(index=index + 1) for index in range(scale))
+        for expert_name in EXPERT_SECTIONS
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "benchmark.pdf")
+        started = time.perf_counter()
+        generate_overseas_plan_pdf(BENCHMARK_TASKS["swarm_selector"], expert_analysis, path)
+        cold_seconds = time.perf_counter() - started
+
+        warm: List[float] = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            generate_overseas_plan_pdf(BENCHMARK_TASKS["swarm_selector"], expert_analysis, path)
+            warm.append(time.perf_counter() - started)
+        with open(path, "rb") as f:
+            data = f.read()
+
+    pages = len(PDF_PAGE_PATTERN.findall(data))
+    warm_mean = statistics.mean(warm) if warm else cold_seconds
+    return PdfBenchmarkReport(
+        scale=scale,
+        pages=pages,
+        bytes=len(data),
+        cold_seconds=cold_seconds,
+        warm_seconds_mean=warm_mean,
+        pages_per_second=pages / warm_mean if warm_mean > 0 else 0.0,
+    )
+
+
+async def main(args: argparse.Namespace) -> int:
+    model_config = offline_model_config(args)
+    reports = [
+        await run_scenario(scenario, model_config, args.repeat, args.warmup) for scenario in args.scenarios
+    ]
+    if reports:
+        print_reports(reports)
+
+    pdf_report: Optional[PdfBenchmarkReport] = None
+    if args.pdf:
+        pdf_report = run_pdf_benchmark(args.pdf_scale, args.repeat)
+        print(
+            f"pdf: scale={pdf_report.scale} pages={pdf_report.pages} size={pdf_report.bytes / 1024:.0f}KB "
+            f"cold={pdf_report.cold_seconds:.2f}s warm={pdf_report.warm_seconds_mean:.2f}s "
+            f"pages/s={pdf_report.pages_per_second:.1f}"
+        )
+
+    if args.json:
+        directory = os.path.dirname(args.json)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        data = {
+            "config": {key: value for key, value in vars(args).items() if key not in ("json", "baseline")},
+            "scenarios": [asdict(report) for report in reports],
+            "pdf": asdict(pdf_report) if pdf_report is not None else None,
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存：{args.json}")
+
+    if args.baseline:
+        regressions = compare_with_baseline(reports, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"性能回退：{line}")
+        if regressions:
+            return 1
+    return 0
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="使用离线模型客户端运行各应用的端到端性能基准")
+    parser.add_argument("--scenarios", nargs="*", choices=SCENARIOS, default=list(SCENARIOS), help="要运行的场景")
+    parser.add_argument("--repeat", type=int, default=3, help="每个场景的计时运行次数")
+    parser.add_argument("--warmup", type=int, default=1, help="每个场景的预热运行次数")
+    parser.add_argument("--latency", type=float, default=0.0, help="模拟的首 token 延迟（秒）")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="模拟的流式片段间隔（秒）")
+    parser.add_argument("--chunk-size", type=int, default=8, help="每个流式片段的字符数")
+    parser.add_argument("--synthetic-tokens", type=int, default=200, help="合成响应的 token 数")
+    parser.add_argument("--recording", help="回放的 JSONL 录制文件（见 model_config.yaml 的 recording 配置）")
+    parser.add_argument("--pdf", action="store_true", help="运行 PDF 渲染基准（页/秒）")
+    parser.add_argument("--pdf-scale", type=int, default=20, help="PDF 基准中每个章节重复的 Markdown 片段数")
+    parser.add_argument("--json", help="将结果保存为 JSON 文件")
+    parser.add_argument("--baseline", help="用于对比的基线 JSON 文件")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="编排 CPU 时间允许的回退比例")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
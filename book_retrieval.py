@@ -0,0 +1,317 @@
+"""
+《征途：中小企业全球营销实战》检索模块
+按书籍的章/节/小节结构切分 book.md，构建可持久化的 BM25 倒排索引，
+并以 AutoGen Memory 的形式为各专家智能体注入最相关的原文片段
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+import functools
+import hashlib
+import math
+import os
+import pickle
+import re
+
+from autogen_core import CancellationToken
+from autogen_core.memory import Memory, MemoryContent, MemoryMimeType, MemoryQueryResult, UpdateContextResult
+from autogen_core.model_context import ChatCompletionContext
+from autogen_core.models import SystemMessage
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BOOK_PATH = os.path.join(BASE_DIR, "book.md")
+INDEX_PATH = os.path.join(BASE_DIR, ".cache", "book_index.pickle")
+BOOK_TITLE = "《征途：中小企业全球营销实战》"
+
+# 索引格式版本，切分或分词规则变化时递增以使旧索引失效
+INDEX_VERSION = 1
+
+# 目录条目，如“第一节  组织管理：企业成长的幕后引擎 _ 002”
+_TOC_ENTRY = re.compile(r"^(?:.*?Contents\d*)?(.+?)\s+_\s+\d+$")
+_CHAPTER_LINE = re.compile(r"^第[一二三四五六七八九十]+章$")
+_SECTION_LINE = re.compile(r"^\d*(第[一二三四五六七八九十]+节)$")
+_SECTION_PREFIX = re.compile(r"^第[一二三四五六七八九十]+节\s+")
+_MARKDOWN_HEADING = re.compile(r"^#{1,6}\s+(.+)$")
+_NOISE_LINE = re.compile(r"^(?:\d+|[IVXLC]+|Chapter|Contents|Foreword|References)$")
+_RUNNING_HEADERS = ("征途中小企业全球营销实战", "目录Contents", "附录术语解释")
+
+_CJK_RUN = re.compile(r"[一-鿿]+")
+_WORD = re.compile(r"[a-z0-9]+")
+_QUOTED = re.compile(r"[\"“]([^\"”]+)[\"”]")
+
+
+@dataclass(frozen=True)
+class BookChunk:
+    """书籍片段"""
+
+    chunk_id: int
+    heading: str  # 标题路径，如“第二章 全球视野 > 战略领航：开启新市场的征程”
+    text: str
+
+
+def tokenize(text: str) -> List[str]:
+    """分词：中文按字符二元组切分，英文和数字按单词切分"""
+    tokens: List[str] = []
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    tokens.extend(_WORD.findall(text.lower()))
+    return tokens
+
+
+def _clean_line(line: str) -> str:
+    """去除分页页眉等噪声"""
+    line = line.strip()
+    for header in _RUNNING_HEADERS:
+        if line.startswith(header):
+            line = line[len(header):].strip()
+    if _NOISE_LINE.match(line):
+        return ""
+    return line
+
+
+def _split_passages(text: str, max_chars: int) -> List[str]:
+    """按句子边界把长文本切分为不超过 max_chars 的片段"""
+    sentences = re.split(r"(?<=[。！？；])", text)
+    passages: List[str] = []
+    current = ""
+    for sentence in sentences:
+        if current and len(current) + len(sentence) > max_chars:
+            passages.append(current)
+            current = ""
+        current += sentence
+    if current.strip():
+        passages.append(current)
+    return passages
+
+
+def chunk_book(text: str, max_chars: int = 600) -> List[BookChunk]:
+    """
+    按章/节/小节结构切分书籍文本
+
+    Args:
+        text: book.md 全文
+        max_chars: 单个片段的最大字符数
+
+    Returns:
+        List[BookChunk]: 书籍片段列表
+    """
+    lines = text.splitlines()
+
+    # 解析目录，得到章标题和节/小节标题
+    toc_titles = set()
+    chapter_titles: Dict[str, str] = {}
+    body_start = 0
+    pending_chapter: Optional[str] = None
+    for index, raw_line in enumerate(lines):
+        line = raw_line.strip()
+        entry = _TOC_ENTRY.match(line)
+        if entry:
+            toc_titles.add(_SECTION_PREFIX.sub("", entry.group(1)).strip())
+            body_start = index + 1
+        elif _CHAPTER_LINE.match(line):
+            if line in chapter_titles and body_start:
+                break
+            pending_chapter = line
+        elif pending_chapter and line:
+            chapter_titles[pending_chapter] = line
+            pending_chapter = None
+
+    chunks: List[BookChunk] = []
+    chapter = ""
+    section = ""
+    subsection = ""
+    buffer: List[str] = []
+    expect_section_title = False
+
+    def flush() -> None:
+        body = "".join(buffer).strip()
+        buffer.clear()
+        if not body:
+            return
+        heading = " > ".join(part for part in (chapter, section, subsection) if part)
+        for passage in _split_passages(body, max_chars):
+            chunks.append(BookChunk(chunk_id=len(chunks), heading=heading, text=passage.strip()))
+
+    for raw_line in lines[body_start:]:
+        line = _clean_line(raw_line)
+        if not line:
+            continue
+        if _CHAPTER_LINE.match(line):
+            title = f"{line} {chapter_titles.get(line, '')}".strip()
+            if title != chapter:
+                flush()
+                chapter, section, subsection = title, "", ""
+            continue
+        # 跳过每页重复出现的章标题（可能被拆成多行）
+        if chapter and len(line) >= 4 and line in chapter:
+            continue
+        if _SECTION_LINE.match(line):
+            expect_section_title = True
+            continue
+        if expect_section_title:
+            expect_section_title = False
+            flush()
+            section, subsection = line, ""
+            continue
+        heading = _MARKDOWN_HEADING.match(line)
+        if heading or line in toc_titles:
+            flush()
+            subsection = heading.group(1).strip() if heading else line
+            continue
+        buffer.append(line)
+    flush()
+    return chunks
+
+
+class BookIndex:
+    """基于 BM25 的书籍倒排索引"""
+
+    def __init__(self, chunks: List[BookChunk], k1: float = 1.5, b: float = 0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.doc_lengths: List[int] = []
+        for chunk in chunks:
+            tokens = tokenize(f"{chunk.heading} {chunk.text}")
+            self.doc_lengths.append(len(tokens))
+            term_freqs: Dict[str, int] = {}
+            for token in tokens:
+                term_freqs[token] = term_freqs.get(token, 0) + 1
+            for token, freq in term_freqs.items():
+                self.postings.setdefault(token, []).append((chunk.chunk_id, freq))
+        self.avg_doc_length = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0.0
+
+    def search(self, query: str, top_k: int = 3) -> List[Tuple[BookChunk, float]]:
+        """
+        检索与查询最相关的片段
+
+        Args:
+            query: 查询文本
+            top_k: 返回的片段数量
+
+        Returns:
+            List[Tuple[BookChunk, float]]: 按相关度降序排列的 (片段, 得分) 列表
+        """
+        scores: Dict[int, float] = {}
+        doc_count = len(self.chunks)
+        for token in set(tokenize(query)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, freq in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[chunk_id] / self.avg_doc_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * freq * (self.k1 + 1) / (freq + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(self.chunks[chunk_id], score) for chunk_id, score in ranked]
+
+    def save(self, path: str, source_hash: str) -> None:
+        """将索引持久化到磁盘"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"version": INDEX_VERSION, "source_hash": source_hash, "index": self}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, source_hash: str) -> Optional["BookIndex"]:
+        """从磁盘加载索引，版本或书籍内容不一致时返回 None"""
+        try:
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+        # 旧版本代码保存的索引可能引用已不存在的模块或类，同样视为需要重建
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+        if data.get("version") != INDEX_VERSION or data.get("source_hash") != source_hash:
+            return None
+        return data["index"]
+
+
+@functools.lru_cache(maxsize=None)
+def get_book_index(book_path: str = BOOK_PATH, index_path: str = INDEX_PATH) -> BookIndex:
+    """
+    获取书籍索引（进程内只加载一次），优先读取持久化索引，书籍变化时自动重建
+
+    Raises:
+        FileNotFoundError: 书籍文件不存在
+    """
+    with open(book_path, "rb") as f:
+        raw = f.read()
+    source_hash = hashlib.sha1(raw).hexdigest()
+    index = BookIndex.load(index_path, source_hash)
+    if index is None:
+        index = BookIndex(chunk_book(raw.decode("utf-8")))
+        try:
+            index.save(index_path, source_hash)
+        except OSError as e:
+            print(f"警告：书籍索引保存失败：{e}")
+    return index
+
+
+def methodology_query(prompt: str) -> str:
+    """从专家提示词中提取引用的书籍方法论标题，作为该专家的固定检索关注点"""
+    return " ".join(_QUOTED.findall(prompt))
+
+
+class BookMemory(Memory):
+    """
+    书籍检索记忆：每次推理前根据当前对话和专家关注点检索 top-k 书籍片段，
+    以系统消息的形式注入模型上下文
+    """
+
+    def __init__(self, index: BookIndex, focus: str = "", top_k: int = 3, query_chars: int = 1000):
+        self._index = index
+        self._focus = focus
+        self._top_k = top_k
+        self._query_chars = query_chars
+
+    async def update_context(self, model_context: ChatCompletionContext) -> UpdateContextResult:
+        messages = await model_context.get_messages()
+        # 以最近一条非系统消息为检索依据，叠加专家的方法论关注点
+        latest = next(
+            (str(message.content) for message in reversed(messages) if not isinstance(message, SystemMessage)),
+            "",
+        )
+        result = await self.query(f"{self._focus} {latest[-self._query_chars:]}")
+        if result.results:
+            passages = "\n\n".join(
+                f"[{memory.metadata.get('heading', '')}]\n{memory.content}" for memory in result.results
+            )
+            await model_context.add_message(
+                SystemMessage(content=f"以下是{BOOK_TITLE}中与当前任务最相关的原文摘录，请据此运用书中方法论：\n\n{passages}")
+            )
+        return UpdateContextResult(memories=result)
+
+    async def query(
+        self,
+        query: str | MemoryContent = "",
+        cancellation_token: CancellationToken | None = None,
+        **kwargs: Any,
+    ) -> MemoryQueryResult:
+        text = query.content if isinstance(query, MemoryContent) else query
+        hits = self._index.search(str(text), top_k=self._top_k)
+        return MemoryQueryResult(
+            results=[
+                MemoryContent(
+                    content=chunk.text,
+                    mime_type=MemoryMimeType.TEXT,
+                    metadata={"heading": chunk.heading, "score": score},
+                )
+                for chunk, score in hits
+            ]
+        )
+
+    async def add(self, content: MemoryContent, cancellation_token: CancellationToken | None = None) -> None:
+        """书籍检索记忆为只读：内容来自书籍索引，添加的内容被忽略"""
+        print("警告：书籍检索记忆为只读，已忽略添加的内容")
+
+    async def clear(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
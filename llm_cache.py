@@ -0,0 +1,207 @@
+"""
+基于 SQLite 的模型响应缓存
+使用 autogen_ext 的 ChatCompletionCache 包装模型客户端，缓存键由模型配置、消息、工具和调用参数的哈希组成，
+响应持久化到 SQLite，并按条目数、总大小和存活时间进行 LRU 淘汰；流式响应命中时按原始片段回放
+"""
+
+from typing import Any, Dict, List, Optional, Union
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from autogen_core import CacheStore
+from autogen_core.models import ChatCompletionClient, CreateResult
+from autogen_ext.models.cache import CHAT_CACHE_VALUE_TYPE, ChatCompletionCache
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_PATH = os.path.join(BASE_DIR, ".cache", "llm_cache.sqlite")
+
+# 不参与缓存命名空间计算的配置项（凭据类信息）
+_SECRET_CONFIG_KEYS = {"api_key", "azure_ad_token_provider"}
+
+# 读取时的最近访问时间先记在内存中，最多每隔这么多秒批量写回一次（淘汰前和关闭时也会写回）
+ACCESS_FLUSH_SECONDS = 60.0
+
+
+def _serialize(value: CHAT_CACHE_VALUE_TYPE) -> str:
+    """将 CreateResult 或流式片段列表序列化为 JSON"""
+    if isinstance(value, CreateResult):
+        return json.dumps(value.model_dump(mode="json"), ensure_ascii=False)
+    return json.dumps(
+        [item.model_dump(mode="json") if isinstance(item, CreateResult) else item for item in value],
+        ensure_ascii=False,
+    )
+
+
+class SQLiteCacheStore(CacheStore[CHAT_CACHE_VALUE_TYPE]):
+    """
+    SQLite 缓存存储
+
+    读取时返回 JSON 解析后的 dict/list，由 ChatCompletionCache 还原为 CreateResult。
+    读取只执行一次查询：最近访问时间暂存在内存中批量写回，过期条目留给写入时的淘汰统一删除，
+    避免在事件循环上每次命中都提交一次事务。
+
+    Args:
+        path: SQLite 数据库文件路径
+        namespace: 键命名空间（通常为模型配置的哈希），不同模型的缓存互不干扰
+        max_entries: 最大条目数，None 表示不限制
+        max_size_bytes: 缓存内容总大小上限，None 表示不限制
+        max_age_seconds: 条目最长存活时间，None 表示不过期
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        namespace: str = "",
+        max_entries: Optional[int] = 10000,
+        max_size_bytes: Optional[int] = 200 * 1024 * 1024,
+        max_age_seconds: Optional[float] = 7 * 24 * 3600,
+    ):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.max_size_bytes = max_size_bytes
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._pending_access: Dict[str, float] = {}
+        self._access_flushed_at = time.time()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache (last_access)")
+        self._conn.commit()
+
+    def _key(self, key: str) -> str:
+        return hashlib.sha256(f"{self.namespace}:{key}".encode()).hexdigest()
+
+    def get(self, key: str, default: Optional[CHAT_CACHE_VALUE_TYPE] = None) -> Optional[CHAT_CACHE_VALUE_TYPE]:
+        now = time.time()
+        hashed = self._key(key)
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (hashed,)).fetchone()
+            if row is None:
+                return default
+            value, created_at = row
+            if self.max_age_seconds is not None and now - created_at > self.max_age_seconds:
+                return default
+            self._pending_access[hashed] = now
+            if now - self._access_flushed_at >= ACCESS_FLUSH_SECONDS:
+                self._flush_access(now)
+                self._conn.commit()
+        return json.loads(value)
+
+    def set(self, key: str, value: CHAT_CACHE_VALUE_TYPE) -> None:
+        serialized = _serialize(value)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (self._key(key), serialized, len(serialized.encode("utf-8")), now, now),
+            )
+            self._flush_access(now)
+            self._evict(now)
+            self._conn.commit()
+
+    def _flush_access(self, now: float) -> None:
+        """把暂存的最近访问时间批量写回（由调用方提交事务）"""
+        if self._pending_access:
+            self._conn.executemany(
+                "UPDATE llm_cache SET last_access = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._pending_access.items()],
+            )
+            self._pending_access.clear()
+        self._access_flushed_at = now
+
+    def _evict(self, now: float) -> None:
+        """淘汰过期条目，再按最近访问时间淘汰超出条目数或总大小上限的条目"""
+        if self.max_age_seconds is not None:
+            self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.max_age_seconds,))
+        if self.max_entries is not None:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN "
+                    "(SELECT key FROM llm_cache ORDER BY last_access ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+        if self.max_size_bytes is not None:
+            (total,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+            if total > self.max_size_bytes:
+                expired: List[str] = []
+                for key, size in self._conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access ASC"):
+                    if total <= self.max_size_bytes:
+                        break
+                    expired.append(key)
+                    total -= size
+                self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", [(key,) for key in expired])
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._pending_access.clear()
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def close(self) -> None:
+        """写回暂存的访问时间并关闭数据库连接"""
+        with self._lock:
+            self._flush_access(time.time())
+            self._conn.commit()
+            self._conn.close()
+
+
+def config_namespace(component_config: Dict[str, Any]) -> str:
+    """根据模型组件配置（去除凭据后）计算缓存命名空间，模型或默认参数变化时缓存自动隔离"""
+    config = dict(component_config.get("config") or {})
+    for key in _SECRET_CONFIG_KEYS:
+        config.pop(key, None)
+    data = {"provider": component_config.get("provider"), "config": config}
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def wrap_with_cache(
+    client: ChatCompletionClient,
+    component_config: Dict[str, Any],
+    cache_config: Optional[Dict[str, Any]],
+) -> Union[ChatCompletionClient, ChatCompletionCache]:
+    """
+    按配置为模型客户端加上响应缓存
+
+    Args:
+        client: 原始模型客户端
+        component_config: 模型组件配置（provider/config），用于计算缓存命名空间
+        cache_config: model_config.yaml 中的 cache 配置段，未配置或 enabled 为 false 时不启用缓存
+
+    Returns:
+        ChatCompletionClient: 启用缓存时为 ChatCompletionCache，否则为原始客户端
+    """
+    if not cache_config or not cache_config.get("enabled", False):
+        return client
+
+    max_size_mb = cache_config.get("max_size_mb", 200)
+    max_age_hours = cache_config.get("max_age_hours", 168)
+    store = SQLiteCacheStore(
+        path=os.path.join(BASE_DIR, cache_config.get("path", DEFAULT_CACHE_PATH)),
+        namespace=config_namespace(component_config),
+        max_entries=cache_config.get("max_entries", 10000),
+        max_size_bytes=int(max_size_mb * 1024 * 1024) if max_size_mb is not None else None,
+        max_age_seconds=max_age_hours * 3600 if max_age_hours is not None else None,
+    )
+    return ChatCompletionCache(client, store)
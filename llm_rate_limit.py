@@ -0,0 +1,345 @@
+"""
+模型调用的进程级限流与重试
+同一模型服务（provider + base_url + model）的所有客户端共享一个滑动窗口限流器，按每分钟请求数（RPM）和
+每分钟 token 数（TPM）控制发出请求的速度；遇到 429 或服务端临时错误时按带抖动的指数退避重试，
+限流错误还会让同一服务的其他调用一起暂停，避免多个会话同时重试造成连锁失败
+"""
+
+from collections import deque
+from typing import Any, AsyncGenerator, Deque, Dict, List, Literal, Mapping, Optional, Sequence, Union
+import asyncio
+import hashlib
+import json
+import random
+import time
+
+from autogen_core import CancellationToken
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    LLMMessage,
+    ModelCapabilities,  # type: ignore
+    ModelInfo,
+    RequestUsage,
+)
+from autogen_core.tools import Tool, ToolSchema
+from pydantic import BaseModel
+
+from swarm_context import estimate_tokens
+from swarm_metrics import METRICS
+
+
+# 可重试的 HTTP 状态码：限流和服务端临时错误
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504, 529}
+# 可重试的网络错误（openai SDK 的异常类名）
+_RETRYABLE_ERROR_NAMES = {"RateLimitError", "APIConnectionError", "APITimeoutError", "InternalServerError"}
+
+WINDOW_SECONDS = 60.0
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """是否为模型服务的限流错误（HTTP 429）"""
+    return _status_code(error) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """是否为可重试的错误：限流、服务端临时错误或网络错误"""
+    return (
+        is_rate_limit_error(error)
+        or _status_code(error) in RETRYABLE_STATUS_CODES
+        or type(error).__name__ in _RETRYABLE_ERROR_NAMES
+    )
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """读取错误响应中的 Retry-After 头（秒），没有时返回 None"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class RateLimiter:
+    """
+    滑动窗口限流器：最近 60 秒内发出的请求数和 token 数不超过上限，超出时按到达顺序等待
+
+    Args:
+        requests_per_minute: 每分钟请求数上限，None 表示不限制
+        tokens_per_minute: 每分钟 token 数上限（提示词与补全之和），None 表示不限制
+    """
+
+    def __init__(self, requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        # 窗口内的请求：[发出时间, token 数]，请求完成后 token 数更新为实际用量
+        self._events: Deque[List[float]] = deque()
+        self._lock = asyncio.Lock()
+        self._paused_until = 0.0
+
+    def _prune(self, now: float) -> None:
+        while self._events and self._events[0][0] <= now - WINDOW_SECONDS:
+            self._events.popleft()
+
+    def _wait_seconds(self, now: float, tokens: int) -> float:
+        """距离可以发出请求还需等待的秒数"""
+        wait = self._paused_until - now
+        if self.requests_per_minute is not None and len(self._events) >= self.requests_per_minute:
+            oldest = self._events[len(self._events) - self.requests_per_minute]
+            wait = max(wait, oldest[0] + WINDOW_SECONDS - now)
+        if self.tokens_per_minute is not None:
+            excess = sum(event[1] for event in self._events) + tokens - self.tokens_per_minute
+            for event in self._events:
+                if excess <= 0:
+                    break
+                excess -= event[1]
+                wait = max(wait, event[0] + WINDOW_SECONDS - now)
+        return wait
+
+    async def acquire(self, tokens: int) -> List[float]:
+        """
+        等待直到可以发出预计消耗 tokens 的请求，返回窗口记录（请求完成后传给 settle 更新实际用量）
+
+        asyncio.Lock 按到达顺序唤醒等待者，先到的请求先发出
+        """
+        if self.tokens_per_minute is not None:
+            # 单个请求超过 TPM 上限时按上限计，避免永远等待
+            tokens = min(tokens, self.tokens_per_minute)
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._prune(now)
+                wait = self._wait_seconds(now, tokens)
+                if wait <= 0:
+                    break
+                waited += wait
+                await asyncio.sleep(wait)
+            event = [now, float(tokens)]
+            self._events.append(event)
+        if waited > 0:
+            METRICS.observe("llm_rate_limit_wait_seconds", "Time spent waiting for the rate limiter.", waited)
+        return event
+
+    def settle(self, event: List[float], tokens: int) -> None:
+        """按实际用量更新请求占用的 token 数"""
+        event[1] = float(tokens)
+
+    def pause(self, seconds: float) -> None:
+        """暂停发出新请求（收到限流错误时调用，同一服务的所有调用一起退避）"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+# 进程级限流器注册表：服务键 -> 限流器
+_limiters: Dict[str, RateLimiter] = {}
+
+
+def get_rate_limiter(key: str, requests_per_minute: Optional[int], tokens_per_minute: Optional[int]) -> RateLimiter:
+    """获取进程内共享的限流器，同一服务键只创建一次"""
+    limiter = _limiters.get(key)
+    if limiter is None:
+        limiter = _limiters[key] = RateLimiter(requests_per_minute, tokens_per_minute)
+    return limiter
+
+
+class RateLimitedChatCompletionClient(ChatCompletionClient):
+    """
+    限流包装器：每次调用前向限流器申请额度，失败时按带抖动的指数退避重试
+
+    Args:
+        client: 被包装的模型客户端
+        limiter: 共享的限流器
+        max_retries: 最大重试次数
+        backoff_base: 首次重试的退避上限（秒），之后每次翻倍
+        backoff_max: 单次退避的最长时间（秒）
+        default_completion_tokens: 未设置 max_tokens 时预估的补全 token 数
+    """
+
+    def __init__(
+        self,
+        client: ChatCompletionClient,
+        limiter: RateLimiter,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 30.0,
+        default_completion_tokens: int = 1024,
+    ):
+        self._client = client
+        self._limiter = limiter
+        self._max_retries = max_retries
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._default_completion_tokens = default_completion_tokens
+
+    def _estimate(
+        self, messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema], extra_create_args: Mapping[str, Any]
+    ) -> int:
+        """预估一次调用的 token 数：提示词 + 补全上限"""
+        try:
+            prompt_tokens = self._client.count_tokens(messages, tools=tools)
+        except Exception:
+            prompt_tokens = sum(estimate_tokens(str(getattr(m, "content", ""))) for m in messages)
+        return prompt_tokens + int(extra_create_args.get("max_tokens") or self._default_completion_tokens)
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        """第 attempt 次重试前的等待时间：全抖动指数退避，服务端给出 Retry-After 时不短于该值"""
+        delay = random.uniform(0, min(self._backoff_max, self._backoff_base * 2 ** attempt))
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self._backoff_max))
+        if is_rate_limit_error(error):
+            self._limiter.pause(delay)
+        return delay
+
+    async def _retry_or_raise(self, attempt: int, error: Exception) -> None:
+        if attempt >= self._max_retries or not is_retryable_error(error):
+            raise error
+        delay = self._backoff(attempt, error)
+        METRICS.inc("llm_retries_total", "Model calls retried after a transient error.", {"error": type(error).__name__})
+        print(f"警告：模型调用失败（{type(error).__name__}），{delay:.1f} 秒后第 {attempt + 1} 次重试")
+        await asyncio.sleep(delay)
+
+    @staticmethod
+    def _usage_tokens(result: CreateResult, estimated: int) -> int:
+        usage = result.usage
+        actual = usage.prompt_tokens + usage.completion_tokens if usage is not None else 0
+        return actual or estimated
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        tool_choice: Tool | Literal["auto", "required", "none"] = "auto",
+        json_output: Optional[bool | type[BaseModel]] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        estimated = self._estimate(messages, tools, extra_create_args)
+        attempt = 0
+        while True:
+            event = await self._limiter.acquire(estimated)
+            try:
+                result = await self._client.create(
+                    messages,
+                    tools=tools,
+                    tool_choice=tool_choice,
+                    json_output=json_output,
+                    extra_create_args=extra_create_args,
+                    cancellation_token=cancellation_token,
+                )
+            except Exception as e:
+                # 失败的请求不计 token，只占用请求数
+                self._limiter.settle(event, 0)
+                await self._retry_or_raise(attempt, e)
+                attempt += 1
+                continue
+            self._limiter.settle(event, self._usage_tokens(result, estimated))
+            return result
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        tool_choice: Tool | Literal["auto", "required", "none"] = "auto",
+        json_output: Optional[bool | type[BaseModel]] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        estimated = self._estimate(messages, tools, extra_create_args)
+        attempt = 0
+        while True:
+            event = await self._limiter.acquire(estimated)
+            started = False
+            try:
+                async for chunk in self._client.create_stream(
+                    messages,
+                    tools=tools,
+                    tool_choice=tool_choice,
+                    json_output=json_output,
+                    extra_create_args=extra_create_args,
+                    cancellation_token=cancellation_token,
+                ):
+                    started = True
+                    if isinstance(chunk, CreateResult):
+                        self._limiter.settle(event, self._usage_tokens(chunk, estimated))
+                    yield chunk
+                return
+            except Exception as e:
+                # 已输出片段后失败时无法透明重试
+                if started:
+                    raise
+                self._limiter.settle(event, 0)
+                await self._retry_or_raise(attempt, e)
+                attempt += 1
+
+    async def close(self) -> None:
+        await self._client.close()
+
+    def actual_usage(self) -> RequestUsage:
+        return self._client.actual_usage()
+
+    def total_usage(self) -> RequestUsage:
+        return self._client.total_usage()
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self._client.count_tokens(messages, tools=tools)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self._client.remaining_tokens(messages, tools=tools)
+
+    @property
+    def capabilities(self) -> ModelCapabilities:  # type: ignore
+        return self._client.capabilities  # type: ignore
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return self._client.model_info
+
+
+def limiter_key(component_config: Dict[str, Any]) -> str:
+    """模型服务键：provider、base_url 和模型名称相同的客户端共享限流额度（不含凭据）"""
+    config = component_config.get("config") or {}
+    data = [component_config.get("provider"), config.get("base_url"), config.get("model")]
+    return hashlib.sha256(json.dumps(data, default=str).encode()).hexdigest()
+
+
+def wrap_with_rate_limit(
+    client: ChatCompletionClient,
+    component_config: Dict[str, Any],
+    rate_limit_config: Optional[Dict[str, Any]],
+) -> Union[ChatCompletionClient, RateLimitedChatCompletionClient]:
+    """
+    按 model_config.yaml 的 rate_limit 配置段为模型客户端加上限流和重试
+
+    Args:
+        client: 原始模型客户端
+        component_config: 模型组件配置（provider/config），用于确定共享限流额度的模型服务
+        rate_limit_config: rate_limit 配置段，未配置或 enabled 为 false 时返回原始客户端
+    """
+    if not rate_limit_config or not rate_limit_config.get("enabled", True):
+        return client
+    limiter = get_rate_limiter(
+        limiter_key(component_config),
+        rate_limit_config.get("requests_per_minute"),
+        rate_limit_config.get("tokens_per_minute"),
+    )
+    return RateLimitedChatCompletionClient(
+        client,
+        limiter,
+        max_retries=rate_limit_config.get("max_retries", 5),
+        backoff_base=rate_limit_config.get("backoff_base", 1.0),
+        backoff_max=rate_limit_config.get("backoff_max", 30.0),
+        default_completion_tokens=rate_limit_config.get("default_completion_tokens", 1024),
+    )
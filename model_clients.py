@@ -0,0 +1,299 @@
+"""
+模型客户端创建与进程级共享
+model_config.yaml 顶层的 provider/config 为 AutoGen 模型组件配置（默认客户端），其余配置段（如 swarm、cache）为应用配置；
+models 段可定义其他命名客户端，按角色路由时使用（见 get_routed_model_client）。
+同一配置的模型客户端在进程内只创建一次，由所有会话和智能体共享，并复用带连接上限的 HTTP 连接池
+"""
+
+from typing import Any, AsyncGenerator, Dict, Literal, Mapping, Optional, Sequence, Tuple, Union
+import asyncio
+import hashlib
+import json
+import os
+
+import yaml
+from autogen_core import CancellationToken
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    LLMMessage,
+    ModelCapabilities,  # type: ignore
+    ModelInfo,
+    RequestUsage,
+)
+from autogen_core.tools import Tool, ToolSchema
+from pydantic import BaseModel
+
+from llm_cache import SQLiteCacheStore, wrap_with_cache
+from llm_rate_limit import wrap_with_rate_limit
+from offline_client import wrap_with_recording
+
+
+# model_config.yaml 中不属于模型组件配置的应用配置段
+APP_CONFIG_SECTIONS = ("swarm", "cache", "connection_pool", "recording", "rate_limit", "models")
+
+# 默认客户端（model_config.yaml 顶层的 provider/config）的名称
+DEFAULT_CLIENT_NAME = "default"
+
+# 进程级模型客户端注册表：配置哈希 -> 模型客户端
+_client_registry: Dict[str, ChatCompletionClient] = {}
+
+# 已读取的配置文件缓存：路径 -> (修改时间, 配置)
+_config_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+
+def read_model_config(path: str = "model_config.yaml") -> Dict[str, Any]:
+    """
+    读取模型配置文件，文件未修改时直接返回上次解析的结果
+
+    Raises:
+        FileNotFoundError: 配置文件不存在
+    """
+    mtime = os.path.getmtime(path)
+    cached = _config_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, "r", encoding="utf-8") as f:
+            cached = (mtime, yaml.safe_load(f))
+        _config_cache[path] = cached
+    return cached[1]
+
+
+def model_component_config(model_config: Dict[str, Any]) -> Dict[str, Any]:
+    """去除应用配置段，得到可传给 ChatCompletionClient.load_component 的组件配置"""
+    return {key: value for key, value in model_config.items() if key not in APP_CONFIG_SECTIONS}
+
+
+def _openai_client_class(component_config: Dict[str, Any]) -> Optional[type]:
+    """组件配置的 provider 为基于 OpenAI SDK 的客户端时返回其类，否则返回 None"""
+    from autogen_ext.models.openai import AzureOpenAIChatCompletionClient, OpenAIChatCompletionClient
+
+    client_classes = {
+        "OpenAIChatCompletionClient": OpenAIChatCompletionClient,
+        "openai_chat_completion_client": OpenAIChatCompletionClient,
+        "AzureOpenAIChatCompletionClient": AzureOpenAIChatCompletionClient,
+        "azure_openai_chat_completion_client": AzureOpenAIChatCompletionClient,
+    }
+    return client_classes.get(str(component_config.get("provider", "")).rsplit(".", 1)[-1])
+
+
+def _load_pooled_client(component_config: Dict[str, Any], pool_config: Dict[str, Any]) -> ChatCompletionClient:
+    """
+    创建基于 OpenAI SDK 的客户端，构造时传入带连接上限和长连接保持的 HTTP 连接池（随客户端一起关闭）；
+    其他 provider 不支持配置连接池，按组件配置正常创建
+    """
+    client_class = _openai_client_class(component_config)
+    if client_class is None:
+        print(f"警告：{component_config.get('provider')} 不支持配置连接池，已忽略 connection_pool 配置")
+        return ChatCompletionClient.load_component(component_config)
+
+    import httpx
+    from openai import DefaultAsyncHttpxClient
+    from pydantic import SecretStr
+
+    # 与 load_component 相同的配置校验和转换，额外传入 http_client
+    config = client_class.component_config_schema.model_validate(component_config.get("config") or {})
+    kwargs = config.model_dump(exclude_none=True)
+    if isinstance(config.api_key, SecretStr):
+        kwargs["api_key"] = config.api_key.get_secret_value()
+    if "azure_ad_token_provider" in kwargs:
+        from autogen_ext.auth.azure import AzureTokenProvider
+
+        kwargs["azure_ad_token_provider"] = AzureTokenProvider.load_component(kwargs["azure_ad_token_provider"])
+    http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=pool_config.get("max_connections", 100),
+            max_keepalive_connections=pool_config.get("max_keepalive_connections", 20),
+            keepalive_expiry=pool_config.get("keepalive_expiry", 30),
+        )
+    )
+    return client_class(**kwargs, http_client=http_client)
+
+
+def load_model_client(model_config: Dict[str, Any]) -> ChatCompletionClient:
+    """
+    根据 model_config.yaml 的内容创建新的模型客户端，配置了 cache 段时启用响应缓存，
+    配置了 recording 段时把真实响应录制为离线回放文件（只录制未命中缓存的响应），
+    配置了 rate_limit 段时按模型服务共享的限流额度发出请求并重试临时错误（缓存命中不占用额度），
+    此时基于 OpenAI SDK 的客户端默认关闭 SDK 自身的重试（max_retries 为 0），重试统一由限流包装器负责
+
+    Args:
+        model_config: model_config.yaml 解析后的字典
+
+    Returns:
+        ChatCompletionClient: 模型客户端
+    """
+    component_config = model_component_config(model_config)
+    client_config = component_config
+    rate_limit_config = model_config.get("rate_limit")
+    if rate_limit_config and rate_limit_config.get("enabled", True) and _openai_client_class(component_config):
+        # SDK 的每次重试都是一次额外请求，会绕过限流包装器共享的 429 暂停和请求数计数；显式配置的 max_retries 仍然生效
+        client_config = {**component_config, "config": {"max_retries": 0, **(component_config.get("config") or {})}}
+    pool_config = model_config.get("connection_pool")
+    if pool_config:
+        client = _load_pooled_client(client_config, pool_config)
+    else:
+        client = ChatCompletionClient.load_component(client_config)
+    client = wrap_with_rate_limit(client, component_config, model_config.get("rate_limit"))
+    client = wrap_with_recording(client, model_config.get("recording"))
+    return wrap_with_cache(client, component_config, model_config.get("cache"))
+
+
+def _config_key(model_config: Dict[str, Any]) -> str:
+    """计算注册表键（只保存哈希，不保存凭据原文）"""
+    data = {key: model_config.get(key) for key in model_config if key not in ("swarm", "models")}
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def get_model_client(model_config: Dict[str, Any]) -> ChatCompletionClient:
+    """
+    获取进程内共享的模型客户端，相同配置只创建一次
+
+    Args:
+        model_config: model_config.yaml 解析后的字典
+
+    Returns:
+        ChatCompletionClient: 共享的模型客户端，调用方不应自行关闭
+    """
+    key = _config_key(model_config)
+    client = _client_registry.get(key)
+    if client is None:
+        client = load_model_client(model_config)
+        _client_registry[key] = client
+    return client
+
+
+async def _close_client(client: ChatCompletionClient) -> None:
+    """关闭模型客户端，启用了响应缓存时同时关闭其 SQLite 缓存存储"""
+    try:
+        await client.close()
+    finally:
+        store = getattr(client, "store", None)
+        if isinstance(store, SQLiteCacheStore):
+            store.close()
+
+
+async def close_model_clients() -> None:
+    """关闭所有共享模型客户端及其连接池和缓存存储，在应用退出时调用"""
+    clients = list(_client_registry.values())
+    _client_registry.clear()
+    results = await asyncio.gather(*(_close_client(client) for client in clients), return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"警告：关闭模型客户端时出错：{result}")
+
+
+def named_model_config(model_config: Dict[str, Any], name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    命名客户端的完整配置：models 段中的 provider/config，加上顶层的 cache、rate_limit 等应用配置
+
+    Args:
+        model_config: model_config.yaml 解析后的字典
+        name: models 段中的客户端名称，None 或 default 表示顶层的默认客户端
+
+    Raises:
+        ValueError: models 段中没有该名称
+    """
+    if name is None or name == DEFAULT_CLIENT_NAME:
+        return model_config
+    models = model_config.get("models") or {}
+    if name not in models:
+        raise ValueError(f"model_config.yaml 的 models 段中未定义模型客户端：{name}")
+    shared = {key: value for key, value in model_config.items() if key in APP_CONFIG_SECTIONS and key != "models"}
+    return {**shared, **models[name]}
+
+
+class CreateArgsChatCompletionClient(ChatCompletionClient):
+    """
+    为每次调用加上默认参数（如 max_tokens、temperature）的包装器，调用方显式传入的参数优先；
+    底层共享客户端不变，不同角色使用不同参数时仍共用同一连接池
+
+    Args:
+        client: 共享的模型客户端
+        create_args: 默认调用参数
+    """
+
+    def __init__(self, client: ChatCompletionClient, create_args: Mapping[str, Any]):
+        self._client = client
+        self._create_args = dict(create_args)
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        tool_choice: Tool | Literal["auto", "required", "none"] = "auto",
+        json_output: Optional[bool | type[BaseModel]] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        return await self._client.create(
+            messages,
+            tools=tools,
+            tool_choice=tool_choice,
+            json_output=json_output,
+            extra_create_args={**self._create_args, **extra_create_args},
+            cancellation_token=cancellation_token,
+        )
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        tool_choice: Tool | Literal["auto", "required", "none"] = "auto",
+        json_output: Optional[bool | type[BaseModel]] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        async for chunk in self._client.create_stream(
+            messages,
+            tools=tools,
+            tool_choice=tool_choice,
+            json_output=json_output,
+            extra_create_args={**self._create_args, **extra_create_args},
+            cancellation_token=cancellation_token,
+        ):
+            yield chunk
+
+    async def close(self) -> None:
+        # 底层客户端由注册表统一关闭
+        pass
+
+    def actual_usage(self) -> RequestUsage:
+        return self._client.actual_usage()
+
+    def total_usage(self) -> RequestUsage:
+        return self._client.total_usage()
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self._client.count_tokens(messages, tools=tools)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self._client.remaining_tokens(messages, tools=tools)
+
+    @property
+    def capabilities(self) -> ModelCapabilities:  # type: ignore
+        return self._client.capabilities  # type: ignore
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return self._client.model_info
+
+
+def get_routed_model_client(
+    model_config: Dict[str, Any], route: Optional[Mapping[str, Any]] = None
+) -> ChatCompletionClient:
+    """
+    按路由获取模型客户端
+
+    Args:
+        model_config: model_config.yaml 解析后的字典
+        route: 路由项，client 为 models 段中的客户端名称（缺省为默认客户端），
+            其余键（如 max_tokens、temperature）作为该角色每次调用的默认参数
+
+    Returns:
+        ChatCompletionClient: 共享的模型客户端，有默认调用参数时为包装后的客户端
+    """
+    route = dict(route or {})
+    client = get_model_client(named_model_config(model_config, route.pop("client", None)))
+    return CreateArgsChatCompletionClient(client, route) if route else client
@@ -0,0 +1,418 @@
+"""
+离线模型客户端
+不访问网络的确定性 ChatCompletionClient，按规则回放录制的或合成的响应，支持可配置的首 token 延迟和逐片段流式输出，
+用于在没有大模型的沙箱中运行各应用、测量编排开销（见 benchmark.py）。
+
+在 model_config.yaml 中使用：
+
+    provider: offline_client.OfflineChatCompletionClient
+    config:
+      latency: 0.2
+      responses:
+        - match: "You are a critic"
+          content: "APPROVE"
+
+同时提供 RecordingChatCompletionClient，把真实模型的文本响应录制为可直接回放的 JSONL 规则文件。
+"""
+
+from typing import Any, AsyncGenerator, Dict, List, Literal, Mapping, Optional, Sequence, Union
+import asyncio
+import json
+import os
+import re
+
+from autogen_core import CancellationToken, Component, FunctionCall
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    FunctionExecutionResultMessage,
+    LLMMessage,
+    ModelCapabilities,  # type: ignore
+    ModelFamily,
+    ModelInfo,
+    RequestUsage,
+    SystemMessage,
+    UserMessage,
+)
+from autogen_core.tools import Tool, ToolSchema
+from pydantic import BaseModel
+
+from swarm_context import estimate_tokens
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 从系统提示词中提取回复标签，如“请以"【市场分析专家】"开头”
+DEFAULT_TAG_PATTERN = r'请以["“](【[^】]+】)["”]开头'
+
+# 合成响应的填充文本
+_FILLER = "这是离线模型客户端生成的合成内容，用于在没有大模型的环境中测量编排开销。"
+
+
+class OfflineResponseRule(BaseModel):
+    """回放规则：match 为正则表达式，在系统消息和最后一条消息的文本中搜索"""
+
+    match: str
+    content: str
+
+
+class OfflineChatCompletionClientConfig(BaseModel):
+    """离线模型客户端配置"""
+
+    responses: List[OfflineResponseRule] = []
+    recording_path: Optional[str] = None
+    default_response: str = "{tag}{filler}"
+    synthetic_tokens: int = 200
+    tag_pattern: str = DEFAULT_TAG_PATTERN
+    tool_arguments: Dict[str, Dict[str, Any]] = {}
+    latency: float = 0.0
+    token_latency: float = 0.0
+    chunk_size: int = 8
+    model_info: Optional[ModelInfo] = None
+
+
+def _message_text(message: LLMMessage) -> str:
+    content = message.content
+    return content if isinstance(content, str) else str(content)
+
+
+def load_recorded_rules(path: str) -> List[OfflineResponseRule]:
+    """读取 JSONL 录制文件，每行一条 {"match": ..., "content": ...} 规则"""
+    rules: List[OfflineResponseRule] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                rules.append(OfflineResponseRule.model_validate_json(line))
+    return rules
+
+
+class OfflineChatCompletionClient(ChatCompletionClient, Component[OfflineChatCompletionClientConfig]):
+    """
+    离线回放模型客户端
+
+    响应的确定顺序：
+    - 提供了工具、允许调用工具且最后一条消息不是工具结果时，调用第一个工具（参数取自 tool_arguments 或按参数类型合成）
+    - 第一条匹配的规则；同一 match 的多条规则（如录制的多轮输出）按调用次数依次轮换
+    - default_response，其中 {tag} 替换为系统提示词要求的回复标签，{filler} 替换为约 synthetic_tokens 个 token 的填充文本
+
+    Args:
+        responses: 回放规则列表
+        recording_path: JSONL 录制文件路径（相对路径以项目目录为基准），其规则排在 responses 之后
+        default_response: 未匹配任何规则时的响应模板
+        synthetic_tokens: 默认响应中填充文本的 token 数（估算值）
+        tag_pattern: 从系统提示词中提取回复标签的正则表达式，第一个分组为标签
+        tool_arguments: 工具名称 -> 调用参数
+        latency: 首 token 前的模拟延迟（秒）
+        token_latency: 每个流式片段之间的模拟延迟（秒）
+        chunk_size: 每个流式片段的字符数
+        model_info: 模型信息，默认支持函数调用
+    """
+
+    component_type = "model"
+    component_config_schema = OfflineChatCompletionClientConfig
+    component_provider_override = "offline_client.OfflineChatCompletionClient"
+
+    def __init__(
+        self,
+        responses: Optional[Sequence[Union[OfflineResponseRule, Dict[str, str]]]] = None,
+        recording_path: Optional[str] = None,
+        default_response: str = "{tag}{filler}",
+        synthetic_tokens: int = 200,
+        tag_pattern: str = DEFAULT_TAG_PATTERN,
+        tool_arguments: Optional[Dict[str, Dict[str, Any]]] = None,
+        latency: float = 0.0,
+        token_latency: float = 0.0,
+        chunk_size: int = 8,
+        model_info: Optional[ModelInfo] = None,
+    ):
+        self._responses = [
+            rule if isinstance(rule, OfflineResponseRule) else OfflineResponseRule.model_validate(rule)
+            for rule in responses or []
+        ]
+        self._recording_path = recording_path
+        rules = list(self._responses)
+        if recording_path:
+            rules.extend(load_recorded_rules(os.path.join(BASE_DIR, recording_path)))
+        self._rules = [(re.compile(rule.match), rule) for rule in rules]
+        self._default_response = default_response
+        self._synthetic_tokens = synthetic_tokens
+        self._tag_pattern = re.compile(tag_pattern)
+        self._tool_arguments = dict(tool_arguments or {})
+        self._latency = latency
+        self._token_latency = token_latency
+        self._chunk_size = max(1, chunk_size)
+        self._model_info = model_info or ModelInfo(
+            vision=False,
+            function_calling=True,
+            json_output=False,
+            family=ModelFamily.UNKNOWN,
+            structured_output=False,
+        )
+        self._rule_counts: Dict[str, int] = {}
+        self._cur_usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+        self._total_usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+        self.call_count = 0
+
+    def reset(self) -> None:
+        """重置规则轮换位置、调用次数和 token 用量"""
+        self._rule_counts.clear()
+        self._cur_usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+        self._total_usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+        self.call_count = 0
+
+    def _tool_call(self, tools: Sequence[Tool | ToolSchema]) -> FunctionCall:
+        """为第一个工具生成调用，未配置参数时按 JSON Schema 的参数类型合成"""
+        tool = tools[0]
+        schema = tool.schema if isinstance(tool, Tool) else tool
+        arguments = self._tool_arguments.get(schema["name"])
+        if arguments is None:
+            parameters = schema.get("parameters") or {}
+            properties = parameters.get("properties", {})
+            samples = {"string": "offline", "integer": 1, "number": 1.0, "boolean": True, "array": [], "object": {}}
+            arguments = {
+                name: samples.get(properties.get(name, {}).get("type", "string"), "offline")
+                for name in parameters.get("required", [])
+            }
+        return FunctionCall(id=f"offline_call_{self.call_count}", name=schema["name"], arguments=json.dumps(arguments))
+
+    def _respond(
+        self,
+        messages: Sequence[LLMMessage],
+        tools: Sequence[Tool | ToolSchema],
+        tool_choice: Tool | Literal["auto", "required", "none"],
+    ) -> CreateResult:
+        self.call_count += 1
+        prompt_tokens = sum(estimate_tokens(_message_text(message)) for message in messages)
+        last = messages[-1] if messages else None
+
+        content: Union[str, List[FunctionCall]]
+        if tools and tool_choice != "none" and isinstance(last, UserMessage):
+            content = [self._tool_call(tools)]
+        else:
+            system_text = "\n".join(_message_text(m) for m in messages if isinstance(m, SystemMessage))
+            probe = f"{system_text}\n{_message_text(last) if last is not None else ''}"
+            content = self._match_rule(probe) or self._synthesize(system_text, last)
+
+        completion_tokens = estimate_tokens(content) if isinstance(content, str) else len(content) * 20
+        self._cur_usage = RequestUsage(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        self._total_usage = RequestUsage(
+            prompt_tokens=self._total_usage.prompt_tokens + prompt_tokens,
+            completion_tokens=self._total_usage.completion_tokens + completion_tokens,
+        )
+        return CreateResult(
+            finish_reason="function_calls" if isinstance(content, list) else "stop",
+            content=content,
+            usage=self._cur_usage,
+            cached=False,
+        )
+
+    def _match_rule(self, probe: str) -> Optional[str]:
+        first_match: Optional[str] = None
+        candidates: List[OfflineResponseRule] = []
+        for pattern, rule in self._rules:
+            if first_match is None and pattern.search(probe):
+                first_match = rule.match
+            if first_match is not None and rule.match == first_match:
+                candidates.append(rule)
+        if first_match is None:
+            return None
+        count = self._rule_counts.get(first_match, 0)
+        self._rule_counts[first_match] = count + 1
+        return candidates[count % len(candidates)].content
+
+    def _synthesize(self, system_text: str, last: Optional[LLMMessage]) -> str:
+        tag_match = self._tag_pattern.search(system_text)
+        tag = f"{tag_match.group(1)}\n" if tag_match else ""
+        filler = ""
+        if self._synthetic_tokens > 0:
+            repeats = self._synthetic_tokens // estimate_tokens(_FILLER) + 1
+            filler = _FILLER * repeats
+        if isinstance(last, FunctionExecutionResultMessage):
+            filler = "\n".join(result.content for result in last.content)
+        return self._default_response.format(tag=tag, filler=filler)
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        tool_choice: Tool | Literal["auto", "required", "none"] = "auto",
+        json_output: Optional[bool | type[BaseModel]] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        result = self._respond(messages, tools, tool_choice)
+        chunks = len(result.content) // self._chunk_size + 1 if isinstance(result.content, str) else 1
+        delay = self._latency + self._token_latency * chunks
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return result
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        tool_choice: Tool | Literal["auto", "required", "none"] = "auto",
+        json_output: Optional[bool | type[BaseModel]] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        result = self._respond(messages, tools, tool_choice)
+        if self._latency > 0:
+            await asyncio.sleep(self._latency)
+        if isinstance(result.content, str):
+            for start in range(0, len(result.content), self._chunk_size):
+                if start and self._token_latency > 0:
+                    await asyncio.sleep(self._token_latency)
+                yield result.content[start:start + self._chunk_size]
+        yield result
+
+    async def close(self) -> None:
+        pass
+
+    def actual_usage(self) -> RequestUsage:
+        return self._cur_usage
+
+    def total_usage(self) -> RequestUsage:
+        return self._total_usage
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return sum(estimate_tokens(_message_text(message)) for message in messages)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return max(0, 128000 - self.count_tokens(messages, tools=tools))
+
+    @property
+    def capabilities(self) -> ModelCapabilities:  # type: ignore
+        return self._model_info
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return self._model_info
+
+    def _to_config(self) -> OfflineChatCompletionClientConfig:
+        return OfflineChatCompletionClientConfig(
+            responses=self._responses,
+            recording_path=self._recording_path,
+            default_response=self._default_response,
+            synthetic_tokens=self._synthetic_tokens,
+            tag_pattern=self._tag_pattern.pattern,
+            tool_arguments=self._tool_arguments,
+            latency=self._latency,
+            token_latency=self._token_latency,
+            chunk_size=self._chunk_size,
+            model_info=self._model_info,
+        )
+
+    @classmethod
+    def _from_config(cls, config: OfflineChatCompletionClientConfig) -> "OfflineChatCompletionClient":
+        return cls(**config.model_dump())
+
+
+class RecordingChatCompletionClient(ChatCompletionClient):
+    """
+    录制包装器：透传真实模型客户端的调用，并把每次文本响应追加为一条回放规则，
+    规则以系统提示词开头部分为匹配条件，录制文件可直接作为 OfflineChatCompletionClient 的 recording_path
+
+    Args:
+        client: 被录制的模型客户端
+        path: JSONL 录制文件路径
+        match_chars: 用作匹配条件的系统提示词前缀长度
+    """
+
+    def __init__(self, client: ChatCompletionClient, path: str, match_chars: int = 200):
+        self._client = client
+        self._path = path
+        self._match_chars = match_chars
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _record(self, messages: Sequence[LLMMessage], result: CreateResult) -> None:
+        if not isinstance(result.content, str):
+            return
+        system_text = next((_message_text(m) for m in messages if isinstance(m, SystemMessage)), "")
+        key = system_text[:self._match_chars] or (_message_text(messages[-1])[:self._match_chars] if messages else "")
+        rule = OfflineResponseRule(match=re.escape(key), content=result.content)
+        with open(self._path, "a", encoding="utf-8") as f:
+            f.write(rule.model_dump_json() + "\n")
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        tool_choice: Tool | Literal["auto", "required", "none"] = "auto",
+        json_output: Optional[bool | type[BaseModel]] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        result = await self._client.create(
+            messages,
+            tools=tools,
+            tool_choice=tool_choice,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+        self._record(messages, result)
+        return result
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        tool_choice: Tool | Literal["auto", "required", "none"] = "auto",
+        json_output: Optional[bool | type[BaseModel]] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        async for chunk in self._client.create_stream(
+            messages,
+            tools=tools,
+            tool_choice=tool_choice,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        ):
+            if isinstance(chunk, CreateResult):
+                self._record(messages, chunk)
+            yield chunk
+
+    async def close(self) -> None:
+        await self._client.close()
+
+    def actual_usage(self) -> RequestUsage:
+        return self._client.actual_usage()
+
+    def total_usage(self) -> RequestUsage:
+        return self._client.total_usage()
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self._client.count_tokens(messages, tools=tools)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self._client.remaining_tokens(messages, tools=tools)
+
+    @property
+    def capabilities(self) -> ModelCapabilities:  # type: ignore
+        return self._client.capabilities  # type: ignore
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return self._client.model_info
+
+
+def wrap_with_recording(
+    client: ChatCompletionClient, recording_config: Optional[Dict[str, Any]]
+) -> Union[ChatCompletionClient, RecordingChatCompletionClient]:
+    """按 model_config.yaml 的 recording 配置段为模型客户端加上录制，未配置 path 时返回原始客户端"""
+    if not recording_config or not recording_config.get("path"):
+        return client
+    return RecordingChatCompletionClient(
+        client,
+        os.path.join(BASE_DIR, recording_config["path"]),
+        match_chars=recording_config.get("match_chars", 200),
+    )
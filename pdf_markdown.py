@@ -0,0 +1,292 @@
+"""
+Markdown 到 reportlab flowables 的转换
+逐行解析专家输出中的标题、有序/无序列表（含嵌套）、表格、引用和分隔线，并转换行内的粗体/斜体标记；
+普通段落按句子边界切分为适中长度，避免把整段长文本放进一个 Paragraph（reportlab 对超长段落的断行和分页开销急剧上升）
+"""
+
+from typing import Any, Dict, Iterable, List, Type
+import re
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import Flowable, Paragraph, Spacer, Table, TableStyle
+from reportlab.platypus.flowables import HRFlowable
+
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_BULLET = re.compile(r"^(\s*)[-*+•]\s+(.*)$")
+# ASCII 句点后必须有空白，且分隔符后不能紧跟数字，避免把“3.5亿美元”“2024.6 上线”当作列表项
+_ORDERED = re.compile(r"^(\s*)(\d+)(?:\.(?!\d)\s+|[、)）](?!\d)\s*)(.+)$")
+_TABLE_ROW = re.compile(r"^\s*\|.*\|\s*$")
+_TABLE_SEPARATOR = re.compile(r"^\s*\|?(\s*:?-{2,}:?\s*\|)+\s*(:?-{2,}:?\s*)?$")
+_RULE = re.compile(r"^\s*(?:-{3,}|\*{3,}|_{3,})\s*$")
+_QUOTE = re.compile(r"^\s*>\s?(.*)$")
+_BOLD = re.compile(r"\*\*(.+?)\*\*|__(.+?)__")
+_ITALIC = re.compile(r"(?<![*\w])\*(?![\s*])(.+?)(?<![\s*])\*(?![*\w])")
+_CODE = re.compile(r"`([^`]+)`")
+_TAG = re.compile(r"<(/?)([bi])>")
+_SENTENCE_END = re.compile(r"(?<=[。！？；.!?;])")
+
+# 每级列表的缩进（点）
+LIST_INDENT = 14
+# 表格单元格左右内边距（点）
+CELL_PADDING = 4
+
+
+def _nest_tags(markup: str) -> str:
+    """
+    修正交叉的粗体/斜体标记（如“**加粗 *斜体** 文本*”转换后的 <b>…<i>…</b>…</i>）：
+    关闭外层标记前先关闭其内层标记，之后重新打开，保证标记正确嵌套
+    """
+    parts: List[str] = []
+    stack: List[str] = []
+    position = 0
+    for match in _TAG.finditer(markup):
+        parts.append(markup[position:match.start()])
+        position = match.end()
+        closing, tag = match.group(1), match.group(2)
+        if not closing:
+            stack.append(tag)
+            parts.append(match.group(0))
+            continue
+        if tag not in stack:
+            continue
+        reopened: List[str] = []
+        while stack[-1] != tag:
+            inner = stack.pop()
+            parts.append(f"</{inner}>")
+            reopened.append(inner)
+        stack.pop()
+        parts.append(f"</{tag}>")
+        for inner in reversed(reopened):
+            stack.append(inner)
+            parts.append(f"<{inner}>")
+    parts.append(markup[position:])
+    parts.extend(f"</{tag}>" for tag in reversed(stack))
+    return "".join(parts)
+
+
+def inline_markup(text: str) -> str:
+    """转义 XML 特殊字符，并把行内 Markdown 标记转换为正确嵌套的 Paragraph 标记"""
+    text = escape(text.strip())
+    text = _CODE.sub(r"\1", text)
+    text = _BOLD.sub(lambda m: f"<b>{m.group(1) or m.group(2)}</b>", text)
+    return _nest_tags(_ITALIC.sub(r"<i>\1</i>", text))
+
+
+def split_long_text(text: str, max_chars: int) -> List[str]:
+    """按句子边界把长文本切分为不超过 max_chars 的片段（单句超长时保持完整）"""
+    if len(text) <= max_chars:
+        return [text]
+    chunks: List[str] = []
+    current = ""
+    for sentence in _SENTENCE_END.split(text):
+        if current and len(current) + len(sentence) > max_chars:
+            chunks.append(current)
+            current = ""
+        current += sentence
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+
+def _table_cells(line: str) -> List[str]:
+    return [cell.strip() for cell in line.strip().strip("|").split("|")]
+
+
+class MarkdownConverter:
+    """
+    逐行把 Markdown 转换为 flowables
+
+    Args:
+        styles: 样式字典，需包含 normal、h1~h4、bullet、quote、table_cell、table_header
+        width: 可用排版宽度，用于计算表格列宽
+        paragraph_class: 正文、标题和列表使用的段落类
+        max_paragraph_chars: 单个段落的最大字符数，超出时按句子切分
+    """
+
+    def __init__(
+        self,
+        styles: Dict[str, Any],
+        width: float,
+        paragraph_class: Type[Paragraph] = Paragraph,
+        max_paragraph_chars: int = 800,
+    ):
+        self.styles = styles
+        self.width = width
+        self.paragraph_class = paragraph_class
+        self.max_paragraph_chars = max_paragraph_chars
+        self._list_styles: Dict[int, ParagraphStyle] = {}
+        self._flowables: List[Flowable] = []
+        self._paragraph: List[str] = []
+        self._table: List[List[str]] = []
+        self._table_has_header = False
+
+    def _list_style(self, level: int) -> ParagraphStyle:
+        style = self._list_styles.get(level)
+        if style is None:
+            base = self.styles["bullet"]
+            style = ParagraphStyle(
+                f"{base.name}_{level}",
+                parent=base,
+                leftIndent=base.leftIndent + level * LIST_INDENT,
+                bulletIndent=base.bulletIndent + level * LIST_INDENT,
+            )
+            self._list_styles[level] = style
+        return style
+
+    def _paragraph_flowable(self, text: str, style: ParagraphStyle, **kwargs: Any) -> Paragraph:
+        """按行内标记创建段落，标记仍无法解析时退回为纯文本，避免单个段落导致整份PDF生成失败"""
+        try:
+            return self.paragraph_class(inline_markup(text), style, **kwargs)
+        except ValueError:
+            return self.paragraph_class(escape(text.strip()), style, **kwargs)
+
+    def _flush_paragraph(self) -> None:
+        if not self._paragraph:
+            return
+        text = "\n".join(self._paragraph)
+        self._paragraph = []
+        for chunk in split_long_text(text, self.max_paragraph_chars):
+            lines = [line for line in chunk.split("\n") if line.strip()]
+            if lines:
+                try:
+                    paragraph = self.paragraph_class("<br/>".join(inline_markup(line) for line in lines), self.styles["normal"])
+                except ValueError:
+                    paragraph = self.paragraph_class("<br/>".join(escape(line.strip()) for line in lines), self.styles["normal"])
+                self._flowables.append(paragraph)
+                self._flowables.append(Spacer(1, 5))
+
+    def _table_cell(self, cell: str, style: ParagraphStyle, column_width: float) -> Any:
+        """单行放得下的纯文本单元格直接使用字符串（表格按单元格字体绘制），其余使用可换行的 Paragraph"""
+        markup = inline_markup(cell)
+        if markup == escape(cell.strip()) and (
+            stringWidth(cell.strip(), style.fontName, style.fontSize) <= column_width - 2 * CELL_PADDING
+        ):
+            return cell.strip()
+        try:
+            return Paragraph(markup, style)
+        except ValueError:
+            return Paragraph(escape(cell.strip()), style)
+
+    def _flush_table(self) -> None:
+        if not self._table:
+            return
+        rows, self._table = self._table, []
+        columns = max(len(row) for row in rows)
+        column_width = self.width / columns
+        cell_style = self.styles["table_cell"]
+        header_style = self.styles["table_header"]
+        data = []
+        for index, row in enumerate(rows):
+            style = header_style if index == 0 and self._table_has_header else cell_style
+            cells = row + [""] * (columns - len(row))
+            data.append([self._table_cell(cell, style, column_width) for cell in cells])
+        table = Table(
+            data,
+            colWidths=[column_width] * columns,
+            repeatRows=1 if self._table_has_header else 0,
+        )
+        commands = [
+            ("FONT", (0, 0), (-1, -1), cell_style.fontName, cell_style.fontSize, cell_style.leading),
+            ("TEXTCOLOR", (0, 0), (-1, -1), cell_style.textColor),
+            ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+            ("VALIGN", (0, 0), (-1, -1), "TOP"),
+            ("LEFTPADDING", (0, 0), (-1, -1), CELL_PADDING),
+            ("RIGHTPADDING", (0, 0), (-1, -1), CELL_PADDING),
+        ]
+        if self._table_has_header:
+            commands.append(("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#E8EEF7")))
+            commands.append(("TEXTCOLOR", (0, 0), (-1, 0), header_style.textColor))
+        table.setStyle(TableStyle(commands))
+        self._flowables.append(table)
+        self._flowables.append(Spacer(1, 8))
+        self._table_has_header = False
+
+    def feed(self, line: str) -> None:
+        """处理一行 Markdown"""
+        if self._table:
+            if _TABLE_SEPARATOR.match(line):
+                # 第一行之后的分隔行表示第一行是表头
+                self._table_has_header = len(self._table) == 1
+                return
+            if _TABLE_ROW.match(line):
+                self._table.append(_table_cells(line))
+                return
+            self._flush_table()
+
+        if not line.strip():
+            self._flush_paragraph()
+            return
+
+        heading = _HEADING.match(line)
+        if heading:
+            self._flush_paragraph()
+            level = min(len(heading.group(1)), 4)
+            self._flowables.append(self._paragraph_flowable(heading.group(2), self.styles[f"h{level}"]))
+            return
+        if _RULE.match(line):
+            self._flush_paragraph()
+            self._flowables.append(HRFlowable(width="100%", thickness=0.5, color=colors.lightgrey, spaceBefore=4, spaceAfter=4))
+            return
+        if _TABLE_ROW.match(line):
+            self._flush_paragraph()
+            self._table.append(_table_cells(line))
+            return
+
+        bullet = _BULLET.match(line)
+        ordered = None if bullet else _ORDERED.match(line)
+        if bullet or ordered:
+            self._flush_paragraph()
+            indent = (bullet or ordered).group(1).replace("\t", "    ")
+            level = min(len(indent) // 2, 4)
+            text = bullet.group(2) if bullet else ordered.group(3)
+            bullet_text = "•" if bullet else f"{ordered.group(2)}."
+            self._flowables.append(self._paragraph_flowable(text, self._list_style(level), bulletText=bullet_text))
+            return
+
+        quote = _QUOTE.match(line)
+        if quote:
+            self._flush_paragraph()
+            if quote.group(1).strip():
+                self._flowables.append(self._paragraph_flowable(quote.group(1), self.styles["quote"]))
+            return
+
+        self._paragraph.append(line)
+
+    def close(self) -> List[Flowable]:
+        """结束解析，返回全部 flowables"""
+        self._flush_paragraph()
+        self._flush_table()
+        flowables, self._flowables = self._flowables, []
+        return flowables
+
+
+def markdown_to_flowables(
+    lines: Iterable[str] | str,
+    styles: Dict[str, Any],
+    width: float,
+    paragraph_class: Type[Paragraph] = Paragraph,
+    max_paragraph_chars: int = 800,
+) -> List[Flowable]:
+    """
+    把 Markdown 文本（或逐行产生的文本流）转换为 flowables
+
+    Args:
+        lines: Markdown 文本或文本行的可迭代对象
+        styles: 样式字典，见 MarkdownConverter
+        width: 可用排版宽度
+        paragraph_class: 正文、标题和列表使用的段落类
+        max_paragraph_chars: 单个段落的最大字符数
+
+    Returns:
+        List[Flowable]: flowables
+    """
+    if isinstance(lines, str):
+        lines = lines.splitlines()
+    converter = MarkdownConverter(styles, width, paragraph_class, max_paragraph_chars)
+    for line in lines:
+        converter.feed(line)
+    return converter.close()
@@ -0,0 +1,422 @@
+"""
+出海方案建议书的PDF生成
+把各专家的分析内容规整为标准建议书结构并用reportlab渲染为PDF；
+本模块不依赖Chainlit和AutoGen，可在PDF渲染进程池的子进程中直接导入
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+import copy
+import functools
+import hashlib
+import os
+import re
+from datetime import datetime
+
+# PDF生成相关导入
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.lib import colors
+    from reportlab.pdfbase import pdfmetrics
+    from pdf_markdown import markdown_to_flowables
+    PDF_AVAILABLE = True
+except ImportError:
+    PDF_AVAILABLE = False
+    print("警告：reportlab未安装，PDF生成功能将不可用。请运行：pip install reportlab")
+
+
+# 专家 -> 建议书章节
+EXPERT_SECTIONS = {
+    "enterprise_knowledge_expert": "enterprise_analysis",
+    "market_analysis_expert": "market_analysis",
+    "strategic_planning_expert": "strategic_planning",
+    "operations_planning_expert": "operations_planning",
+    "marketing_promotion_expert": "marketing_strategy",
+    "legal_compliance_expert": "legal_compliance",
+    "financial_planning_expert": "financial_planning",
+    "implementation_planning_expert": "implementation_timeline",
+    "solution_expert": "risk_assessment",
+    "senior_advisory_expert": "conclusion"
+}
+
+# 建议书章节顺序与标题
+DOCUMENT_STRUCTURE = [
+    ("executive_summary", "执行摘要"),
+    ("enterprise_analysis", "企业现状分析"),
+    ("market_analysis", "目标市场分析"),
+    ("strategic_planning", "出海战略规划"),
+    ("operations_planning", "运营实施方案"),
+    ("marketing_strategy", "营销推广策略"),
+    ("legal_compliance", "法律合规要求"),
+    ("financial_planning", "财务规划方案"),
+    ("implementation_timeline", "实施时间表"),
+    ("risk_assessment", "风险评估与应对"),
+    ("conclusion", "结论与建议")
+]
+
+# 建议书模板：标题和关注范围；full 为全面出海方案，其余为单项咨询报告（只包含参与专家的章节，不补充通用章节）
+DOCUMENT_TEMPLATES = {
+    "full": {"title": "企业出海方案建议书", "focus": "企业出海的各个环节"},
+    "market": {"title": "目标市场分析报告", "focus": "目标市场的机会与风险"},
+    "strategy": {"title": "出海战略规划报告", "focus": "出海战略与市场进入策略"},
+    "operations": {"title": "海外运营规划报告", "focus": "海外运营体系与组织架构"},
+    "marketing": {"title": "海外营销推广报告", "focus": "品牌推广与营销策略"},
+    "legal": {"title": "出海法律合规报告", "focus": "目标市场的法律法规与合规要求"},
+    "finance": {"title": "出海财务规划报告", "focus": "投资预算与财务风险管控"},
+    "focused": {"title": "企业出海专项咨询报告", "focus": "客户关注的专项问题"},
+}
+
+# 智能体回复开头的身份标识
+AGENT_TAGS = ["【企业知识专家】", "【市场分析专家】", "【战略规划专家】",
+              "【运营规划专家】", "【营销推广专家】", "【法律合规专家】",
+              "【财务规划专家】", "【实施计划专家】", "【方案专家】", "【资深顾问专家】"]
+AGENT_TAG_PATTERN = re.compile("|".join(re.escape(tag) for tag in AGENT_TAGS))
+
+# A4 页面在 SimpleDocTemplate 默认页边距（1 英寸）和框架内边距（6 点）下的可用排版宽度
+FRAME_WIDTH = A4[0] - 2 * inch - 12 if PDF_AVAILABLE else 0.0
+
+
+def clean_expert_content(content: str) -> str:
+    """移除智能体身份标识"""
+    return AGENT_TAG_PATTERN.sub("", content).strip()
+
+
+def content_digest(content: str) -> str:
+    """章节内容摘要，用于判断缓存的章节是否仍与当前内容一致"""
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def format_document_content(user_message: str, expert_analysis: Dict[str, str], template: str = "full") -> Dict[str, str]:
+    """
+    对专家分析内容进行格式规整，形成标准建议书格式
+    
+    Args:
+        user_message: 用户原始需求
+        expert_analysis: 各专家分析结果字典
+        template: 建议书模板，见 DOCUMENT_TEMPLATES
+    
+    Returns:
+        Dict[str, str]: 格式化后的文档内容
+    """
+    formatted_content = {}
+    
+    # 处理各专家内容
+    for expert_key, content in expert_analysis.items():
+        if expert_key in EXPERT_SECTIONS:
+            # 格式化内容（移除智能体标识）
+            formatted_content[EXPERT_SECTIONS[expert_key]] = clean_expert_content(content)
+    
+    # 单项咨询报告：执行摘要只说明咨询背景和报告范围，不补充与本次咨询无关的通用章节
+    if template != "full":
+        document_template = DOCUMENT_TEMPLATES.get(template, DOCUMENT_TEMPLATES["focused"])
+        formatted_content["executive_summary"] = f"""
+# {document_template["title"]}执行摘要
+
+## 咨询背景
+{user_message}
+
+## 报告范围
+本报告聚焦{document_template["focus"]}，由企业知识专家梳理企业现状，相关领域专家给出专项分析，资深顾问专家整合结论与建议。
+"""
+        return formatted_content
+    
+    # 生成执行摘要
+    executive_summary = f"""
+# 企业出海方案执行摘要
+
+## 项目背景
+{user_message}
+
+## 方案概述
+本方案基于多领域专家的专业分析，为企业提供全面的海外市场拓展指导。方案涵盖了从市场分析到实施落地的各个环节，确保企业能够系统性地推进海外业务发展。
+
+## 核心建议
+- 市场进入策略：根据目标市场特点制定差异化进入策略
+- 运营体系设计：建立适合海外市场的运营模式和组织架构
+- 风险管控机制：建立完善的法律合规和财务风险管控体系
+- 实施路径规划：制定分阶段、可操作的实施计划
+
+## 预期成果
+通过本方案的实施，企业将获得：
+1. 清晰的市场定位和竞争优势
+2. 完善的海外运营体系
+3. 有效的风险管控机制
+4. 可执行的实施路径
+"""
+    
+    formatted_content["executive_summary"] = executive_summary
+    
+    # 添加风险评估与应对（如果方案专家没有提供）
+    if "risk_assessment" not in formatted_content:
+        formatted_content["risk_assessment"] = """
+# 风险评估与应对
+
+## 主要风险识别
+1. **市场风险**：目标市场环境变化、竞争加剧
+2. **运营风险**：海外运营成本超预期、人才短缺
+3. **法律风险**：合规要求变化、知识产权保护
+4. **财务风险**：汇率波动、资金流动性风险
+
+## 风险应对策略
+1. **建立风险监控机制**：定期评估市场环境和运营状况
+2. **制定应急预案**：针对各类风险制定详细的应对预案
+3. **加强合规管理**：建立专业的法律合规团队
+4. **优化财务结构**：采用多元化的融资和风险对冲策略
+"""
+    
+    # 添加结论与建议（如果资深顾问专家没有提供）
+    if "conclusion" not in formatted_content:
+        formatted_content["conclusion"] = """
+# 结论与建议
+
+## 方案总结
+本出海方案基于多领域专家的专业分析，为企业提供了全面的海外拓展指导。方案涵盖了从市场分析到实施落地的各个环节，确保企业能够系统性地推进海外业务发展。
+
+## 实施建议
+1. **分阶段实施**：按照方案中的时间表，分阶段推进各项措施
+2. **持续优化**：根据实施过程中的反馈，持续优化方案内容
+3. **资源保障**：确保人力、财力等资源的充分投入
+4. **风险管控**：建立完善的风险监控和应对机制
+
+## 后续支持
+建议企业建立专门的海外业务团队，负责方案的实施和后续优化工作。同时，可以考虑寻求专业咨询机构的持续支持。
+"""
+    
+    return formatted_content
+
+
+if PDF_AVAILABLE:
+    class PrewrappedParagraph(Paragraph):
+        """缓存断行结果的段落：章节预先按页面宽度排版后，组装整份文档时不再重复计算断行"""
+
+        def _cached_lines(self, method, width):
+            key = (method.__name__, tuple(width) if isinstance(width, (list, tuple)) else width)
+            cache = self.__dict__.setdefault("_line_cache", {})
+            if key not in cache:
+                cache[key] = method(width)
+            return cache[key]
+
+        def breakLines(self, width):
+            return self._cached_lines(super().breakLines, width)
+
+        def breakLinesCJK(self, maxWidths):
+            return self._cached_lines(super().breakLinesCJK, maxWidths)
+
+
+@functools.lru_cache(maxsize=None)
+def _register_chinese_font() -> str:
+    """注册中文字体（每个进程只注册一次），返回字体名"""
+    try:
+        from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+        
+        # 注册Unicode中文字体
+        pdfmetrics.registerFont(UnicodeCIDFont('STSong-Light'))
+        return 'STSong-Light'
+    except:
+        try:
+            from reportlab.pdfbase.ttfonts import TTFont
+
+            # 备用方案：使用系统字体
+            if os.path.exists('/System/Library/Fonts/PingFang.ttc'):  # macOS
+                pdfmetrics.registerFont(TTFont('PingFang', '/System/Library/Fonts/PingFang.ttc'))
+                return 'PingFang'
+            elif os.path.exists('/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'):  # Linux
+                pdfmetrics.registerFont(TTFont('DejaVu', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'))
+                return 'DejaVu'
+            elif os.path.exists('C:/Windows/Fonts/simsun.ttc'):  # Windows
+                pdfmetrics.registerFont(TTFont('SimSun', 'C:/Windows/Fonts/simsun.ttc'))
+                return 'SimSun'
+        except:
+            pass
+        return 'Helvetica'  # 默认字体
+
+
+@functools.lru_cache(maxsize=None)
+def _report_styles() -> Dict[str, Any]:
+    """
+    创建建议书的样式（每个进程只创建一次，调用方不应修改返回的样式）
+
+    包含标题（title）、章节标题（heading）、正文（normal），以及 Markdown 转换使用的
+    小标题（h1~h4）、列表（bullet）、引用（quote）和表格（table_cell、table_header）样式
+    """
+    chinese_font = _register_chinese_font()
+    
+    # 获取样式
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=18,
+        spaceAfter=30,
+        alignment=1,  # 居中
+        textColor=colors.darkblue,
+        fontName=chinese_font
+    )
+    heading_style = ParagraphStyle(
+        'CustomHeading',
+        parent=styles['Heading2'],
+        fontSize=14,
+        spaceAfter=12,
+        spaceBefore=20,
+        textColor=colors.darkblue,
+        fontName=chinese_font
+    )
+    normal_style = ParagraphStyle(
+        'CustomNormal',
+        parent=styles['Normal'],
+        fontName=chinese_font,
+        fontSize=10,
+        leading=14
+    )
+    report_styles = {"title": title_style, "heading": heading_style, "normal": normal_style}
+    # 章节内的 Markdown 标题比章节标题小一级
+    for level, font_size in enumerate((13, 12, 11, 10.5), start=1):
+        report_styles[f"h{level}"] = ParagraphStyle(
+            f'CustomH{level}',
+            parent=normal_style,
+            fontSize=font_size,
+            leading=font_size + 5,
+            spaceBefore=8,
+            spaceAfter=4,
+            textColor=colors.darkblue
+        )
+    report_styles["bullet"] = ParagraphStyle(
+        'CustomBullet',
+        parent=normal_style,
+        leftIndent=16,
+        bulletIndent=4,
+        bulletFontName=chinese_font,
+        spaceAfter=2
+    )
+    report_styles["quote"] = ParagraphStyle(
+        'CustomQuote',
+        parent=normal_style,
+        leftIndent=16,
+        textColor=colors.dimgrey,
+        spaceAfter=4
+    )
+    report_styles["table_cell"] = ParagraphStyle(
+        'CustomTableCell',
+        parent=normal_style,
+        fontSize=9,
+        leading=12
+    )
+    report_styles["table_header"] = ParagraphStyle(
+        'CustomTableHeader',
+        parent=report_styles["table_cell"],
+        textColor=colors.darkblue
+    )
+    return report_styles
+
+
+def build_section_flowables(section_key: str, content: str, styles: Optional[Dict[str, Any]] = None) -> List[Any]:
+    """
+    把一个章节的内容转换为flowables，并按页面宽度预先完成断行
+
+    Args:
+        section_key: 章节键，见 DOCUMENT_STRUCTURE
+        content: 规整后的章节内容
+        styles: 样式，默认使用 _report_styles 的进程级样式
+    
+    Returns:
+        List[Any]: 章节的flowables（章节标题、正文和段后间距）
+    """
+    styles = styles or _report_styles()
+    section_title = dict(DOCUMENT_STRUCTURE)[section_key]
+    story = [Paragraph(section_title, styles["heading"])]
+    # 按 Markdown 结构转换为标题、列表、表格和适中长度的段落
+    story.extend(markdown_to_flowables(content, styles, FRAME_WIDTH, paragraph_class=PrewrappedParagraph))
+    story.append(Spacer(1, 15))
+    
+    # 预先断行（排版中最耗时的部分），组装文档时直接复用
+    for flowable in story:
+        if isinstance(flowable, PrewrappedParagraph):
+            flowable.wrap(FRAME_WIDTH, A4[1])
+    return story
+
+
+def render_section(section_key: str, content: str) -> Tuple[str, List[Any]]:
+    """
+    渲染单个章节（供PDF渲染进程池调用）
+
+    Args:
+        section_key: 章节键
+        content: 规整后的章节内容
+
+    Returns:
+        Tuple[str, List[Any]]: (内容摘要, 预先断行的flowables)
+    """
+    return content_digest(content), build_section_flowables(section_key, content)
+
+
+def generate_overseas_plan_pdf(
+    user_message: str,
+    expert_analysis: Dict[str, str],
+    output_path: Optional[str] = None,
+    prerendered: Optional[Dict[str, Tuple[str, List[Any]]]] = None,
+    template: str = "full",
+) -> str:
+    """
+    生成出海方案PDF文档
+    
+    Args:
+        user_message: 用户原始需求
+        expert_analysis: 各专家分析结果字典
+        output_path: PDF文件路径，默认在outputs目录下按时间戳命名
+        prerendered: 已渲染的章节（章节键 -> (内容摘要, flowables)），与当前内容一致的章节直接复用，
+            只渲染缺失或内容已变化的章节
+        template: 建议书模板，见 DOCUMENT_TEMPLATES
+    
+    Returns:
+        str: PDF文件路径
+    """
+    if not PDF_AVAILABLE:
+        raise ImportError("reportlab未安装，无法生成PDF")
+    
+    # 首先进行文档格式规整
+    formatted_content = format_document_content(user_message, expert_analysis, template)
+    prerendered = prerendered or {}
+    
+    # 生成文件名
+    if output_path:
+        filepath = output_path
+    else:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filepath = os.path.join("outputs", f"overseas_plan_{timestamp}.pdf")
+    
+    # 创建输出目录
+    output_dir = os.path.dirname(filepath)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+    
+    # 创建PDF文档
+    doc = SimpleDocTemplate(filepath, pagesize=A4)
+    story = []
+    styles = _report_styles()
+    
+    # 添加标题
+    title = DOCUMENT_TEMPLATES.get(template, DOCUMENT_TEMPLATES["full"])["title"]
+    story.append(Paragraph(title, styles["title"]))
+    story.append(Spacer(1, 20))
+    
+    # 添加生成时间
+    story.append(Paragraph(f"生成时间：{datetime.now().strftime('%Y年%m月%d日 %H:%M:%S')}", styles["normal"]))
+    story.append(Spacer(1, 20))
+    
+    # 按标准格式组装各章节，复用已渲染的章节
+    for section_key, _ in DOCUMENT_STRUCTURE:
+        if section_key in formatted_content:
+            content = formatted_content[section_key]
+            cached = prerendered.get(section_key)
+            if cached is not None and cached[0] == content_digest(content):
+                # 排版会修改flowables的状态，追问调整后同一章节可能再次组装，使用副本（断行缓存随之复制）
+                story.extend(copy.deepcopy(cached[1]))
+            else:
+                story.extend(build_section_flowables(section_key, content, styles))
+    
+    # 生成PDF
+    doc.build(story)
+    
+    return filepath
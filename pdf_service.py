@@ -0,0 +1,380 @@
+"""
+PDF渲染服务
+在进程池中执行reportlab渲染，避免同步的字体注册、排版和写文件阻塞Chainlit事件循环（阻塞时同一进程内所有用户的流式输出都会停顿）；
+渲染任务进入有界队列，提交后立即返回可等待的任务句柄，排队、渲染和完成时通知进度监听者
+"""
+
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import multiprocessing
+import os
+import time
+import uuid
+from datetime import datetime
+
+from pdf_report import (
+    EXPERT_SECTIONS,
+    PDF_AVAILABLE,
+    clean_expert_content,
+    content_digest,
+    generate_overseas_plan_pdf,
+    render_section,
+)
+from swarm_metrics import METRICS
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT_DIR = os.path.join(BASE_DIR, "outputs")
+
+EXECUTOR_KINDS = ("process", "thread")
+
+
+class PdfQueueFullError(RuntimeError):
+    """渲染队列已满"""
+
+
+class PdfJob:
+    """
+    PDF渲染任务句柄，可直接 await 得到PDF文件路径
+
+    status 依次为 queued、running，最终为 done、failed 或 cancelled；排队时 position 为前面等待的任务数
+    """
+
+    def __init__(self, job_id: str, output_path: str):
+        self.job_id = job_id
+        self.output_path = output_path
+        self.status = "queued"
+        self.position = 0
+        self.error: Optional[BaseException] = None
+        self.submitted_at = time.perf_counter()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._task: Optional[asyncio.Task] = None
+        self._listeners: List[Callable[["PdfJob"], Awaitable[None]]] = []
+
+    @classmethod
+    def completed(cls, output_path: str) -> "PdfJob":
+        """已完成的任务句柄，用于直接交付已有的PDF（如咨询缓存命中时）"""
+        job = cls(uuid.uuid4().hex[:8], output_path)
+        job.status = "done"
+        job.started_at = job.finished_at = job.submitted_at
+        job._future.set_result(output_path)
+        return job
+
+    def add_listener(self, listener: Callable[["PdfJob"], Awaitable[None]]) -> None:
+        """注册进度监听者，任务状态或排队位置变化时调用"""
+        self._listeners.append(listener)
+
+    async def _notify(self) -> None:
+        for listener in list(self._listeners):
+            try:
+                await listener(self)
+            except Exception as e:
+                print(f"警告：PDF任务进度通知失败：{e}")
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def cancel(self) -> bool:
+        """
+        取消尚未完成的任务（如用户停止咨询或离开会话）：排队中的任务移出队列，
+        正在渲染的任务不再等待其结果；之后 await 任务句柄会抛出 CancelledError
+
+        Returns:
+            bool: 任务是否被取消（已完成的任务返回 False）
+        """
+        if self.done() or self._task is None:
+            return False
+        self._task.cancel()
+        return True
+
+    async def wait(self) -> str:
+        """等待渲染完成并返回PDF文件路径，渲染失败时抛出原始异常"""
+        return await asyncio.shield(self._future)
+
+    def __await__(self):
+        return self.wait().__await__()
+
+    @property
+    def queue_seconds(self) -> Optional[float]:
+        return self.started_at - self.submitted_at if self.started_at is not None else None
+
+    @property
+    def render_seconds(self) -> Optional[float]:
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+
+class PdfRenderService:
+    """
+    PDF渲染服务
+
+    Args:
+        max_workers: 同时渲染的任务数（进程池大小）
+        max_queue: 最多排队等待的任务数，超出时提交失败
+        executor: process 在子进程中渲染（默认），thread 在线程中渲染（不支持多进程的环境）
+        output_dir: PDF输出目录
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 2,
+        max_queue: int = 16,
+        executor: str = "process",
+        output_dir: str = DEFAULT_OUTPUT_DIR,
+    ):
+        if executor not in EXECUTOR_KINDS:
+            raise ValueError(f"不支持的PDF渲染执行器：{executor}")
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor_kind = executor
+        self.output_dir = output_dir
+        self._executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._queued: List[PdfJob] = []
+        self._running = 0
+        self._tasks: set = set()
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "process":
+                # spawn 启动的子进程只导入渲染模块，不继承事件循环和会话状态
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pdf-render")
+        return self._executor
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """在渲染进程池中执行函数（用于章节预渲染，不占用任务队列）"""
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        except BrokenProcessPool:
+            self._executor = None
+            raise
+
+    def submit(
+        self,
+        user_message: str,
+        expert_analysis: Dict[str, str],
+        listener: Optional[Callable[[PdfJob], Awaitable[None]]] = None,
+        report: Optional["IncrementalReport"] = None,
+        template: str = "full",
+    ) -> PdfJob:
+        """
+        提交渲染任务，立即返回任务句柄
+
+        Args:
+            user_message: 用户原始需求
+            expert_analysis: 各专家分析结果字典（提交时复制，之后的修改不影响本次渲染）
+            listener: 进度监听者
+            report: 增量建议书，已预渲染且内容未变的章节直接复用
+            template: 建议书模板（见 pdf_report.DOCUMENT_TEMPLATES）
+
+        Raises:
+            ImportError: reportlab未安装
+            PdfQueueFullError: 排队任务数已达上限
+        """
+        if not PDF_AVAILABLE:
+            raise ImportError("reportlab未安装，无法生成PDF")
+        # 超出空闲渲染槽位的任务才需要排队
+        if len(self._queued) + self._running - self.max_workers >= self.max_queue:
+            raise PdfQueueFullError(f"PDF生成队列已满（{self.max_queue} 个任务排队中），请稍后重试")
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+
+        job_id = uuid.uuid4().hex[:8]
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        job = PdfJob(job_id, os.path.join(self.output_dir, f"overseas_plan_{timestamp}_{job_id}.pdf"))
+        if listener is not None:
+            job.add_listener(listener)
+        job.position = len(self._queued)
+        self._queued.append(job)
+        task = job._task = asyncio.create_task(self._run(job, user_message, dict(expert_analysis), report, template))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        task.add_done_callback(lambda _: self._abandon(job))
+        return job
+
+    def _abandon(self, job: PdfJob) -> None:
+        """渲染任务在开始执行前就被取消时 _run 不会运行：移出队列并取消任务句柄，等待方不会一直挂起"""
+        if job._future.done():
+            return
+        job.status = "cancelled"
+        job.finished_at = time.perf_counter()
+        job._future.cancel()
+        if job in self._queued:
+            self._queued.remove(job)
+
+    async def _run(
+        self,
+        job: PdfJob,
+        user_message: str,
+        expert_analysis: Dict[str, str],
+        report: Optional["IncrementalReport"],
+        template: str = "full",
+    ) -> None:
+        assert self._slots is not None
+        try:
+            # 排队通知也在 try 内：通知期间被取消或出错时任务同样移出队列并结束，等待方不会一直挂起
+            await job._notify()
+            prerendered = await report.prerendered() if report is not None else None
+            async with self._slots:
+                await self._dequeue(job)
+                job.status = "running"
+                job.started_at = time.perf_counter()
+                self._running += 1
+                try:
+                    await job._notify()
+                    loop = asyncio.get_running_loop()
+                    path = await loop.run_in_executor(
+                        self._get_executor(),
+                        generate_overseas_plan_pdf,
+                        user_message,
+                        expert_analysis,
+                        job.output_path,
+                        prerendered,
+                        template,
+                    )
+                except BrokenProcessPool:
+                    # 渲染进程异常退出后进程池不可再用，下一次任务重新创建
+                    self._executor = None
+                    raise
+                finally:
+                    self._running -= 1
+        except BaseException as e:
+            job.finished_at = time.perf_counter()
+            if isinstance(e, asyncio.CancelledError):
+                job.status = "cancelled"
+                METRICS.inc("swarm_pdf_jobs_total", "PDF render jobs.", {"status": "cancelled"})
+                job._future.cancel()
+                if job in self._queued:
+                    await self._dequeue(job)
+                raise
+            if job in self._queued:
+                await self._dequeue(job)
+            job.status = "failed"
+            job.error = e
+            METRICS.inc("swarm_pdf_jobs_total", "PDF render jobs.", {"status": "failed"})
+            job._future.set_exception(e)
+            await job._notify()
+            return
+
+        job.status = "done"
+        job.finished_at = time.perf_counter()
+        METRICS.inc("swarm_pdf_jobs_total", "PDF render jobs.", {"status": "done"})
+        METRICS.observe("swarm_pdf_queue_seconds", "PDF job queue wait time.", job.queue_seconds or 0.0)
+        METRICS.observe("swarm_pdf_render_seconds", "PDF render time.", job.render_seconds or 0.0)
+        job._future.set_result(path)
+        await job._notify()
+
+    async def _dequeue(self, job: PdfJob) -> None:
+        """把任务移出排队队列，并通知排在其后的任务新的排队位置"""
+        self._queued.remove(job)
+        for position, waiting in enumerate(self._queued):
+            if waiting.position != position:
+                waiting.position = position
+                await waiting._notify()
+
+    async def close(self) -> None:
+        """取消未完成的任务并关闭进程池"""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class IncrementalReport:
+    """
+    增量建议书：专家输出通过评估后立即在渲染进程池中渲染对应章节（转换为flowables并预先断行）并缓存，
+    最终生成PDF时只需组装页面；同一专家重新输出时只重新渲染该章节
+
+    Args:
+        service: PDF渲染服务
+    """
+
+    def __init__(self, service: PdfRenderService):
+        self.service = service
+        self.sections: Dict[str, Tuple[str, List[Any]]] = {}
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._digests: Dict[str, str] = {}
+
+    def update(self, expert_name: str, content: str) -> None:
+        """专家输出通过评估后调用，在后台渲染对应章节；内容未变化时不重复渲染"""
+        section_key = EXPERT_SECTIONS.get(expert_name)
+        if section_key is None or not PDF_AVAILABLE:
+            return
+        cleaned = clean_expert_content(content)
+        digest = content_digest(cleaned)
+        if self._digests.get(section_key) == digest:
+            return
+        self._digests[section_key] = digest
+        previous = self._pending.pop(section_key, None)
+        if previous is not None:
+            previous.cancel()
+        self._pending[section_key] = asyncio.create_task(self._render(section_key, cleaned, digest))
+
+    async def _render(self, section_key: str, content: str, digest: str) -> None:
+        try:
+            result = await self.service.run(render_section, section_key, content)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 预渲染失败不影响最终生成，组装时会重新渲染该章节
+            print(f"警告：章节 {section_key} 预渲染失败：{e}")
+            return
+        if self._digests.get(section_key) == digest:
+            self.sections[section_key] = result
+
+    async def prerendered(self) -> Dict[str, Tuple[str, List[Any]]]:
+        """等待进行中的章节渲染完成，返回已渲染的章节"""
+        pending = list(self._pending.values())
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        return dict(self.sections)
+
+    def cancel(self) -> None:
+        """取消进行中的章节渲染"""
+        for task in self._pending.values():
+            task.cancel()
+        self._pending.clear()
+
+
+# 进程级PDF渲染服务（所有会话共享同一个进程池和队列）
+_service: Optional[PdfRenderService] = None
+
+
+def get_pdf_service(pdf_config: Optional[Dict[str, Any]] = None) -> PdfRenderService:
+    """
+    获取进程内共享的PDF渲染服务，首次调用时按 swarm.pdf 配置创建
+
+    Args:
+        pdf_config: swarm.pdf 配置段（executor、max_workers、max_queue、output_dir）
+    """
+    global _service
+    if _service is None:
+        pdf_config = pdf_config or {}
+        _service = PdfRenderService(
+            max_workers=pdf_config.get("max_workers", 2),
+            max_queue=pdf_config.get("max_queue", 16),
+            executor=pdf_config.get("executor", "process"),
+            output_dir=os.path.join(BASE_DIR, pdf_config.get("output_dir", DEFAULT_OUTPUT_DIR)),
+        )
+    return _service
+
+
+async def close_pdf_service() -> None:
+    """关闭共享的PDF渲染服务，在应用退出时调用"""
+    global _service
+    if _service is not None:
+        service, _service = _service, None
+        await service.close()
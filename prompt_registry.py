@@ -0,0 +1,88 @@
+"""
+提示词注册表
+导入时一次性加载并校验 prompts 目录下的全部提示词，路径相对于项目目录而非当前工作目录；
+开发模式（环境变量 PROMPT_HOT_RELOAD=1）下按文件修改时间自动重新加载
+"""
+
+from types import MappingProxyType
+from typing import Dict, Iterable, Mapping, Optional, Tuple
+import os
+import threading
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROMPTS_DIR = os.path.join(BASE_DIR, "prompts")
+
+
+def _read_prompt(path: str) -> str:
+    """读取并校验单个提示词文件"""
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read().strip()
+    if not content:
+        raise ValueError(f"prompt文件为空：{path}")
+    return content
+
+
+class PromptRegistry:
+    """
+    提示词注册表
+
+    Args:
+        directory: 提示词目录
+        hot_reload: 是否在获取提示词时检查文件修改时间并重新加载
+    """
+
+    def __init__(self, directory: str = PROMPTS_DIR, hot_reload: bool = False):
+        self.directory = directory
+        self.hot_reload = hot_reload
+        self._lock = threading.Lock()
+        self._prompts: Dict[str, Tuple[float, str]] = {}
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(".txt"):
+                path = os.path.join(directory, filename)
+                self._prompts[filename] = (os.path.getmtime(path), _read_prompt(path))
+
+    def require(self, filenames: Iterable[str]) -> None:
+        """
+        校验所需的提示词均已加载
+
+        Raises:
+            FileNotFoundError: 存在缺失的提示词文件
+        """
+        missing = [filename for filename in filenames if filename not in self._prompts]
+        if missing:
+            raise FileNotFoundError(f"未找到prompt文件：{', '.join(missing)}（目录：{self.directory}）")
+
+    def get(self, filename: str) -> Optional[str]:
+        """获取提示词，不存在时返回 None"""
+        entry = self._prompts.get(filename)
+        if entry is None:
+            return None
+        if self.hot_reload:
+            entry = self._reload_if_changed(filename, entry)
+        return entry[1]
+
+    def _reload_if_changed(self, filename: str, entry: Tuple[float, str]) -> Tuple[float, str]:
+        path = os.path.join(self.directory, filename)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return entry
+        if mtime == entry[0]:
+            return entry
+        try:
+            entry = (mtime, _read_prompt(path))
+        except (OSError, ValueError) as e:
+            # 编辑过程中的无效内容不影响正在运行的服务，继续使用上一版本
+            print(f"警告：重新加载prompt文件 {path} 失败：{e}")
+            return entry
+        with self._lock:
+            self._prompts[filename] = entry
+        return entry
+
+    def snapshot(self) -> Mapping[str, str]:
+        """返回当前全部提示词的只读视图"""
+        return MappingProxyType({filename: self.get(filename) or "" for filename in self._prompts})
+
+
+PROMPTS = PromptRegistry(hot_reload=os.environ.get("PROMPT_HOT_RELOAD") == "1")
@@ -0,0 +1,111 @@
+"""
+咨询准入控制
+进程内同时运行的咨询数有上限，超出时整次咨询按先来先服务排队，并把排队位置通知给对应的会话；
+与模型调用的限流（llm_rate_limit.py）配合，多个会话同时咨询时吞吐接近服务上限而不会互相拖垮
+"""
+
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+
+from swarm_metrics import METRICS
+
+
+PositionCallback = Callable[[int], Awaitable[None]]
+
+
+class ConsultationAdmission:
+    """
+    咨询准入队列
+
+    Args:
+        max_concurrent: 同时运行的最大咨询数
+    """
+
+    def __init__(self, max_concurrent: int = 4):
+        self.max_concurrent = max_concurrent
+        self._running = 0
+        self._waiters: List[Tuple[asyncio.Future, Optional[PositionCallback]]] = []
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def _notify_positions(self) -> None:
+        for position, (_, on_position) in enumerate(self._waiters):
+            if on_position is None:
+                continue
+            try:
+                await on_position(position)
+            except Exception as e:
+                print(f"警告：咨询排队位置通知失败：{e}")
+
+    async def acquire(self, on_position: Optional[PositionCallback] = None) -> None:
+        """
+        获取运行名额，没有空闲名额时排队等待
+
+        Args:
+            on_position: 排队位置变化时调用，参数为前面等待的咨询数
+        """
+        if self._running < self.max_concurrent and not self._waiters:
+            self._running += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        waiter = (future, on_position)
+        self._waiters.append(waiter)
+        METRICS.inc("swarm_admission_queued_total", "Consultations that had to wait for a slot.")
+        try:
+            # 首次位置通知也在 try 内：通知期间被取消时同样移出队列，避免名额转交给已放弃的等待者
+            if on_position is not None:
+                try:
+                    await on_position(len(self._waiters) - 1)
+                except Exception as e:
+                    print(f"警告：咨询排队位置通知失败：{e}")
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 名额已经转交给本咨询，取消时归还
+                await self.release()
+            else:
+                self._waiters.remove(waiter)
+                await self._notify_positions()
+            raise
+
+    async def release(self) -> None:
+        """归还名额：有排队的咨询时直接转交给排在最前面的一个"""
+        if self._waiters:
+            future, _ = self._waiters.pop(0)
+            future.set_result(None)
+            await self._notify_positions()
+        else:
+            self._running -= 1
+
+    @asynccontextmanager
+    async def slot(self, on_position: Optional[PositionCallback] = None) -> AsyncIterator[None]:
+        """在运行名额内执行一次咨询"""
+        await self.acquire(on_position)
+        try:
+            yield
+        finally:
+            await self.release()
+
+
+_admission: Optional[ConsultationAdmission] = None
+
+
+def get_consultation_admission(admission_config: Optional[Dict[str, Any]] = None) -> ConsultationAdmission:
+    """
+    获取进程内共享的咨询准入队列，首次调用时按 swarm.admission 配置创建
+
+    Args:
+        admission_config: swarm.admission 配置段（max_concurrent_consultations）
+    """
+    global _admission
+    if _admission is None:
+        admission_config = admission_config or {}
+        _admission = ConsultationAdmission(admission_config.get("max_concurrent_consultations", 4))
+    return _admission
@@ -0,0 +1,219 @@
+"""
+专家分析结果汇总
+按消息来源（智能体名称）记录每位专家的各次输出以及方案专家对其的评估；
+通过评估的版本依次保留，建议书使用每位专家最近一次通过评估的输出，方案专家的评估单独保存，不计入任何专家的章节。
+各次评估的评分汇总为评分表，可导出为 CSV 或 JSON
+"""
+
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+import csv
+import json
+import os
+
+from swarm_evaluation import SCORE_DIMENSIONS, EvaluationScores
+from swarm_selector import EVALUATOR_NAME
+
+
+@dataclass
+class ExpertRevision:
+    """专家的一次输出"""
+
+    expert_name: str
+    content: str
+    # 在本次咨询中的发言序号（从 1 开始）
+    turn: int
+    score: Optional[float] = None
+    accepted: bool = False
+
+
+@dataclass
+class Evaluation:
+    """方案专家对一次专家输出的评估"""
+
+    expert_name: str
+    content: str
+    turn: int
+    score: Optional[float]
+    accepted: bool
+    # 结构化评分，方案专家未输出有效 JSON 时为 None
+    scores: Optional[EvaluationScores] = None
+    # 被评估输出是该专家的第几次输出
+    attempt: int = 0
+
+
+class ExpertAnalysis:
+    """
+    一次咨询中各专家的分析结果
+
+    Args:
+        evaluator_name: 评估者（方案专家）的智能体名称，其消息记为对最近一次待评估输出的评估
+    """
+
+    def __init__(self, evaluator_name: str = EVALUATOR_NAME):
+        self.evaluator_name = evaluator_name
+        self.revisions: Dict[str, List[ExpertRevision]] = {}
+        self.evaluations: List[Evaluation] = []
+        self.pending: Optional[ExpertRevision] = None
+        self._turn = 0
+
+    def add_revision(self, expert_name: str, content: str, accepted: bool = False) -> ExpertRevision:
+        """
+        记录专家的一次输出
+
+        Args:
+            expert_name: 智能体名称（消息来源）
+            content: 输出内容
+            accepted: 无需评估、直接采纳（并发模式的专家和资深顾问的整合方案）；否则等待方案专家评估
+        """
+        self._turn += 1
+        revision = ExpertRevision(expert_name, content, self._turn, accepted=accepted)
+        self.revisions.setdefault(expert_name, []).append(revision)
+        self.pending = None if accepted else revision
+        return revision
+
+    def add_evaluation(
+        self,
+        content: str,
+        score: Optional[float],
+        accepted: bool,
+        scores: Optional[EvaluationScores] = None,
+    ) -> Optional[ExpertRevision]:
+        """
+        记录方案专家对待评估输出的评估，返回被评估的输出；没有待评估输出时只记录评估内容
+
+        Args:
+            content: 评估内容
+            score: 总体评分
+            accepted: 是否采纳被评估的输出
+            scores: 结构化评分
+        """
+        self._turn += 1
+        revision = self.pending
+        if revision is not None:
+            revision.score = score
+            revision.accepted = accepted
+            if accepted:
+                self.pending = None
+        expert_name = revision.expert_name if revision else ""
+        self.evaluations.append(
+            Evaluation(
+                expert_name,
+                content,
+                self._turn,
+                score,
+                accepted,
+                scores=scores,
+                attempt=self.call_count(expert_name) if revision else 0,
+            )
+        )
+        return revision
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可 JSON 序列化的字典（用于检查点）"""
+        pending = None
+        if self.pending is not None:
+            pending = [self.pending.expert_name, self.revisions[self.pending.expert_name].index(self.pending)]
+        return {
+            "evaluator_name": self.evaluator_name,
+            "turn": self._turn,
+            "revisions": {
+                name: [asdict(revision) for revision in revisions] for name, revisions in self.revisions.items()
+            },
+            "evaluations": [
+                {**asdict(evaluation), "scores": evaluation.scores.model_dump() if evaluation.scores else None}
+                for evaluation in self.evaluations
+            ],
+            "pending": pending,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ExpertAnalysis":
+        """从 to_dict 的结果恢复"""
+        analysis = cls(data.get("evaluator_name", EVALUATOR_NAME))
+        analysis._turn = data.get("turn", 0)
+        analysis.revisions = {
+            name: [ExpertRevision(**revision) for revision in revisions]
+            for name, revisions in data.get("revisions", {}).items()
+        }
+        for evaluation in data.get("evaluations", []):
+            scores = evaluation.get("scores")
+            analysis.evaluations.append(
+                Evaluation(**{**evaluation, "scores": EvaluationScores.model_validate(scores) if scores else None})
+            )
+        if data.get("pending"):
+            name, index = data["pending"]
+            analysis.pending = analysis.revisions[name][index]
+        return analysis
+
+    @property
+    def turn(self) -> int:
+        """最近一条输出或评估的发言序号"""
+        return self._turn
+
+    def call_count(self, expert_name: str) -> int:
+        """专家在本次咨询中的输出次数"""
+        return len(self.revisions.get(expert_name, ()))
+
+    def accepted(self, expert_name: str) -> List[str]:
+        """专家所有通过评估的输出（按时间顺序）"""
+        return [revision.content for revision in self.revisions.get(expert_name, ()) if revision.accepted]
+
+    def latest(self) -> Dict[str, str]:
+        """
+        建议书使用的各专家输出：最近一次通过评估的版本；
+        从未通过评估的专家（如咨询提前结束）使用其最近一次输出
+
+        Returns:
+            Dict[str, str]: 智能体名称 -> 输出内容
+        """
+        result: Dict[str, str] = {}
+        for expert_name, revisions in self.revisions.items():
+            accepted = [revision for revision in revisions if revision.accepted]
+            result[expert_name] = (accepted or revisions)[-1].content
+        return result
+
+    def score_table(self) -> List[Dict[str, Any]]:
+        """
+        本次咨询的评分表：每次评估一行，包含被评估专家、第几次输出、各维度评分、总体评分和是否采纳
+
+        Returns:
+            List[Dict[str, Any]]: 评分表行（未输出结构化评分时各维度为 None）
+        """
+        rows: List[Dict[str, Any]] = []
+        for evaluation in self.evaluations:
+            row: Dict[str, Any] = {
+                "turn": evaluation.turn,
+                "expert": evaluation.expert_name,
+                "attempt": evaluation.attempt,
+            }
+            for dimension in SCORE_DIMENSIONS:
+                row[dimension] = getattr(evaluation.scores, dimension) if evaluation.scores else None
+            row["overall"] = evaluation.score
+            row["accepted"] = evaluation.accepted
+            row["structured"] = evaluation.scores is not None
+            rows.append(row)
+        return rows
+
+    def export_scores(self, path: str) -> str:
+        """
+        导出评分表，按扩展名选择格式：.json 为 JSON，其余为 CSV
+
+        Returns:
+            str: 导出的文件路径
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        rows = self.score_table()
+        if path.endswith(".json"):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(rows, f, ensure_ascii=False, indent=2)
+            return path
+        fieldnames = ["turn", "expert", "attempt", *SCORE_DIMENSIONS, "overall", "accepted", "structured"]
+        # utf-8-sig 便于 Excel 直接打开
+        with open(path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
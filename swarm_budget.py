@@ -0,0 +1,231 @@
+"""
+单次咨询的预算控制
+限制每个智能体的调用次数、总 token 数和墙钟时间：剩余预算只够最终整合时，发言者选择直接转到资深顾问专家；
+预算耗尽或最终整合完成后由终止条件结束团队运行，保证每次咨询的延迟和成本有确定的上限
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import time
+
+from autogen_agentchat.base import TerminatedException, TerminationCondition
+from autogen_agentchat.messages import BaseAgentEvent, BaseChatMessage, StopMessage
+
+from swarm_selector import EVALUATOR_NAME, EXPERT_ORDER, FINAL_SPEAKER_NAME
+
+
+# 预算耗尽原因的界面说明
+BUDGET_REASON_LABELS = {
+    "tokens": "token 用量达到上限",
+    "deadline": "咨询时长达到上限",
+    "calls": "智能体调用次数达到上限",
+}
+
+SelectorFunc = Callable[[Sequence[BaseAgentEvent | BaseChatMessage]], Optional[str]]
+
+
+class ConsultationBudget:
+    """
+    单次咨询的预算
+
+    Args:
+        participants: 参与团队的智能体名称
+        max_calls_per_agent: 每位领域专家和资深顾问专家的最大调用次数
+        max_evaluator_calls: 方案专家的最大调用次数，默认为 领域专家数 × max_calls_per_agent（每次专家输出评估一次）
+        max_total_tokens: 单次咨询的 token 上限（按各条消息的用量统计），None 表示不限制
+        deadline_seconds: 单次咨询的墙钟时间上限（秒），None 表示不限制
+        reserve_tokens: 为最终整合预留的 token 数，剩余不足时转入最终整合
+        reserve_seconds: 为最终整合预留的时间（秒），剩余不足时转入最终整合
+        evaluator_name: 方案专家的智能体名称
+        final_speaker_name: 资深顾问专家的智能体名称
+    """
+
+    def __init__(
+        self,
+        participants: Sequence[str],
+        max_calls_per_agent: int = 3,
+        max_evaluator_calls: Optional[int] = None,
+        max_total_tokens: Optional[int] = None,
+        deadline_seconds: Optional[float] = None,
+        reserve_tokens: int = 4000,
+        reserve_seconds: float = 60.0,
+        evaluator_name: str = EVALUATOR_NAME,
+        final_speaker_name: str = FINAL_SPEAKER_NAME,
+    ):
+        self.participants = list(participants)
+        self.max_calls_per_agent = max_calls_per_agent
+        self.max_evaluator_calls = (
+            max_evaluator_calls if max_evaluator_calls is not None else len(EXPERT_ORDER) * max_calls_per_agent
+        )
+        self.max_total_tokens = max_total_tokens
+        self.deadline_seconds = deadline_seconds
+        self.reserve_tokens = reserve_tokens
+        self.reserve_seconds = reserve_seconds
+        self.evaluator_name = evaluator_name
+        self.final_speaker_name = final_speaker_name
+        self.calls: Dict[str, int] = {}
+        self.total_tokens = 0
+        # 转入最终整合的原因（tokens、deadline 或 calls），None 表示预算充足
+        self.finalize_reason: Optional[str] = None
+        # 预算导致团队结束的原因，None 表示正常结束
+        self.stop_reason: Optional[str] = None
+        self._started_at = time.perf_counter()
+
+    @classmethod
+    def from_config(cls, participants: Sequence[str], config: Optional[Dict[str, Any]] = None) -> "ConsultationBudget":
+        """按 swarm.budget 配置段创建预算"""
+        config = config or {}
+        return cls(
+            participants,
+            max_calls_per_agent=config.get("max_calls_per_agent", 3),
+            max_evaluator_calls=config.get("max_evaluator_calls"),
+            max_total_tokens=config.get("max_total_tokens"),
+            deadline_seconds=config.get("deadline_seconds"),
+            reserve_tokens=config.get("reserve_tokens", 4000),
+            reserve_seconds=config.get("reserve_seconds", 60.0),
+        )
+
+    def start(self) -> None:
+        """开始一次咨询：清零计数并重新计时"""
+        self.calls = {}
+        self.total_tokens = 0
+        self.finalize_reason = None
+        self.stop_reason = None
+        self._started_at = time.perf_counter()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前用量（用于检查点）"""
+        return {
+            "calls": dict(self.calls),
+            "total_tokens": self.total_tokens,
+            "elapsed": self.elapsed,
+            "finalize_reason": self.finalize_reason,
+        }
+
+    def restore(self, snapshot: Dict[str, Any]) -> None:
+        """从检查点恢复用量，墙钟时间从已用时长继续计算"""
+        self.start()
+        self.calls = dict(snapshot.get("calls", {}))
+        self.total_tokens = snapshot.get("total_tokens", 0)
+        self.finalize_reason = snapshot.get("finalize_reason")
+        self._started_at -= snapshot.get("elapsed", 0.0)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._started_at
+
+    @property
+    def remaining_seconds(self) -> Optional[float]:
+        """距墙钟时间上限的剩余秒数，未设置上限时为 None"""
+        if self.deadline_seconds is None:
+            return None
+        return max(0.0, self.deadline_seconds - self.elapsed)
+
+    @property
+    def max_messages(self) -> int:
+        """所有智能体调用上限之和（含用户任务消息），作为团队消息数的绝对上限"""
+        agents = [name for name in self.participants if name != self.evaluator_name]
+        return 1 + self.max_evaluator_calls + len(agents) * self.max_calls_per_agent
+
+    def call_limit(self, name: str) -> int:
+        return self.max_evaluator_calls if name == self.evaluator_name else self.max_calls_per_agent
+
+    def over_cap(self, name: str) -> bool:
+        """智能体是否已达到调用上限"""
+        return self.calls.get(name, 0) >= self.call_limit(name)
+
+    def record(self, message: BaseAgentEvent | BaseChatMessage) -> None:
+        """统计一条消息的调用次数和 token 用量"""
+        if message.models_usage is not None:
+            self.total_tokens += message.models_usage.prompt_tokens + message.models_usage.completion_tokens
+        if isinstance(message, BaseChatMessage) and message.source in self.participants:
+            self.calls[message.source] = self.calls.get(message.source, 0) + 1
+            # 大模型选择失败时 SelectorGroupChat 会沿用上一位发言者而不考虑候选列表，超出上限后立即转入最终整合
+            if self.calls[message.source] > self.call_limit(message.source) and self.finalize_reason is None:
+                self.finalize_reason = "calls"
+
+    def charge(self, tokens: int) -> None:
+        """计入不出现在对话中的 token 用量（如被丢弃的推测执行）"""
+        self.total_tokens += tokens
+
+    def exhausted(self) -> Optional[str]:
+        """预算已耗尽时返回原因（tokens、deadline 或 calls）"""
+        if self.max_total_tokens is not None and self.total_tokens >= self.max_total_tokens:
+            return "tokens"
+        if self.deadline_seconds is not None and self.elapsed >= self.deadline_seconds:
+            return "deadline"
+        if self.over_cap(self.final_speaker_name):
+            return "calls"
+        return None
+
+    def should_finalize(self) -> Optional[str]:
+        """剩余预算只够最终整合时返回原因，此后一直保持（转入最终整合后不再回到领域专家）"""
+        if self.finalize_reason is None:
+            if self.max_total_tokens is not None and self.total_tokens >= self.max_total_tokens - self.reserve_tokens:
+                self.finalize_reason = "tokens"
+            elif self.deadline_seconds is not None and self.elapsed >= self.deadline_seconds - self.reserve_seconds:
+                self.finalize_reason = "deadline"
+            elif self.over_cap(self.evaluator_name):
+                self.finalize_reason = "calls"
+        return self.finalize_reason
+
+    def selector(self, inner: Optional[SelectorFunc] = None) -> SelectorFunc:
+        """
+        包装发言者选择函数：需要转入最终整合时选择资深顾问专家，
+        内层选择的智能体已达调用上限时同样转入最终整合；内层无法判断时返回 None，由大模型在候选中选择
+        """
+
+        def select(messages: Sequence[BaseAgentEvent | BaseChatMessage]) -> Optional[str]:
+            if self.should_finalize():
+                return self.final_speaker_name
+            speaker = inner(messages) if inner is not None else None
+            if speaker is not None and self.over_cap(speaker):
+                self.finalize_reason = "calls"
+                return self.final_speaker_name
+            return speaker
+
+        return select
+
+    def candidates(self, messages: Sequence[BaseAgentEvent | BaseChatMessage]) -> List[str]:
+        """大模型选择发言者时的候选：未达调用上限的智能体，全部用尽时只剩资深顾问专家"""
+        if self.should_finalize():
+            return [self.final_speaker_name]
+        candidates = [name for name in self.participants if not self.over_cap(name)]
+        return candidates or [self.final_speaker_name]
+
+
+class BudgetTermination(TerminationCondition):
+    """
+    预算终止条件：统计每条消息的用量，预算耗尽时立即结束；
+    转入最终整合后，资深顾问专家发言即结束（即使未给出结束标记）
+
+    Args:
+        budget: 本次咨询的预算（咨询开始时由调用方 start）
+    """
+
+    def __init__(self, budget: ConsultationBudget):
+        self.budget = budget
+        self._terminated = False
+
+    @property
+    def terminated(self) -> bool:
+        return self._terminated
+
+    async def __call__(self, messages: Sequence[BaseAgentEvent | BaseChatMessage]) -> StopMessage | None:
+        if self._terminated:
+            raise TerminatedException("Termination condition has already been reached")
+        final_spoke = False
+        for message in messages:
+            self.budget.record(message)
+            if isinstance(message, BaseChatMessage) and message.source == self.budget.final_speaker_name:
+                final_spoke = True
+        reason = self.budget.exhausted()
+        if reason is None and final_spoke and self.budget.finalize_reason is not None:
+            reason = self.budget.finalize_reason
+        if reason is None:
+            return None
+        self._terminated = True
+        self.budget.stop_reason = reason
+        return StopMessage(content=f"Consultation budget exhausted: {reason}", source="BudgetTermination")
+
+    async def reset(self) -> None:
+        self._terminated = False
@@ -0,0 +1,276 @@
+"""
+咨询级缓存
+以规范化后的用户需求为键缓存整次咨询的结果（各专家消息、分析结果和PDF路径），跨会话共享并持久化到 SQLite；
+默认只接受规范化后完全相同的需求；配置相似度阈值后，SimHash 相似度达到阈值、分词集合高度重合、
+其中的数字及企业和产品描述完全一致时也视为同一需求，命中后直接回放已有结果，不再调用模型
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from book_retrieval import tokenize
+from llm_cache import config_namespace
+from swarm_metrics import METRICS
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CONSULTATION_CACHE_PATH = os.path.join(BASE_DIR, ".cache", "consultation_cache.sqlite")
+
+SIMHASH_BITS = 64
+
+# 进程级咨询缓存注册表：(路径, 命名空间, 阈值, 条目上限, 存活时间) -> 咨询缓存，所有会话共享同一连接
+_cache_registry: Dict[Tuple[str, str, float, Optional[int], Optional[float]], "ConsultationCache"] = {}
+
+# 规范化时去除的空白和标点
+_NON_WORD = re.compile(r"[\W_]+")
+# 数字（金额、规模、年份等），相似需求中的数字必须完全一致
+_NUMBER = re.compile(r"\d+")
+# 企业和产品描述（在规范化文本上匹配，如“我们是做智能家居的企业”“主营服装”），相似需求中的描述必须完全一致
+_SUBJECT = re.compile(
+    r"(?:我们是|我们|我司是|我司|本公司是|本公司)(?:一家)?(?:做|从事|生产|经营|主营)?(.+?)的?(?:企业|公司|厂商|工厂|品牌)"
+    r"|(?:主营|主要产品是|主要产品为|产品是|产品为)(.{1,12}?)(?:的|等|产品|计划|想|希望|准备|打算|进入|出海|$)"
+)
+
+# 近似命中时分词集合（中文二元组和英文单词）的最低 Jaccard 相似度
+MIN_TOKEN_JACCARD = 0.8
+
+
+def normalize_request(text: str) -> str:
+    """规范化用户需求：全角转半角、转小写并去除空白和标点"""
+    return _NON_WORD.sub("", unicodedata.normalize("NFKC", text).lower())
+
+
+def simhash(text: str) -> int:
+    """按中文二元组和英文单词计算文本的 64 位 SimHash"""
+    weights = [0] * SIMHASH_BITS
+    for token in tokenize(text):
+        value = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def simhash_similarity(a: int, b: int) -> float:
+    """两个 SimHash 的相似度：1 - 汉明距离 / 位数"""
+    return 1.0 - bin(a ^ b).count("1") / SIMHASH_BITS
+
+
+def token_jaccard(a: str, b: str) -> float:
+    """两段规范化文本分词集合的 Jaccard 相似度"""
+    tokens_a, tokens_b = set(tokenize(a)), set(tokenize(b))
+    if not tokens_a or not tokens_b:
+        return 0.0
+    return len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+
+
+def request_subjects(normalized: str) -> List[str]:
+    """规范化需求中的企业和产品描述"""
+    return [next(group for group in match.groups() if group) for match in _SUBJECT.finditer(normalized)]
+
+
+def is_near_duplicate(a: str, b: str) -> bool:
+    """
+    SimHash 相似的两段规范化需求是否可视为同一需求：分词集合高度重合，数字和企业、产品描述完全一致
+    （不同企业或产品的需求即使文本相似也不命中）
+    """
+    return (
+        _NUMBER.findall(a) == _NUMBER.findall(b)
+        and request_subjects(a) == request_subjects(b)
+        and token_jaccard(a, b) >= MIN_TOKEN_JACCARD
+    )
+
+
+@dataclass
+class CachedConsultation:
+    """缓存的一次咨询"""
+
+    user_message: str
+    # 各智能体的消息（source 为智能体名称），按发言顺序
+    messages: List[Dict[str, str]]
+    # ExpertAnalysis.to_dict 的结果
+    analysis: Dict[str, Any]
+    pdf_path: Optional[str]
+    created_at: float
+    # 与本次需求的相似度，规范化后完全相同时为 1
+    similarity: float = 1.0
+
+
+class ConsultationCache:
+    """
+    咨询缓存
+
+    Args:
+        path: SQLite 数据库文件路径
+        namespace: 键命名空间（模型配置、执行模式和提示词的哈希），配置或提示词变化后旧结果不再命中
+        threshold: 相似度阈值（0-1），默认 1 只接受规范化后完全相同的需求；小于 1 时规范化文本不同但 SimHash 相似度
+            不低于阈值、且通过 is_near_duplicate 校验（分词高度重合，数字和企业、产品描述一致）时视为命中
+        max_entries: 最大条目数，超出时淘汰最久未访问的条目
+        max_age_seconds: 条目最长存活时间，None 表示不过期
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CONSULTATION_CACHE_PATH,
+        namespace: str = "",
+        threshold: float = 1.0,
+        max_entries: Optional[int] = 1000,
+        max_age_seconds: Optional[float] = 7 * 24 * 3600,
+    ):
+        self.path = path
+        self.namespace = namespace
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS consultation_cache (
+                namespace TEXT NOT NULL,
+                normalized TEXT NOT NULL,
+                simhash TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (namespace, normalized)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def lookup(self, user_message: str) -> Optional[CachedConsultation]:
+        """查找相同或相似需求的咨询结果，未命中时返回 None"""
+        normalized = normalize_request(user_message)
+        if not normalized:
+            return None
+        now = time.time()
+        with self._lock:
+            if self.max_age_seconds is not None:
+                self._conn.execute(
+                    "DELETE FROM consultation_cache WHERE created_at < ?", (now - self.max_age_seconds,)
+                )
+            row = self._conn.execute(
+                "SELECT normalized, value FROM consultation_cache WHERE namespace = ? AND normalized = ?",
+                (self.namespace, normalized),
+            ).fetchone()
+            similarity = 1.0
+            if row is None and self.threshold < 1.0:
+                fingerprint = simhash(normalized)
+                best = None
+                for candidate, candidate_hash in self._conn.execute(
+                    "SELECT normalized, simhash FROM consultation_cache WHERE namespace = ?", (self.namespace,)
+                ):
+                    score = simhash_similarity(fingerprint, int(candidate_hash, 16))
+                    if score < self.threshold or not is_near_duplicate(candidate, normalized):
+                        continue
+                    if best is None or score > best[1]:
+                        best = (candidate, score)
+                if best is not None:
+                    similarity = best[1]
+                    row = self._conn.execute(
+                        "SELECT normalized, value FROM consultation_cache WHERE namespace = ? AND normalized = ?",
+                        (self.namespace, best[0]),
+                    ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE consultation_cache SET last_access = ? WHERE namespace = ? AND normalized = ?",
+                    (now, self.namespace, row[0]),
+                )
+            self._conn.commit()
+        METRICS.inc("swarm_consultation_cache_total", "Consultation cache lookups.", {"result": "miss" if row is None else "hit"})
+        if row is None:
+            return None
+        data = json.loads(row[1])
+        return CachedConsultation(similarity=similarity, **data)
+
+    def store(
+        self,
+        user_message: str,
+        messages: List[Dict[str, str]],
+        analysis: Dict[str, Any],
+        pdf_path: Optional[str] = None,
+    ) -> None:
+        """保存一次完成的咨询"""
+        normalized = normalize_request(user_message)
+        if not normalized:
+            return
+        now = time.time()
+        value = json.dumps(
+            {
+                "user_message": user_message,
+                "messages": messages,
+                "analysis": analysis,
+                "pdf_path": pdf_path,
+                "created_at": now,
+            },
+            ensure_ascii=False,
+            default=str,
+        )
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO consultation_cache "
+                "(namespace, normalized, simhash, value, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (self.namespace, normalized, f"{simhash(normalized):016x}", value, now, now),
+            )
+            if self.max_entries is not None:
+                (count,) = self._conn.execute("SELECT COUNT(*) FROM consultation_cache").fetchone()
+                if count > self.max_entries:
+                    self._conn.execute(
+                        "DELETE FROM consultation_cache WHERE rowid IN "
+                        "(SELECT rowid FROM consultation_cache ORDER BY last_access ASC LIMIT ?)",
+                        (count - self.max_entries,),
+                    )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM consultation_cache")
+            self._conn.commit()
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+def cache_namespace(model_config: Dict[str, Any], *parts: Any) -> str:
+    """按模型组件配置（去除凭据后）和其他影响咨询结果的配置计算命名空间"""
+    data = [config_namespace(model_config), *parts]
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def get_consultation_cache(
+    path: str = DEFAULT_CONSULTATION_CACHE_PATH,
+    namespace: str = "",
+    threshold: float = 1.0,
+    max_entries: Optional[int] = 1000,
+    max_age_seconds: Optional[float] = 7 * 24 * 3600,
+) -> ConsultationCache:
+    """获取进程内共享的咨询缓存，相同路径和命名空间（及淘汰参数）只创建一次，参数见 ConsultationCache"""
+    key = (path, namespace, threshold, max_entries, max_age_seconds)
+    cache = _cache_registry.get(key)
+    if cache is None:
+        cache = ConsultationCache(path, namespace, threshold, max_entries, max_age_seconds)
+        _cache_registry[key] = cache
+    return cache
+
+
+def close_consultation_caches() -> None:
+    """关闭所有共享的咨询缓存，在应用退出时调用"""
+    caches = list(_cache_registry.values())
+    _cache_registry.clear()
+    for cache in caches:
+        cache.close()
@@ -0,0 +1,129 @@
+"""
+咨询检查点
+每轮发言后把团队状态（save_state）、各专家的分析结果、调用次数、预算用量和对话记录写入本地存储，
+浏览器断线或进程重启后可从最近的检查点继续咨询，不必重新执行已完成的模型调用
+"""
+
+from typing import Any, Dict, Optional
+import asyncio
+import json
+import os
+import re
+import tempfile
+import time
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CHECKPOINT_DIR = os.path.join(BASE_DIR, ".cache", "checkpoints")
+
+CHECKPOINT_VERSION = 1
+
+# 检查点目录中最多保留的检查点文件数，超出时删除最早保存的文件
+DEFAULT_MAX_CHECKPOINT_FILES = 500
+
+_UNSAFE_KEY_PATTERN = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+class CheckpointStore:
+    """
+    基于本地文件的检查点存储：每个会话一个 JSON 文件，先写临时文件再原子替换，进程中途退出也不会留下损坏的检查点
+
+    Args:
+        directory: 检查点目录
+        max_age_hours: 检查点保留时长，超过后加载时视为不存在并删除，None 表示一直保留
+        max_files: 检查点目录中最多保留的文件数，None 表示不限制；新建检查点时清理过期和超出数量的文件
+    """
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_CHECKPOINT_DIR,
+        max_age_hours: Optional[float] = 72,
+        max_files: Optional[int] = DEFAULT_MAX_CHECKPOINT_FILES,
+    ):
+        self.directory = directory
+        self.max_age_hours = max_age_hours
+        self.max_files = max_files
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{_UNSAFE_KEY_PATTERN.sub('_', key)}.json")
+
+    def _write(self, key: str, data: Dict[str, Any]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        created = not os.path.exists(path)
+        # 每次写入使用独立的临时文件，同一会话的并发保存不会互相覆盖临时文件
+        fd, tmp_path = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        if created:
+            self.prune()
+
+    def prune(self) -> int:
+        """
+        删除过期的检查点（及中断写入遗留的临时文件），再按保存时间删除超出数量上限的检查点
+
+        Returns:
+            int: 删除的文件数
+        """
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.is_file()]
+        except FileNotFoundError:
+            return 0
+        now = time.time()
+        checkpoints = []
+        expired = []
+        for entry in entries:
+            mtime = entry.stat().st_mtime
+            if self.max_age_hours is not None and now - mtime > self.max_age_hours * 3600:
+                expired.append(entry.path)
+            elif entry.name.endswith(".json"):
+                checkpoints.append((mtime, entry.path))
+        if self.max_files is not None and len(checkpoints) > self.max_files:
+            checkpoints.sort()
+            expired.extend(path for _, path in checkpoints[:len(checkpoints) - self.max_files])
+        removed = 0
+        for path in expired:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    async def save(self, key: str, data: Dict[str, Any]) -> None:
+        """保存检查点（在线程中写文件，不阻塞事件循环）"""
+        data = {**data, "version": CHECKPOINT_VERSION, "saved_at": time.time()}
+        await asyncio.to_thread(self._write, key, data)
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        """加载检查点，不存在、已过期、版本不兼容或文件损坏时返回 None"""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"警告：检查点 {path} 无法读取：{e}")
+            return None
+        if data.get("version") != CHECKPOINT_VERSION:
+            return None
+        if self.max_age_hours is not None and time.time() - data.get("saved_at", 0) > self.max_age_hours * 3600:
+            self.delete(key)
+            return None
+        return data
+
+    def delete(self, key: str) -> None:
+        """删除检查点"""
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
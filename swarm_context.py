@@ -0,0 +1,204 @@
+"""
+出海顾问团队的上下文管理
+为每位专家提供有界的模型上下文，避免每轮都携带完整的共享对话记录：
+- window：保留任务描述和最近若干条消息
+- summary：其他专家只保留最新一版输出的摘要（滚动摘要），近期消息保持原文
+- dependencies：只保留本专家所依赖专家的最新输出
+所有策略之外还可设置每轮输入 token 上限
+"""
+
+from typing import Any, Dict, Iterable, List, Optional
+import re
+
+from autogen_core.model_context import ChatCompletionContext
+from autogen_core.models import (
+    AssistantMessage,
+    FunctionExecutionResultMessage,
+    LLMMessage,
+    SystemMessage,
+)
+
+
+CONTEXT_STRATEGIES = ("full", "window", "summary", "dependencies")
+
+_CJK_CHAR = re.compile(r"[一-鿿　-〿＀-￯]")
+_SENTENCE_END = re.compile(r"(?<=[。！？.!?])")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中文字符按 1 个 token，其余字符按 4 个字符 1 个 token"""
+    cjk = len(_CJK_CHAR.findall(text))
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+def _message_text(message: LLMMessage) -> str:
+    content = getattr(message, "content", "")
+    return content if isinstance(content, str) else str(content)
+
+
+def _message_source(message: LLMMessage) -> Optional[str]:
+    return getattr(message, "source", None)
+
+
+def _with_content(message: LLMMessage, content: str) -> LLMMessage:
+    """返回替换了文本内容的消息副本，不修改原消息"""
+    return message.model_copy(update={"content": content})
+
+
+def summarize_text(text: str, max_chars: int) -> str:
+    """
+    抽取式摘要：保留标题行以及每个段落/列表项的首句，直到达到字数上限
+
+    Args:
+        text: 原文
+        max_chars: 摘要最大字符数
+
+    Returns:
+        str: 摘要文本
+    """
+    if len(text) <= max_chars:
+        return text
+    lines: List[str] = []
+    used = 0
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if not line:
+            continue
+        if not line.startswith("#"):
+            line = next((part for part in _SENTENCE_END.split(line) if part.strip()), line)
+        if used + len(line) > max_chars:
+            if not lines:
+                lines.append(line[:max_chars])
+            break
+        lines.append(line)
+        used += len(line) + 1
+    return "\n".join(lines) + "\n……（以上为摘要）"
+
+
+class BoundedExpertContext(ChatCompletionContext):
+    """
+    专家的有界模型上下文
+
+    Args:
+        owner: 持有该上下文的智能体名称
+        strategy: 上下文策略，见 CONTEXT_STRATEGIES
+        dependencies: dependencies 策略下需要保留的上游智能体名称
+        window_size: window 策略保留的最近消息数
+        summary_chars: summary 策略下每位专家摘要的最大字符数
+        max_input_tokens: 每轮输入 token 上限（估算值），None 表示不限制
+        initial_messages: 初始消息
+    """
+
+    def __init__(
+        self,
+        owner: str,
+        strategy: str = "full",
+        dependencies: Optional[Iterable[str]] = None,
+        window_size: int = 6,
+        summary_chars: int = 800,
+        max_input_tokens: Optional[int] = None,
+        initial_messages: Optional[List[LLMMessage]] = None,
+    ) -> None:
+        super().__init__(initial_messages)
+        if strategy not in CONTEXT_STRATEGIES:
+            raise ValueError(f"不支持的上下文策略：{strategy}")
+        self.owner = owner
+        self.strategy = strategy
+        self.dependencies = set(dependencies or [])
+        self.window_size = window_size
+        self.summary_chars = summary_chars
+        self.max_input_tokens = max_input_tokens
+
+    async def get_messages(self) -> List[LLMMessage]:
+        messages = self._select(self._messages)
+        if self.max_input_tokens is not None:
+            messages = self._apply_token_cap(messages)
+        return messages
+
+    def _select(self, messages: List[LLMMessage]) -> List[LLMMessage]:
+        if self.strategy == "full" or len(messages) <= 2:
+            return list(messages)
+
+        # 只保留最新一次注入的系统消息（如书籍检索摘录）
+        last_system = max((i for i, m in enumerate(messages) if isinstance(m, SystemMessage)), default=None)
+        indexed = [(i, m) for i, m in enumerate(messages) if not isinstance(m, SystemMessage) or i == last_system]
+        first_index = indexed[0][0]
+        recent = {i for i, _ in indexed[-2:]}
+
+        if self.strategy == "window":
+            keep = {first_index} | {i for i, _ in indexed[-self.window_size:]}
+            selected = [(i, m) for i, m in indexed if i in keep]
+            return self._drop_orphan_results([m for _, m in selected])
+
+        # 每个来源最新一条消息的位置
+        latest_by_source: Dict[str, int] = {}
+        for i, message in indexed:
+            source = _message_source(message)
+            if source is not None:
+                latest_by_source[source] = i
+
+        result: List[LLMMessage] = []
+        for i, message in indexed:
+            source = _message_source(message)
+            if i == first_index or i in recent or isinstance(message, SystemMessage):
+                result.append(message)
+            elif latest_by_source.get(source) != i:
+                # 同一智能体的旧版本输出已被新版本取代
+                continue
+            elif source == self.owner or isinstance(message, AssistantMessage):
+                # 本专家自己的最新输出保留原文，便于按评估意见修改
+                result.append(message)
+            elif self.strategy == "summary":
+                result.append(_with_content(message, summarize_text(_message_text(message), self.summary_chars)))
+            elif source in self.dependencies:
+                result.append(message)
+        return self._drop_orphan_results(result)
+
+    def _apply_token_cap(self, messages: List[LLMMessage]) -> List[LLMMessage]:
+        """从最旧的消息开始裁剪（保留任务描述和最新消息），仍超限时截断任务描述"""
+        messages = list(messages)
+        total = sum(estimate_tokens(_message_text(m)) for m in messages)
+        while total > self.max_input_tokens and len(messages) > 2:
+            removed = messages.pop(1)
+            total -= estimate_tokens(_message_text(removed))
+        if total > self.max_input_tokens and messages:
+            first_text = _message_text(messages[0])
+            overflow = total - self.max_input_tokens
+            keep_chars = max(len(first_text) - overflow, len(first_text) // 4)
+            messages[0] = _with_content(messages[0], first_text[:keep_chars])
+        return self._drop_orphan_results(messages)
+
+    @staticmethod
+    def _drop_orphan_results(messages: List[LLMMessage]) -> List[LLMMessage]:
+        """去掉紧跟在任务描述之后、对应的工具调用已被裁剪的函数执行结果消息"""
+        while len(messages) > 1 and isinstance(messages[1], FunctionExecutionResultMessage):
+            messages.pop(1)
+        return messages
+
+
+def create_expert_context(owner: str, dependencies: Iterable[str], context_config: Optional[Dict[str, Any]]) -> Optional[BoundedExpertContext]:
+    """
+    根据 swarm.context 配置为专家创建有界上下文
+
+    Args:
+        owner: 智能体名称
+        dependencies: 该专家依赖的上游智能体名称
+        context_config: swarm.context 配置段，未配置或策略为 full 且无 token 上限时返回 None（使用默认上下文）
+
+    Returns:
+        Optional[BoundedExpertContext]: 有界上下文
+    """
+    if not context_config:
+        return None
+    strategy = context_config.get("strategy", "full")
+    max_input_tokens = context_config.get("max_input_tokens")
+    if strategy == "full" and max_input_tokens is None:
+        return None
+    return BoundedExpertContext(
+        owner=owner,
+        strategy=strategy,
+        dependencies=dependencies,
+        window_size=context_config.get("window_size", 6),
+        summary_chars=context_config.get("summary_chars", 800),
+        max_input_tokens=max_input_tokens,
+    )
@@ -0,0 +1,84 @@
+"""
+方案专家的结构化评估
+方案专家在每次评估的末尾输出一个 JSON 代码块，按 EvaluationScores 模式校验后得到各维度评分和总体评分，
+编排逻辑据此确定性地决定专家重新输出还是进入下一位，无需再由大模型阅读评估文本做判断；
+未输出 JSON 或校验失败时回退解析文本中的“总体评分：X/10”
+"""
+
+from typing import Dict, List, Optional
+import json
+import re
+
+from pydantic import BaseModel, Field, ValidationError
+
+
+# 评分维度 -> 中文名称（与评估标准的顺序一致）
+SCORE_DIMENSIONS: Dict[str, str] = {
+    "professionalism": "专业性",
+    "completeness": "完整性",
+    "practicality": "实用性",
+    "relevance": "相关性",
+    "innovation": "创新性",
+}
+
+# 匹配方案专家评估中的“总体评分：X/10”
+OVERALL_SCORE_PATTERN = re.compile(r"总体评分\s*[：:]\s*(\d+(?:\.\d+)?)\s*/\s*10")
+_JSON_BLOCK_PATTERN = re.compile(r"```(?:json)?\s*(\{.*?\})\s*```", re.DOTALL)
+
+
+class EvaluationScores(BaseModel):
+    """方案专家对一次专家输出的结构化评分（0-10 分）"""
+
+    expert: Optional[str] = Field(default=None, description="被评估专家的智能体名称")
+    professionalism: float = Field(ge=0, le=10)
+    completeness: float = Field(ge=0, le=10)
+    practicality: float = Field(ge=0, le=10)
+    relevance: float = Field(ge=0, le=10)
+    innovation: float = Field(ge=0, le=10)
+    overall: float = Field(ge=0, le=10)
+    strengths: List[str] = Field(default_factory=list)
+    weaknesses: List[str] = Field(default_factory=list)
+
+
+_EXAMPLE = {
+    "expert": "market_analysis_expert",
+    **{dimension: 8 for dimension in SCORE_DIMENSIONS},
+    "overall": 8,
+    "strengths": ["具体优点"],
+    "weaknesses": ["具体不足"],
+}
+
+# 追加到方案专家系统提示词的结构化输出要求
+EVALUATION_FORMAT_INSTRUCTIONS = f"""
+**结构化评分（必须）：**
+每次评估的最后输出一个 JSON 代码块，系统据此判断专家是否需要重新输出。
+字段：expert（被评估专家的智能体名称）、{"、".join(f"{key}（{name}）" for key, name in SCORE_DIMENSIONS.items())}、
+overall（总体评分），评分均为 0-10 的数字；strengths、weaknesses 为优点和不足列表。示例：
+```json
+{json.dumps(_EXAMPLE, ensure_ascii=False)}
+```
+"""
+
+
+def parse_overall_score(content: str) -> Optional[float]:
+    """从方案专家的评估文本中解析总体评分，未找到时返回 None"""
+    match = OVERALL_SCORE_PATTERN.search(content)
+    if match is None:
+        return None
+    return float(match.group(1))
+
+
+def parse_evaluation(content: str) -> Optional[EvaluationScores]:
+    """解析并校验评估中的 JSON 代码块（有多个时取最后一个有效的），没有有效评分时返回 None"""
+    for block in reversed(_JSON_BLOCK_PATTERN.findall(content)):
+        try:
+            return EvaluationScores.model_validate_json(block)
+        except ValidationError:
+            continue
+    return None
+
+
+def evaluation_score(content: str) -> Optional[float]:
+    """评估的总体评分：优先使用结构化评分，缺失时回退解析文本"""
+    scores = parse_evaluation(content)
+    return scores.overall if scores is not None else parse_overall_score(content)
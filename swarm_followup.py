@@ -0,0 +1,147 @@
+"""
+追问调整
+咨询完成后，用户的追问（如“把目标市场换成东南亚”“预算改为500万”）只影响部分章节：
+按追问涉及的咨询输入（目标市场、预算、时间表等）和专题确定直接受影响的专家，
+再沿专家依赖图找出所有下游专家，只重新运行这些专家，其余专家沿用上一次的分析结果，
+建议书中内容未变的章节也直接复用已渲染的结果
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+import re
+
+from swarm_intent import COMPANY_CONTEXT, FULL_KEYWORDS, INTENTS, IntentDecision
+
+
+# 明确的调整句式“X改为/换成Y”：调整词前后都要有内容，
+# 只出现“增加”“补充”“如果”等词（新的咨询需求中也很常见）不视为追问
+FOLLOWUP_CHANGE = re.compile(
+    r"\S\s*(?:改为|改成|换成|换为|变为|变成|调整为|调整到|调整至|"
+    r"(?:提高|提升|降低|增加|减少|延长|缩短|压缩)(?:到|至))\s*[^\s，。！？,.!?]"
+)
+
+
+@dataclass(frozen=True)
+class FollowupInput:
+    """咨询输入：追问改变该输入时，直接使用它的专家（注册键）需要重新运行"""
+
+    name: str
+    label: str
+    keywords: Tuple[str, ...]
+    experts: Tuple[str, ...]
+
+
+FOLLOWUP_INPUTS: List[FollowupInput] = [
+    FollowupInput(
+        "company", "企业情况",
+        ("企业情况", "公司情况", "产品", "产能", "主营", "行业", "员工"),
+        ("enterprise_knowledge",),
+    ),
+    FollowupInput(
+        "target_market", "目标市场",
+        ("目标市场", "市场换", "国家", "地区", "东南亚", "欧洲", "北美", "美国", "日本", "韩国", "中东", "拉美", "非洲", "德国", "英国"),
+        ("market_analysis", "strategic_planning", "marketing_promotion", "legal_compliance"),
+    ),
+    FollowupInput(
+        "budget", "预算",
+        ("预算", "投资额", "资金", "万元", "万美元", "亿"),
+        ("strategic_planning", "financial_planning"),
+    ),
+    FollowupInput(
+        "timeline", "时间安排",
+        ("时间表", "时间安排", "里程碑", "上线时间", "周期", "进度", "个月内", "年内"),
+        ("implementation_planning",),
+    ),
+]
+
+
+@dataclass(frozen=True)
+class FollowupPlan:
+    """
+    追问的重新运行计划
+
+    Args:
+        inputs: 追问改变的咨询输入和专题（显示名称）
+        changed: 直接受影响的专家（注册键）
+        rerun: 需要重新运行的专家（直接受影响的专家及其下游，按依赖图顺序）
+    """
+
+    inputs: Tuple[str, ...]
+    changed: Tuple[str, ...]
+    rerun: Tuple[str, ...]
+
+
+def is_followup(message: str) -> bool:
+    """是否为对上一次方案的调整：需要明确的调整句式；介绍企业、产品或行业以及提到全面方案时视为新的咨询"""
+    return bool(
+        FOLLOWUP_CHANGE.search(message)
+        and not COMPANY_CONTEXT.search(message)
+        and not any(keyword in message for keyword in FULL_KEYWORDS)
+    )
+
+
+def affected_experts(message: str) -> Tuple[List[str], Set[str]]:
+    """
+    追问直接影响的专家：按咨询输入的关键词和各专题意图的关键词匹配
+
+    Returns:
+        Tuple[List[str], Set[str]]: (命中的输入和专题的显示名称, 直接受影响的专家注册键)
+    """
+    text = message.lower()
+    labels: List[str] = []
+    experts: Set[str] = set()
+    for item in FOLLOWUP_INPUTS:
+        if any(keyword in text for keyword in item.keywords):
+            labels.append(item.label)
+            experts.update(item.experts)
+    for intent in INTENTS.values():
+        if any(keyword in text for keyword in intent.keywords) and not experts.issuperset(intent.experts):
+            labels.append(intent.label)
+            experts.update(intent.experts)
+    return labels, experts
+
+
+def extend_intent(intent: IntentDecision, message: str) -> IntentDecision:
+    """单项咨询的追问提到其他专题（如法律合规咨询后追问财务预算）时，把该专题加入意图，其专家随之参与"""
+    if intent.is_full:
+        return intent
+    text = message.lower()
+    added = tuple(
+        name for name, item in INTENTS.items()
+        if name not in intent.intents and any(keyword in text for keyword in item.keywords)
+    )
+    return IntentDecision(intent.intents + added, intent.method) if added else intent
+
+
+def downstream(dependencies: Dict[str, List[str]], nodes: Sequence[str]) -> Set[str]:
+    """依赖图中给定节点及所有（直接或间接）依赖它们的节点"""
+    result = set(nodes)
+    changed = True
+    while changed:
+        changed = False
+        for node, deps in dependencies.items():
+            if node not in result and result.intersection(deps):
+                result.add(node)
+                changed = True
+    return result
+
+
+def plan_followup(message: str, dependencies: Dict[str, List[str]]) -> Optional[FollowupPlan]:
+    """
+    为追问制定重新运行计划
+
+    Args:
+        message: 用户的追问
+        dependencies: 本次咨询的专家依赖图（已限制在参与的专家上）
+
+    Returns:
+        Optional[FollowupPlan]: 重新运行计划；不是追问或无法确定受影响的专家时返回 None，按新的咨询处理
+    """
+    if not is_followup(message):
+        return None
+    labels, experts = affected_experts(message)
+    changed = [node for node in dependencies if node in experts]
+    if not changed:
+        return None
+    rerun = downstream(dependencies, changed)
+    return FollowupPlan(tuple(labels), tuple(changed), tuple(node for node in dependencies if node in rerun))
@@ -0,0 +1,242 @@
+"""
+需求意图识别
+咨询开始前判断需求属于全面出海咨询还是单项咨询（市场、战略、运营、营销、法律、财务），
+单项咨询只运行相关专家及其依赖（企业知识专家）、方案专家评估和资深顾问专家整合，并使用对应的建议书模板。
+只有需求明确是单项咨询时才收窄：包含明确的咨询短语（如“法律合规咨询”“财务规划”），
+或是不含企业和目标市场背景的简短提问；其余需求（如介绍了企业情况、顺带提到预算的出海需求）按全面咨询处理。
+无法判断时可选地由小模型分类，仍无法判断时按全面咨询处理
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+import re
+
+from autogen_core import CancellationToken
+from autogen_core.models import ChatCompletionClient, SystemMessage, UserMessage
+
+from swarm_scheduler import EXPERT_DEPENDENCIES
+
+
+FULL_INTENT = "full"
+
+# 评估和最终整合在任何意图下都参与
+ALWAYS_ACTIVE = ("solution_expert", "senior_advisor")
+
+# 需求中出现这些词时视为全面咨询
+FULL_KEYWORDS = ("全面", "完整", "整体", "全方位", "各方面", "出海方案", "一揽子")
+
+# 同时命中的单项意图超过该数量时按全面咨询处理
+MAX_NARROW_INTENTS = 2
+
+# 只按关键词收窄的简短提问的最大长度（字符数，不含空白和标点）
+MAX_SHORT_REQUEST_CHARS = 40
+
+# 企业背景：介绍了企业、产品或行业的需求通常期望完整方案
+COMPANY_CONTEXT = re.compile(r"(?:我们|我司|本公司|我们公司)(?:是|为|主营|生产|做|从事)|主营|的企业|的公司|我们的产品|制造业|工厂")
+
+# 目标市场背景：指明了具体国家或地区的需求
+MARKET_REGIONS = (
+    "东南亚", "欧洲", "北美", "美国", "日本", "韩国", "中东", "拉美", "非洲", "德国", "英国", "法国",
+    "印尼", "越南", "泰国", "马来西亚", "新加坡", "菲律宾", "印度", "澳大利亚", "加拿大", "墨西哥", "巴西", "俄罗斯",
+)
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+@dataclass(frozen=True)
+class Intent:
+    """
+    单项咨询意图：参与的领域专家（注册键）、明确的咨询短语、识别关键词和建议书模板；
+    咨询短语出现即可收窄，关键词只用于不含企业和目标市场背景的简短提问
+    """
+
+    name: str
+    label: str
+    experts: Tuple[str, ...]
+    phrases: Tuple[str, ...]
+    keywords: Tuple[str, ...]
+    template: str
+
+
+INTENTS: Dict[str, Intent] = {
+    intent.name: intent
+    for intent in [
+        Intent(
+            "market", "目标市场分析", ("market_analysis",),
+            ("市场分析", "市场调研", "市场机会和风险"),
+            ("目标市场", "海外市场", "市场机会", "市场规模", "竞争格局", "竞品", "消费者", "用户画像"),
+            "market",
+        ),
+        Intent(
+            "strategy", "出海战略规划", ("strategic_planning",),
+            ("战略规划", "出海战略", "战略咨询"),
+            ("战略", "进入模式", "进入策略", "长期规划", "路径选择"),
+            "strategy",
+        ),
+        Intent(
+            "operations", "运营规划", ("operations_planning",),
+            ("运营规划", "运营咨询", "运营体系"),
+            ("运营", "组织架构", "供应链", "物流", "仓储", "团队搭建"),
+            "operations",
+        ),
+        Intent(
+            "marketing", "营销推广", ("marketing_promotion",),
+            ("营销推广", "营销策略", "营销咨询", "品牌推广"),
+            ("营销", "推广", "广告投放", "获客", "社交媒体", "品牌建设"),
+            "marketing",
+        ),
+        Intent(
+            "legal", "法律合规", ("legal_compliance",),
+            ("法律合规", "合规咨询", "法律咨询", "法律法规", "合规要求"),
+            ("法律", "法规", "合规", "监管", "知识产权", "商标", "专利", "数据保护", "隐私", "gdpr"),
+            "legal",
+        ),
+        Intent(
+            "finance", "财务规划", ("financial_planning",),
+            ("财务规划", "财务咨询", "投资预算", "财务预算"),
+            ("财务", "融资", "汇率", "税务", "关税", "现金流", "投资回报", "roi"),
+            "finance",
+        ),
+    ]
+}
+
+
+@dataclass(frozen=True)
+class IntentDecision:
+    """
+    意图识别结果
+
+    Args:
+        intents: 命中的单项意图，空元组表示全面咨询
+        method: 识别方式：keyword（关键词）、model（小模型）或 default（无法判断，按全面咨询处理）
+    """
+
+    intents: Tuple[str, ...] = ()
+    method: str = "default"
+
+    @property
+    def is_full(self) -> bool:
+        return not self.intents
+
+    @property
+    def name(self) -> str:
+        return "+".join(self.intents) if self.intents else FULL_INTENT
+
+    @property
+    def label(self) -> str:
+        return "、".join(INTENTS[name].label for name in self.intents) if self.intents else "全面出海咨询"
+
+    @property
+    def template(self) -> str:
+        """建议书模板：全面咨询为 full，单个意图为其模板，多个意图为 focused（专项咨询）"""
+        if not self.intents:
+            return FULL_INTENT
+        if len(self.intents) == 1:
+            return INTENTS[self.intents[0]].template
+        return "focused"
+
+    def agent_keys(self) -> List[str]:
+        """参与的智能体（注册键）：命中意图的专家及其依赖，加上方案专家和资深顾问专家；全面咨询为全部智能体"""
+        selected: set = set(ALWAYS_ACTIVE)
+        if self.intents:
+            pending = [expert for name in self.intents for expert in INTENTS[name].experts]
+            while pending:
+                key = pending.pop()
+                if key not in selected:
+                    selected.add(key)
+                    pending.extend(EXPERT_DEPENDENCIES.get(key, []))
+        else:
+            selected.update(EXPERT_DEPENDENCIES)
+        extra = [key for key in ALWAYS_ACTIVE if key not in EXPERT_DEPENDENCIES]
+        return [key for key in EXPERT_DEPENDENCIES if key in selected] + extra
+
+    def to_dict(self) -> Dict[str, object]:
+        return {"intents": list(self.intents), "method": self.method}
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, object]]) -> "IntentDecision":
+        data = data or {}
+        intents = tuple(name for name in data.get("intents", ()) if name in INTENTS)  # type: ignore[union-attr]
+        return cls(intents, str(data.get("method", "default")))
+
+
+def _narrow(intents: Tuple[str, ...]) -> IntentDecision:
+    """命中的单项意图超过 MAX_NARROW_INTENTS 个时按全面咨询处理"""
+    return IntentDecision(() if len(intents) > MAX_NARROW_INTENTS else intents, "keyword")
+
+
+def classify_intent(user_message: str) -> Optional[IntentDecision]:
+    """
+    按咨询短语和关键词识别意图，只在需求明确是单项咨询时收窄：
+
+    - 命中全面咨询关键词时为全面咨询
+    - 包含单项咨询短语（如“法律合规”“财务规划”）时为这些单项意图
+    - 介绍了企业情况、指明了目标国家或地区或较长的需求按全面咨询处理
+    - 其余简短提问取命中关键词最多的单项意图（并列时全部保留）
+
+    命中的单项意图超过 MAX_NARROW_INTENTS 个时按全面咨询处理
+
+    Returns:
+        Optional[IntentDecision]: 识别结果，简短提问没有命中任何关键词时返回 None
+    """
+    text = user_message.lower()
+    if any(keyword in text for keyword in FULL_KEYWORDS):
+        return IntentDecision((), "keyword")
+    explicit = tuple(name for name, intent in INTENTS.items() if any(phrase in text for phrase in intent.phrases))
+    if explicit:
+        return _narrow(explicit)
+    if (
+        len(_NON_WORD.sub("", text)) > MAX_SHORT_REQUEST_CHARS
+        or COMPANY_CONTEXT.search(text)
+        or any(region in text for region in MARKET_REGIONS)
+    ):
+        return IntentDecision((), "keyword")
+    scores = {
+        name: sum(1 for keyword in intent.keywords if keyword in text)
+        for name, intent in INTENTS.items()
+    }
+    best = max(scores.values())
+    if best == 0:
+        return None
+    return _narrow(tuple(name for name, score in scores.items() if score == best))
+
+
+_INTENT_PROMPT = """你是企业出海咨询的需求分类器。请判断客户需求属于以下哪类，只输出类别名称（多个用英文逗号分隔），不要输出其他内容：
+{choices}
+- full：全面的出海方案，或无法归入以上单项的需求"""
+
+
+async def classify_intent_with_model(
+    client: ChatCompletionClient, user_message: str, cancellation_token: Optional[CancellationToken] = None
+) -> IntentDecision:
+    """
+    由小模型识别意图（关键词无法判断时使用），输出无法解析时按全面咨询处理
+
+    Args:
+        client: 模型客户端（通常按 swarm.routing.router 路由到更快更便宜的模型）
+        user_message: 客户需求
+        cancellation_token: 本次咨询的取消令牌
+    """
+    choices = "\n".join(f"- {intent.name}：{intent.label}" for intent in INTENTS.values())
+    result = await client.create(
+        [
+            SystemMessage(content=_INTENT_PROMPT.format(choices=choices)),
+            UserMessage(content=user_message, source="user"),
+        ],
+        cancellation_token=cancellation_token,
+    )
+    names = [name for name in re.split(r"[\s,，、]+", str(result.content).strip().lower()) if name]
+    if FULL_INTENT in names:
+        return IntentDecision((), "model")
+    intents = tuple(dict.fromkeys(name for name in names if name in INTENTS))
+    if not intents or len(intents) > MAX_NARROW_INTENTS:
+        return IntentDecision((), "model" if intents else "default")
+    return IntentDecision(intents, "model")
+
+
+def restrict_dependencies(
+    dependencies: Dict[str, List[str]], agent_keys: Sequence[str]
+) -> Dict[str, List[str]]:
+    """把依赖图限制在参与的节点上（去掉未参与节点及指向它们的依赖）"""
+    active = set(agent_keys)
+    return {node: [dep for dep in deps if dep in active] for node, deps in dependencies.items() if node in active}
@@ -0,0 +1,316 @@
+"""
+出海顾问团队的性能埋点
+记录每个智能体轮次（耗时、首 token 时间、提示/生成 token 数、重试次数）和每次发言者选择，
+汇总为进程级 Prometheus 文本格式指标；配置了追踪目录时，为每次咨询写出一份 JSONL 追踪文件
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from autogen_core.models import RequestUsage
+
+
+# 追踪目录中最多保留的追踪文件数，超出时删除最旧的文件
+DEFAULT_MAX_TRACE_FILES = 200
+
+# 直方图分桶（秒），覆盖从规则选择的毫秒级到长篇专家报告的分钟级
+DEFAULT_BUCKETS = (0.005, 0.05, 0.25, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Optional[Dict[str, str]]) -> LabelKey:
+    return tuple(sorted((labels or {}).items()))
+
+
+def _format_labels(key: LabelKey, extra: Iterable[Tuple[str, str]] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class MetricsRegistry:
+    """线程安全的进程级指标注册表，输出 Prometheus 文本格式"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, List[float]]] = {}
+
+    def inc(self, name: str, help_text: str, labels: Optional[Dict[str, str]] = None, value: float = 1) -> None:
+        """累加计数器"""
+        with self._lock:
+            self._help.setdefault(name, ("counter", help_text))
+            series = self._counters.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, help_text: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        """记录直方图观测值"""
+        with self._lock:
+            self._help.setdefault(name, ("histogram", help_text))
+            series = self._histograms.setdefault(name, {})
+            # 各分桶计数 + 总和 + 总数
+            state = series.setdefault(_label_key(labels), [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self) -> str:
+        """输出 Prometheus 文本格式"""
+        lines: List[str] = []
+        with self._lock:
+            for name, (metric_type, help_text) in sorted(self._help.items()):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                if metric_type == "counter":
+                    for key, value in self._counters.get(name, {}).items():
+                        lines.append(f"{name}{_format_labels(key)} {value}")
+                    continue
+                for key, state in self._histograms.get(name, {}).items():
+                    for i, bound in enumerate(self.buckets):
+                        lines.append(f"{name}_bucket{_format_labels(key, [('le', str(bound))])} {state[i]}")
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {state[-1]}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {state[-2]}")
+                    lines.append(f"{name}_count{_format_labels(key)} {state[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+_metrics_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> None:
+    """在后台线程启动 /metrics 端点（进程内只启动一次）；端点没有认证，默认只监听本机"""
+    global _metrics_server
+    if _metrics_server is not None:
+        return
+
+    class _MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = METRICS.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=_metrics_server.serve_forever, name="swarm-metrics", daemon=True).start()
+
+
+# 追踪文件在后台线程中依次写出，不阻塞事件循环
+_trace_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="swarm-trace")
+
+
+def _write_trace_file(path: str, records: List[Dict[str, Any]], max_files: Optional[int]) -> None:
+    """写出一次咨询的追踪文件，再按保留数量删除最旧的追踪文件"""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        if max_files is None:
+            return
+        # 文件名以咨询开始时间开头，按名称排序即为时间顺序
+        directory = os.path.dirname(path)
+        traces = sorted(
+            name for name in os.listdir(directory) if name.startswith("consultation_") and name.endswith(".jsonl")
+        )
+        for name in traces[:max(len(traces) - max_files, 0)]:
+            os.remove(os.path.join(directory, name))
+    except OSError as e:
+        print(f"警告：写出咨询追踪文件失败：{e}")
+
+
+class ConsultationTracer:
+    """
+    单次咨询的追踪器：记录智能体轮次和发言者选择，更新进程级指标；配置了追踪目录时，
+    事件先缓存在内存中，咨询结束后在后台线程写出 JSONL 追踪文件
+
+    Args:
+        mode: 执行模式（selector/parallel）
+        trace_dir: 追踪文件目录，None（默认）表示不写追踪文件
+        evaluator: 评估者智能体名称，其多次发言是对不同专家的评估，不计为重试
+        max_trace_files: 追踪目录中最多保留的追踪文件数，None 表示不限制
+    """
+
+    def __init__(
+        self,
+        mode: str,
+        trace_dir: Optional[str] = None,
+        evaluator: Optional[str] = None,
+        max_trace_files: Optional[int] = DEFAULT_MAX_TRACE_FILES,
+    ):
+        self.consultation_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        self.mode = mode
+        self.evaluator = evaluator
+        self.max_trace_files = max_trace_files
+        self.started_at = time.perf_counter()
+        self.trace_path: Optional[str] = None
+        self._records: Optional[List[Dict[str, Any]]] = None
+        if trace_dir:
+            self.trace_path = os.path.join(trace_dir, f"consultation_{self.consultation_id}.jsonl")
+            self._records = []
+        self._turn_started: Dict[str, float] = {}
+        self._first_token: Dict[str, float] = {}
+        self._call_counts: Dict[str, int] = {}
+        self._last_event_at = self.started_at
+        self.turns = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.speculation_hits = 0
+        self.speculation_misses = 0
+        self.speculation_wasted_tokens = 0
+        self.intent: Optional[str] = None
+        self._write({"event": "consultation_start", "mode": mode})
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        if self._records is None:
+            return
+        self._records.append({"consultation_id": self.consultation_id, "ts": time.time(), **record})
+
+    def selector_decision(self, speaker: str, mode: str) -> None:
+        """记录一次发言者选择，耗时为上一条消息结束到选出发言者的时间"""
+        now = time.perf_counter()
+        duration = now - self._last_event_at
+        METRICS.inc("swarm_selector_decisions_total", "Speaker selection decisions.", {"mode": mode})
+        METRICS.observe("swarm_selector_seconds", "Speaker selection latency.", duration, {"mode": mode})
+        self._write({"event": "selector_decision", "speaker": speaker, "mode": mode, "wall_time": round(duration, 4)})
+        self.turn_started(speaker, now)
+
+    def turn_started(self, agent: str, at: Optional[float] = None) -> None:
+        """记录智能体轮次开始"""
+        self._turn_started[agent] = at if at is not None else time.perf_counter()
+        self._first_token.pop(agent, None)
+
+    def token_received(self, agent: str) -> None:
+        """记录流式片段，首个片段的时间即为首 token 时间"""
+        if agent not in self._first_token:
+            self._first_token[agent] = time.perf_counter()
+
+    def turn_finished(self, agent: str, usage: Optional[RequestUsage]) -> None:
+        """记录智能体轮次结束"""
+        now = time.perf_counter()
+        started = self._turn_started.pop(agent, self._last_event_at)
+        first_token = self._first_token.pop(agent, None)
+        self._last_event_at = now
+        self._call_counts[agent] = self._call_counts.get(agent, 0) + 1
+        retries = 0 if agent == self.evaluator else self._call_counts[agent] - 1
+        wall_time = now - started
+        ttft = first_token - started if first_token is not None else None
+        prompt_tokens = usage.prompt_tokens if usage else 0
+        completion_tokens = usage.completion_tokens if usage else 0
+
+        self.turns += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        labels = {"agent": agent}
+        METRICS.inc("swarm_agent_turns_total", "Agent turns.", labels)
+        METRICS.observe("swarm_agent_turn_seconds", "Agent turn wall time.", wall_time, labels)
+        if ttft is not None:
+            METRICS.observe("swarm_agent_ttft_seconds", "Agent time to first token.", ttft, labels)
+        METRICS.inc("swarm_tokens_total", "Model tokens.", {**labels, "kind": "prompt"}, prompt_tokens)
+        METRICS.inc("swarm_tokens_total", "Model tokens.", {**labels, "kind": "completion"}, completion_tokens)
+        if retries:
+            METRICS.inc("swarm_agent_retries_total", "Agent re-runs after the first call.", labels)
+        self._write({
+            "event": "agent_turn",
+            "agent": agent,
+            "attempt": self._call_counts[agent],
+            "retries": retries,
+            "wall_time": round(wall_time, 4),
+            "ttft": round(ttft, 4) if ttft is not None else None,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+        })
+
+    def speculation(self, agent: str, hit: bool, wasted_tokens: int = 0) -> None:
+        """记录一次推测执行的结果：命中时直接采用推测结果，未命中时其 token 用量计为浪费"""
+        result = "hit" if hit else "miss"
+        if hit:
+            self.speculation_hits += 1
+        else:
+            self.speculation_misses += 1
+            self.speculation_wasted_tokens += wasted_tokens
+        METRICS.inc("swarm_speculations_total", "Speculative expert runs.", {"result": result})
+        if wasted_tokens:
+            METRICS.inc(
+                "swarm_speculation_wasted_tokens_total", "Tokens spent on discarded speculative runs.", value=wasted_tokens
+            )
+        self._write({"event": "speculation", "agent": agent, "result": result, "wasted_tokens": wasted_tokens})
+
+    def intent_decision(self, intent: str, method: str, agents: Sequence[str]) -> None:
+        """记录需求意图识别结果：意图（单项意图以 + 连接，全面咨询为 full）、识别方式和参与的智能体"""
+        self.intent = intent
+        METRICS.inc("swarm_intents_total", "Consultation intents.", {"intent": intent, "method": method})
+        self._write({"event": "intent", "intent": intent, "method": method, "agents": list(agents)})
+
+    def followup(self, changed: Sequence[str], rerun: Sequence[str]) -> None:
+        """记录一次追问调整：直接受影响的专家和需重新运行的专家（含下游专家）"""
+        METRICS.inc("swarm_followups_total", "Follow-up turns that re-run only affected experts.")
+        METRICS.inc("swarm_followup_reruns_total", "Experts re-run by follow-up turns.", value=len(rerun))
+        self._write({"event": "followup", "changed": list(changed), "rerun": list(rerun)})
+
+    def cache_hit(self, similarity: float) -> None:
+        """记录咨询缓存命中（命中次数由咨询缓存计入指标）及与缓存需求的相似度"""
+        self._write({"event": "cache_hit", "similarity": round(similarity, 4)})
+
+    def resumed(self, turns: int) -> None:
+        """记录从检查点继续的咨询及检查点中已完成的发言轮数"""
+        METRICS.inc("swarm_checkpoint_resumes_total", "Consultations resumed from a checkpoint.")
+        self._write({"event": "checkpoint_resume", "turns": turns})
+
+    def cancelled(self, reason: str) -> None:
+        """记录咨询被取消（用户停止、发送新消息或离开会话）"""
+        METRICS.inc("swarm_consultations_cancelled_total", "Consultations cancelled mid-run.", {"reason": reason})
+        self._write({"event": "cancelled", "reason": reason, "turns": self.turns})
+
+    def budget_stop(self, reason: str) -> None:
+        """记录咨询因预算耗尽（调用次数、token 用量或截止时间）提前结束"""
+        METRICS.inc("swarm_budget_stops_total", "Consultations stopped early by the budget.", {"reason": reason})
+        self._write({"event": "budget_stop", "reason": reason, "turns": self.turns})
+
+    def finish(self, status: str = "completed") -> Dict[str, Any]:
+        """结束追踪，写出汇总记录并返回"""
+        duration = time.perf_counter() - self.started_at
+        METRICS.inc("swarm_consultations_total", "Consultations.", {"mode": self.mode, "status": status})
+        METRICS.observe("swarm_consultation_seconds", "Consultation wall time.", duration, {"mode": self.mode})
+        summary = {
+            "event": "consultation_end",
+            "status": status,
+            "wall_time": round(duration, 4),
+            "turns": self.turns,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+        }
+        if self.intent is not None:
+            summary["intent"] = self.intent
+        if self.speculation_hits or self.speculation_misses:
+            summary["speculation_hits"] = self.speculation_hits
+            summary["speculation_misses"] = self.speculation_misses
+            summary["speculation_wasted_tokens"] = self.speculation_wasted_tokens
+        self._write(summary)
+        if self._records is not None and self.trace_path is not None:
+            _trace_writer.submit(_write_trace_file, self.trace_path, self._records, self.max_trace_files)
+            self._records = None
+        return summary
@@ -0,0 +1,131 @@
+"""
+出海顾问团队的依赖图调度器
+按照专家之间声明的依赖关系调度执行：依赖全部完成的专家立即启动，互不依赖的专家并发运行
+"""
+
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import asyncio
+
+
+# 专家依赖关系（键为 OverseasAdvisorySwarm.agents 中的智能体键名）
+# 企业知识专家最先运行；各领域专家只依赖企业现状，可并发执行；
+# 实施计划专家汇总各领域方案，资深顾问专家最后进行整体整合
+EXPERT_DEPENDENCIES: Dict[str, List[str]] = {
+    "enterprise_knowledge": [],
+    "market_analysis": ["enterprise_knowledge"],
+    "strategic_planning": ["enterprise_knowledge"],
+    "operations_planning": ["enterprise_knowledge"],
+    "marketing_promotion": ["enterprise_knowledge"],
+    "legal_compliance": ["enterprise_knowledge"],
+    "financial_planning": ["enterprise_knowledge"],
+    "implementation_planning": [
+        "market_analysis",
+        "strategic_planning",
+        "operations_planning",
+        "marketing_promotion",
+        "legal_compliance",
+        "financial_planning",
+    ],
+    "senior_advisor": [
+        "enterprise_knowledge",
+        "market_analysis",
+        "strategic_planning",
+        "operations_planning",
+        "marketing_promotion",
+        "legal_compliance",
+        "financial_planning",
+        "implementation_planning",
+    ],
+}
+
+
+def validate_dependency_graph(dependencies: Dict[str, List[str]]) -> List[str]:
+    """
+    校验依赖图并返回一个拓扑顺序
+
+    Args:
+        dependencies: 节点到其依赖节点列表的映射
+
+    Returns:
+        List[str]: 拓扑排序后的节点列表
+
+    Raises:
+        ValueError: 存在未声明的依赖节点或循环依赖
+    """
+    for node, deps in dependencies.items():
+        for dep in deps:
+            if dep not in dependencies:
+                raise ValueError(f"节点 {node} 依赖了未声明的节点 {dep}")
+
+    order: List[str] = []
+    remaining = {node: set(deps) for node, deps in dependencies.items()}
+    while remaining:
+        ready = [node for node, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"依赖图存在循环依赖：{sorted(remaining)}")
+        for node in ready:
+            order.append(node)
+            del remaining[node]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return order
+
+
+async def run_dependency_graph(
+    dependencies: Dict[str, List[str]],
+    run_node: Callable[[str, Dict[str, Any]], Awaitable[Any]],
+    on_node_done: Optional[Callable[[str, Any], Awaitable[None]]] = None,
+    max_concurrency: Optional[int] = None,
+    completed: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    按依赖图并发执行各节点
+
+    Args:
+        dependencies: 节点到其依赖节点列表的映射
+        run_node: 执行单个节点的协程函数，参数为节点名和其依赖节点的结果
+        on_node_done: 节点完成后的回调，按完成先后顺序调用
+        max_concurrency: 同时运行的最大节点数，None 表示不限制
+        completed: 已完成节点的结果（如从检查点恢复），这些节点不再执行，也不触发 on_node_done
+
+    Returns:
+        Dict[str, Any]: 各节点的执行结果
+    """
+    validate_dependency_graph(dependencies)
+
+    results: Dict[str, Any] = dict(completed or {})
+    pending = {node: deps for node, deps in dependencies.items() if node not in results}
+    running: Dict[asyncio.Task, str] = {}
+    semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+    async def _run(node: str) -> Any:
+        upstream = {dep: results[dep] for dep in dependencies[node]}
+        if semaphore is None:
+            return await run_node(node, upstream)
+        async with semaphore:
+            return await run_node(node, upstream)
+
+    def _start_ready_nodes() -> None:
+        for node, deps in list(pending.items()):
+            if all(dep in results for dep in deps):
+                del pending[node]
+                running[asyncio.create_task(_run(node))] = node
+
+    try:
+        _start_ready_nodes()
+        while running:
+            done, _ = await asyncio.wait(running.keys(), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                node = running.pop(task)
+                results[node] = task.result()
+                if on_node_done:
+                    await on_node_done(node, results[node])
+            _start_ready_nodes()
+    finally:
+        # 任一节点失败或被取消时，停止其余仍在运行的节点
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running.keys(), return_exceptions=True)
+
+    return results
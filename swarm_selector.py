@@ -0,0 +1,125 @@
+"""
+出海顾问团队的规则选择器
+按声明的专家顺序、各智能体调用次数和方案专家的评分确定下一位发言者，
+无法确定时返回 None，由 SelectorGroupChat 回退到大模型选择
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from autogen_agentchat.messages import BaseAgentEvent, BaseChatMessage
+
+from swarm_evaluation import evaluation_score
+
+
+# 领域专家的发言顺序（与咨询任务描述中的工作流程一致）
+EXPERT_ORDER: List[str] = [
+    "enterprise_knowledge_expert",
+    "market_analysis_expert",
+    "strategic_planning_expert",
+    "operations_planning_expert",
+    "marketing_promotion_expert",
+    "legal_compliance_expert",
+    "financial_planning_expert",
+    "implementation_planning_expert",
+]
+
+EVALUATOR_NAME = "solution_expert"
+FINAL_SPEAKER_NAME = "senior_advisory_expert"
+
+
+class RuleBasedSelector:
+    """
+    基于固定工作流程的发言者选择函数
+
+    - 领域专家发言后由方案专家评估
+    - 评分低于及格线且未达调用上限的专家重新输出，否则进入下一位专家
+    - 所有专家通过后由资深顾问专家进行最终整合
+    - 评分无法解析等无法判断的情况返回 None，回退到大模型选择
+
+    评分优先取方案专家输出的结构化评分（见 swarm_evaluation.py）。fixed_order 为 False 时只确定性地处理评估环节
+    （专家发言后评估、不及格且未达上限时重新输出），下一位专家交由大模型选择
+    """
+
+    def __init__(
+        self,
+        expert_order: Sequence[str] = EXPERT_ORDER,
+        evaluator_name: str = EVALUATOR_NAME,
+        final_speaker_name: str = FINAL_SPEAKER_NAME,
+        max_calls_per_agent: int = 3,
+        pass_score: float = 7.0,
+        fixed_order: bool = True,
+    ):
+        self.expert_order = list(expert_order)
+        self.evaluator_name = evaluator_name
+        self.final_speaker_name = final_speaker_name
+        self.max_calls_per_agent = max_calls_per_agent
+        self.pass_score = pass_score
+        self.fixed_order = fixed_order
+        # 最近一次的选择结果，None 表示回退到大模型选择
+        self.last_result: Optional[str] = None
+
+    def __call__(self, messages: Sequence[BaseAgentEvent | BaseChatMessage]) -> Optional[str]:
+        self.last_result = self._select(messages)
+        return self.last_result
+
+    def _replay(self, chat_messages: Sequence[BaseChatMessage]) -> Tuple[Dict[str, int], set, Optional[str], Optional[float]]:
+        """回放对话历史，得到各专家的调用次数、已通过的专家、待评估的专家和最近一次评分"""
+        call_counts: Dict[str, int] = {}
+        accepted: set = set()
+        pending_expert: Optional[str] = None
+        last_score: Optional[float] = None
+        for message in chat_messages:
+            source = message.source
+            call_counts[source] = call_counts.get(source, 0) + 1
+            if source in self.expert_order:
+                pending_expert = source
+                last_score = None
+            elif source == self.evaluator_name and pending_expert is not None:
+                last_score = evaluation_score(message.to_text())
+                if last_score is not None and (
+                    last_score >= self.pass_score or call_counts[pending_expert] >= self.max_calls_per_agent
+                ):
+                    accepted.add(pending_expert)
+                    pending_expert = None
+        return call_counts, accepted, pending_expert, last_score
+
+    def _next_in_order(self, call_counts: Dict[str, int], accepted: set) -> str:
+        for expert in self.expert_order:
+            if expert not in accepted and call_counts.get(expert, 0) < self.max_calls_per_agent:
+                return expert
+        return self.final_speaker_name
+
+    def _select(self, messages: Sequence[BaseAgentEvent | BaseChatMessage]) -> Optional[str]:
+        chat_messages = [message for message in messages if isinstance(message, BaseChatMessage)]
+        if not chat_messages:
+            return None
+
+        call_counts, accepted, pending_expert, last_score = self._replay(chat_messages)
+
+        last_source = chat_messages[-1].source
+        if last_source in self.expert_order:
+            return self.evaluator_name
+        if last_source == self.final_speaker_name:
+            # 资深顾问专家未给出结束标记，交由大模型判断
+            return None
+        if last_source == self.evaluator_name and pending_expert is not None:
+            if last_score is None:
+                return None
+            return pending_expert
+
+        if not self.fixed_order:
+            return None
+        return self._next_in_order(call_counts, accepted)
+
+    def predict_after_evaluation(self, messages: Sequence[BaseAgentEvent | BaseChatMessage]) -> Optional[str]:
+        """
+        领域专家刚发言时，假设其通过评估，预测评估之后的下一位领域专家（用于推测执行）；
+        非固定顺序、最后一条不是领域专家的发言或下一位是资深顾问专家时返回 None
+        """
+        chat_messages = [message for message in messages if isinstance(message, BaseChatMessage)]
+        if not self.fixed_order or not chat_messages or chat_messages[-1].source not in self.expert_order:
+            return None
+        call_counts, accepted, pending_expert, _ = self._replay(chat_messages)
+        accepted.add(pending_expert)
+        next_expert = self._next_in_order(call_counts, accepted)
+        return next_expert if next_expert in self.expert_order else None
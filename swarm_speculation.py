@@ -0,0 +1,232 @@
+"""
+推测执行
+选择器团队的固定流程中，领域专家发言后由方案专家评估，多数情况下评估通过、接着由下一位专家发言，两次模型调用严格先后进行。
+推测执行在方案专家评估的同时，用影子智能体（与团队中的专家配置和状态相同）提前运行下一位专家：
+评估通过、选中该专家时直接提交推测结果（回放其流式片段并同步智能体状态），要求重新输出或选中其他发言者时取消并丢弃，
+隐藏常见路径上的评估延迟。推测运行看不到正在进行的那次评估，评估消息在提交后补入该专家的上下文
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional, Sequence, Union
+import asyncio
+
+from autogen_agentchat.agents import AssistantAgent, BaseChatAgent
+from autogen_agentchat.base import Response
+from autogen_agentchat.messages import BaseAgentEvent, BaseChatMessage, ModelClientStreamingChunkEvent
+from autogen_core import CancellationToken
+
+from swarm_context import estimate_tokens
+
+
+# 推测结果确定时的回调：(专家名称, 是否命中, 浪费的 token 数)
+SpeculationCallback = Callable[[str, bool, int], None]
+
+# 推测运行结束的标记
+_DONE = object()
+
+
+@dataclass
+class Speculation:
+    """一次推测运行：输入消息、影子智能体产生的事件队列和取消令牌"""
+
+    expert_name: str
+    messages: List[BaseChatMessage]
+    token: CancellationToken = field(default_factory=CancellationToken)
+    events: asyncio.Queue = field(default_factory=asyncio.Queue)
+    task: Optional[asyncio.Task] = None
+    response: Optional[Response] = None
+    streamed: str = ""
+    resolved: bool = False
+
+    def wasted_tokens(self) -> int:
+        """丢弃时浪费的 token 数：运行完成时取实际用量，中途取消时按已输出的片段估算"""
+        if self.response is not None and self.response.chat_message.models_usage is not None:
+            usage = self.response.chat_message.models_usage
+            return usage.prompt_tokens + usage.completion_tokens
+        return estimate_tokens(self.streamed) if self.streamed else 0
+
+
+class Speculator:
+    """
+    推测执行的协调者：同一时间最多一个推测运行
+
+    Args:
+        experts: 团队中的专家（智能体名称 -> 智能体）
+        shadow_factory: 按智能体名称创建影子智能体，配置与团队中的专家相同
+        on_result: 推测结果确定（提交或丢弃）时调用
+    """
+
+    def __init__(
+        self,
+        experts: Dict[str, AssistantAgent],
+        shadow_factory: Callable[[str], AssistantAgent],
+        on_result: Optional[SpeculationCallback] = None,
+    ):
+        self.experts = experts
+        self.shadow_factory = shadow_factory
+        self.on_result = on_result
+        self.pending: Optional[Speculation] = None
+        self._shadows: Dict[str, AssistantAgent] = {}
+        self._last_task: Optional[asyncio.Task] = None
+
+    def start(self, expert_name: str, thread: Sequence[BaseAgentEvent | BaseChatMessage]) -> None:
+        """
+        开始推测运行下一位专家，输入为该专家上次发言之后的对话（即轮到它时团队转发给它的消息）
+
+        Args:
+            expert_name: 推测的下一位发言者
+            thread: 当前的完整对话
+        """
+        self.cancel()
+        chat_messages = [message for message in thread if isinstance(message, BaseChatMessage)]
+        spoken = [i for i, message in enumerate(chat_messages) if message.source == expert_name]
+        messages = chat_messages[spoken[-1] + 1:] if spoken else chat_messages
+        speculation = Speculation(expert_name, messages)
+        speculation.task = asyncio.create_task(self._run(speculation, self._last_task))
+        speculation.task.add_done_callback(lambda _: self._finish(speculation))
+        self._last_task = speculation.task
+        self.pending = speculation
+
+    async def _run(self, speculation: Speculation, previous: Optional[asyncio.Task]) -> None:
+        # 上一次推测运行可能仍在取消中，等待其结束后再复用影子智能体
+        if previous is not None and not previous.done():
+            await asyncio.gather(previous, return_exceptions=True)
+        name = speculation.expert_name
+        try:
+            shadow = self._shadows.get(name)
+            if shadow is None:
+                shadow = self._shadows[name] = self.shadow_factory(name)
+            await shadow.load_state(await self.experts[name].save_state())
+            async for event in shadow.on_messages_stream(speculation.messages, speculation.token):
+                if isinstance(event, Response):
+                    speculation.response = event
+                elif isinstance(event, ModelClientStreamingChunkEvent):
+                    speculation.streamed += event.content
+                speculation.events.put_nowait(event)
+        except BaseException as e:
+            speculation.events.put_nowait(e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return
+        speculation.events.put_nowait(_DONE)
+
+    def _finish(self, speculation: Speculation) -> None:
+        """推测运行结束时，已被取消（不再等待提交）的推测计为未命中"""
+        if not speculation.resolved and speculation is not self.pending:
+            self._resolve(speculation, hit=False)
+
+    def _resolve(self, speculation: Speculation, hit: bool) -> None:
+        speculation.resolved = True
+        if self.pending is speculation:
+            self.pending = None
+        if self.on_result is not None:
+            self.on_result(speculation.expert_name, hit, 0 if hit else speculation.wasted_tokens())
+
+    def select(self, speaker: Optional[str]) -> None:
+        """选出下一位发言者后调用：选中的不是推测的专家时取消推测（None 表示交由大模型选择，暂不判断）"""
+        if self.pending is not None and speaker is not None and speaker != self.pending.expert_name:
+            self.cancel()
+
+    def cancel(self) -> None:
+        """取消进行中的推测运行，其用量在运行结束后计为浪费"""
+        speculation, self.pending = self.pending, None
+        if speculation is None:
+            return
+        speculation.token.cancel()
+        if speculation.task is not None:
+            if speculation.task.done():
+                self._finish(speculation)
+            else:
+                speculation.task.cancel()
+
+    async def commit(self, expert_name: str) -> None:
+        """提交推测：把影子智能体的状态（含推测运行的输入和输出）同步到团队中的专家"""
+        await self.experts[expert_name].load_state(await self._shadows[expert_name].save_state())
+
+    async def discard(self) -> None:
+        """取消进行中的推测运行并等待其结束"""
+        self.cancel()
+        if self._last_task is not None and not self._last_task.done():
+            await asyncio.gather(self._last_task, return_exceptions=True)
+
+    def take(self, expert_name: str, messages: Sequence[BaseChatMessage], allowed_sources: Sequence[str]) -> Optional[Speculation]:
+        """
+        轮到专家发言时取出可提交的推测：推测的输入须是本轮消息的前缀，且之后只有允许的来源（方案专家的评估）；
+        不符合时丢弃推测，由专家正常发言
+
+        Returns:
+            Optional[Speculation]: 可提交的推测，没有时返回 None
+        """
+        speculation = self.pending
+        if speculation is None or speculation.expert_name != expert_name:
+            return None
+        failed = speculation.task is not None and speculation.task.done() and speculation.response is None
+        prefix = [message.id for message in messages[: len(speculation.messages)]]
+        rest = messages[len(speculation.messages):]
+        if failed or prefix != [message.id for message in speculation.messages] or any(
+            message.source not in allowed_sources for message in rest
+        ):
+            self.cancel()
+            return None
+        self._resolve(speculation, hit=True)
+        return speculation
+
+
+class SpeculativeExpert(BaseChatAgent):
+    """
+    团队中的领域专家包装：有可提交的推测结果时回放推测运行的事件并同步智能体状态，否则由被包装的专家正常发言
+
+    Args:
+        expert: 被包装的专家
+        speculator: 推测执行的协调者
+        allowed_sources: 推测运行之后允许出现的消息来源（方案专家），这些消息在提交后补入专家的上下文
+    """
+
+    def __init__(self, expert: AssistantAgent, speculator: Speculator, allowed_sources: Sequence[str]):
+        super().__init__(expert.name, expert.description)
+        self.expert = expert
+        self.speculator = speculator
+        self.allowed_sources = list(allowed_sources)
+
+    @property
+    def produced_message_types(self) -> Sequence[type[BaseChatMessage]]:
+        return self.expert.produced_message_types
+
+    async def on_messages(self, messages: Sequence[BaseChatMessage], cancellation_token: CancellationToken) -> Response:
+        async for message in self.on_messages_stream(messages, cancellation_token):
+            if isinstance(message, Response):
+                return message
+        raise AssertionError("The stream should have returned the final result.")
+
+    async def on_messages_stream(
+        self, messages: Sequence[BaseChatMessage], cancellation_token: CancellationToken
+    ) -> AsyncGenerator[Union[BaseAgentEvent, BaseChatMessage, Response], None]:
+        speculation = self.speculator.take(self.name, messages, self.allowed_sources)
+        if speculation is None:
+            async for event in self.expert.on_messages_stream(messages, cancellation_token):
+                yield event
+            return
+
+        # 团队取消时一并取消推测运行
+        cancellation_token.add_callback(speculation.token.cancel)
+        while True:
+            event = await speculation.events.get()
+            if event is _DONE:
+                break
+            if isinstance(event, BaseException):
+                raise event
+            yield event
+        # 提交：专家状态与影子智能体一致，再补入推测运行没有看到的评估消息
+        await self.speculator.commit(self.name)
+        for message in messages[len(speculation.messages):]:
+            await self.expert.model_context.add_message(message.to_model_message())
+
+    async def on_reset(self, cancellation_token: CancellationToken) -> None:
+        await self.speculator.discard()
+        await self.expert.on_reset(cancellation_token)
+
+    async def save_state(self) -> Dict[str, Any]:
+        return await self.expert.save_state()
+
+    async def load_state(self, state: Dict[str, Any]) -> None:
+        await self.expert.load_state(state)